@@ -1,14 +1,33 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import base64
 import json
 import os
-from io import BytesIO
+from io import BytesIO, StringIO
 import hashlib
 import time
 import csv
+import sqlite3
+import threading
+import functools
+import queue
+import copy
+import shutil
+import gzip
+import difflib
+import heapq
+import bisect
+import re
+from concurrent.futures import Future
+from contextlib import contextmanager
+from collections.abc import MutableMapping, Sequence
+
+try:
+    import fcntl
+except ImportError:  # Windows: lock files are skipped, in-process locks still apply
+    fcntl = None
 
 # Set page configuration
 st.set_page_config(
@@ -309,12 +328,3709 @@ class UserManager:
             return True, f"User {username} approved successfully"
         return False, "User not found"
 
+# SQLite cannot bind NumPy integers (e.g. from np.random.randint) without adapters
+sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.int32, int)
+
+class CatalogSnapshot:
+    """Optional memory-mapped binary snapshot of the product catalog
+    
+    Product names are stored once in a string table; prices and the
+    category and supplier codes are typed NumPy arrays, and store assortments
+    are a packed store-by-product bitmap. The arrays are memory-mapped, so a
+    cold start skips JSON parsing and worker processes share the OS page cache.
+    A collection is only read from the snapshot while the JSON file it was
+    built from is unchanged.
+    """
+    
+    FORMAT = 2
+    COLLECTIONS = ('store_data', 'product_prices', 'product_barcodes',
+                   'product_suppliers', 'product_categories')
+    
+    def __init__(self, directory='catalog.snapshot'):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.cache = None
+    
+    @staticmethod
+    def normalize_version(version):
+        """Return a version token in the form it takes after a JSON round-trip"""
+        return list(version) if version is not None else None
+    
+    @staticmethod
+    def pack_strings(values):
+        """Join strings into a newline-separated table, or None if one can't be stored"""
+        if not all(isinstance(value, str) and '\n' not in value for value in values):
+            return None
+        return '\n'.join(values).encode('utf-8')
+    
+    @staticmethod
+    def unpack_strings(payload, count):
+        """Split a string table written by pack_strings"""
+        return payload.decode('utf-8').split('\n') if count else []
+    
+    @staticmethod
+    def encode_codes(mapping, index, count):
+        """Encode string values as int32 codes into a sorted value table (-1 when unset)"""
+        if not all(isinstance(value, str) for value in mapping.values()):
+            return None, None
+        table = sorted(set(mapping.values()))
+        lookup = {value: code for code, value in enumerate(table)}
+        codes = np.full(count, -1, dtype=np.int32)
+        for name, value in mapping.items():
+            codes[index[name]] = lookup[value]
+        return codes, table
+    
+    def is_current(self, versions):
+        """Check whether the snapshot on disk was built from the given source versions"""
+        try:
+            with open(os.path.join(self.directory, 'manifest.json'), 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return (manifest.get('format') == self.FORMAT and
+                manifest.get('versions') == {name: self.normalize_version(version)
+                                             for name, version in versions.items()})
+    
+    def build(self, collections, versions):
+        """Write a snapshot of the catalog collections; returns False if they can't be packed"""
+        store_data = collections['store_data']
+        names = sorted(set().union(*store_data.values(),
+                                   *(collections[name] for name in self.COLLECTIONS[1:])))
+        name_table = self.pack_strings(names)
+        if name_table is None:
+            return False
+        index = {name: i for i, name in enumerate(names)}
+        count = len(names)
+        
+        prices = np.full(count, np.nan)
+        if not all(isinstance(price, (int, float)) and not isinstance(price, bool)
+                   for price in collections['product_prices'].values()):
+            return False
+        for name, price in collections['product_prices'].items():
+            prices[index[name]] = price
+        
+        barcodes = [''] * count
+        has_barcode = np.zeros(count, dtype=bool)
+        for name, barcode in collections['product_barcodes'].items():
+            barcodes[index[name]] = barcode
+            has_barcode[index[name]] = True
+        barcode_table = self.pack_strings(barcodes)
+        
+        categories, category_table = self.encode_codes(collections['product_categories'], index, count)
+        suppliers, supplier_table = self.encode_codes(collections['product_suppliers'], index, count)
+        if barcode_table is None or categories is None or suppliers is None:
+            return False
+        
+        stores = list(store_data)
+        membership = np.zeros((len(stores), count), dtype=bool)
+        for row, store in enumerate(stores):
+            membership[row, [index[name] for name in store_data[store]]] = True
+        
+        arrays = {
+            'prices': prices,
+            'has_barcode': has_barcode,
+            'categories': categories,
+            'suppliers': suppliers,
+            'membership': np.packbits(membership, axis=1),
+        }
+        manifest = {
+            'format': self.FORMAT,
+            'versions': {name: self.normalize_version(version) for name, version in versions.items()},
+            'count': count,
+            'stores': stores,
+            'categories': category_table,
+            'suppliers': supplier_table,
+        }
+        
+        # Build beside the live snapshot and swap it in; readers fall back to JSON meanwhile
+        temp_dir = f"{self.directory}.tmp-{os.getpid()}"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        with open(os.path.join(temp_dir, 'names.txt'), 'wb') as f:
+            f.write(name_table)
+        with open(os.path.join(temp_dir, 'barcodes.txt'), 'wb') as f:
+            f.write(barcode_table)
+        for key, array in arrays.items():
+            np.save(os.path.join(temp_dir, f"{key}.npy"), array)
+        with open(os.path.join(temp_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        old_dir = f"{self.directory}.old-{os.getpid()}"
+        if os.path.exists(self.directory):
+            os.replace(self.directory, old_dir)
+        os.replace(temp_dir, self.directory)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        with self.lock:
+            self.cache = None
+        return True
+    
+    def open(self):
+        """Memory-map the snapshot files and decode the string tables"""
+        with open(os.path.join(self.directory, 'manifest.json'), 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != self.FORMAT:
+            return None
+        count = manifest['count']
+        with open(os.path.join(self.directory, 'names.txt'), 'rb') as f:
+            names = np.array(self.unpack_strings(f.read(), count), dtype=object)
+        with open(os.path.join(self.directory, 'barcodes.txt'), 'rb') as f:
+            barcodes = np.array(self.unpack_strings(f.read(), count), dtype=object)
+        arrays = {key: np.load(os.path.join(self.directory, f"{key}.npy"), mmap_mode='r')
+                  for key in ('prices', 'has_barcode', 'categories', 'suppliers', 'membership')}
+        return manifest, names, barcodes, arrays
+    
+    def load(self, name, version):
+        """Return one collection from the snapshot, or None if it is missing or stale"""
+        version = self.normalize_version(version)
+        for attempt in range(2):
+            with self.lock:
+                if self.cache is None:
+                    try:
+                        self.cache = self.open()
+                    except (OSError, ValueError, KeyError):
+                        self.cache = None
+                cache = self.cache
+                if cache is not None and cache[0]['versions'].get(name) == version:
+                    break
+                # Another process may have rebuilt the snapshot since we mapped it
+                self.cache = None
+        else:
+            return None
+        manifest, names, barcodes, arrays = cache
+        count = manifest['count']
+        
+        if name == 'store_data':
+            return {store: names[np.unpackbits(arrays['membership'][row], count=count).astype(bool)].tolist()
+                    for row, store in enumerate(manifest['stores'])}
+        if name == 'product_prices':
+            mask = ~np.isnan(arrays['prices'])
+            return dict(zip(names[mask].tolist(), arrays['prices'][mask].tolist()))
+        if name == 'product_barcodes':
+            mask = np.asarray(arrays['has_barcode'])
+            return dict(zip(names[mask].tolist(), barcodes[mask].tolist()))
+        key, table = {'product_categories': ('categories', 'categories'),
+                      'product_suppliers': ('suppliers', 'suppliers')}[name]
+        codes = np.asarray(arrays[key])
+        mask = codes >= 0
+        values = np.array(manifest[table] or [None], dtype=object)[codes[mask]]
+        return dict(zip(names[mask].tolist(), values.tolist()))
+
+class JsonStorage:
+    """Stores each collection as a JSON file in the working directory"""
+    
+    # Every save rewrites the whole file, so writes need the full collection
+    partial_writes = False
+    
+    def __init__(self, directory='.', catalog=None):
+        self.directory = directory
+        self.catalog = catalog
+    
+    def path(self, name):
+        """Return the file path backing a collection"""
+        return os.path.join(self.directory, DataManager.collection_file(name))
+    
+    def version(self, name):
+        """Return a token that changes whenever a collection's file is rewritten"""
+        try:
+            stat = os.stat(self.path(name))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def load(self, name):
+        """Load a collection, or None if it has never been saved"""
+        path = self.path(name)
+        if not os.path.exists(path):
+            return None
+        if self.catalog is not None and name in self.catalog.COLLECTIONS:
+            data = self.catalog.load(name, self.version(name))
+            if data is not None:
+                return data
+        with open(path, 'r') as f:
+            return json.load(f)
+    
+    def refresh_catalog(self):
+        """Rebuild the binary catalog snapshot if the JSON files changed since it was built"""
+        if self.catalog is None:
+            return
+        names = self.catalog.COLLECTIONS
+        with self.catalog.build_lock, interprocess_lock(f"{self.catalog.directory}.lock"):
+            versions = {name: self.version(name) for name in names}
+            if None in versions.values() or self.catalog.is_current(versions):
+                return
+            collections = {}
+            for name in names:
+                with open(self.path(name), 'r') as f:
+                    collections[name] = json.load(f)
+            # Skip the build if a file was rewritten while we were reading
+            if versions == {name: self.version(name) for name in names}:
+                self.catalog.build(collections, versions)
+    
+    def save(self, name, data, keys=None):
+        """Rewrite a collection's file and return the number of bytes written
+        
+        The file is synced and replaced atomically so concurrent readers never
+        see a partial write and a crash leaves either the old or the new file.
+        """
+        return write_atomic(self.path(name), self.encode(data))
+    
+    @staticmethod
+    def encode(data):
+        """Serialize a collection to the contents of its file"""
+        return json.dumps(data).encode('utf-8')
+    
+    def save_batch(self, writes):
+        """Write each collection once using the latest contents submitted for it
+        
+        Writes carry collections already serialized with encode(), as WriteQueue
+        submits them. Returns (bytes written, (version before, version after))
+        per write.
+        """
+        last = {name: i for i, (name, payload, keys) in enumerate(writes)}
+        versions = {}
+        for name, i in last.items():
+            before = self.version(name)
+            written = write_atomic(self.path(name), writes[i][1])
+            versions[name] = written, (before, self.version(name))
+        return [(versions[name][0] if last[name] == i else 0, versions[name][1])
+                for i, (name, payload, keys) in enumerate(writes)]
+    
+    def clear(self, names):
+        """Delete the files backing the given collections"""
+        for name in names:
+            if os.path.exists(self.path(name)):
+                os.remove(self.path(name))
+
+@contextmanager
+def interprocess_lock(path, blocking=True):
+    """Hold an exclusive advisory lock file shared with other app processes
+    
+    Yields False instead of waiting when blocking is off and the lock is taken.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(path, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def write_atomic(path, payload):
+    """Replace a file with payload via a synced temp file; returns the number of bytes written"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return len(payload)
+
+class JournaledStorage:
+    """Appends changes to a JSON-lines log and folds them into snapshots in the background
+    
+    A save costs O(size of the change) instead of a full snapshot rewrite.
+    Loads replay the log over the last snapshot, so changes survive a crash.
+    Log records are {"c": collection, "k": key, "v": value} for a key set,
+    {"c", "k"} for a key delete, {"c", "v"} for a whole-collection replace and
+    {"c"} alone for a reset to defaults.
+    
+    Several app processes may share one log: appends and log rotation are
+    serialized with lock files, and each process tails records written by
+    the others.
+    """
+    
+    COMPACT_BYTES = 1_000_000  # fold early once the log grows past this size
+    COMPACT_INTERVAL = 60  # seconds between periodic compactions
+    partial_writes = True
+    
+    def __init__(self, base, default, path='mutations.log', background=True):
+        self.base = base
+        self.default = default
+        self.path = path
+        self.folding_path = f"{path}.compacting"
+        self.lock = threading.Lock()
+        # Records from an interrupted compaction come before the live log
+        self.folding = []
+        self.records = []
+        self.log_offset = 0
+        self.log_id = self.folding_id = None
+        # Collection name -> number of records read for it; part of its version
+        self.seen = {}
+        self.refresh()
+        self.wake = threading.Event()
+        if background:
+            threading.Thread(target=self.compaction_loop, daemon=True).start()
+    
+    @staticmethod
+    def file_id(path):
+        """Identify a file by inode so renames by other processes are noticed"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None, 0
+        return (stat.st_dev, stat.st_ino), stat.st_size
+    
+    @staticmethod
+    def read_log(path, offset=0):
+        """Read complete records from a log file starting at offset
+        
+        Returns the records and the number of bytes consumed. An unterminated
+        final line is left for a later read.
+        """
+        records = []
+        consumed = 0
+        if not os.path.exists(path):
+            return records, consumed
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                consumed += len(line)
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass  # garbage from a torn write before the log was repaired
+        return records, consumed
+    
+    def track(self, records):
+        """Count records per collection; the counts are part of the version tokens"""
+        for record in records:
+            self.seen[record['c']] = self.seen.get(record['c'], 0) + 1
+    
+    def refresh(self):
+        """Pick up records appended by other processes and follow log rotations"""
+        with self.lock:
+            folding_id, _ = self.file_id(self.folding_path)
+            log_id, log_size = self.file_id(self.path)
+            if folding_id != self.folding_id or log_id != self.log_id or log_size < self.log_offset:
+                # A compaction rotated the log (possibly in another process): start over
+                self.folding, _ = self.read_log(self.folding_path)
+                self.records, self.log_offset = [], 0
+                self.folding_id, self.log_id = folding_id, log_id
+                self.track(self.folding)
+            if log_size > self.log_offset:
+                records, consumed = self.read_log(self.path, self.log_offset)
+                self.records.extend(records)
+                self.log_offset += consumed
+                self.track(records)
+    
+    def version(self, name):
+        """Return a token that changes whenever a collection's persisted data changes"""
+        self.refresh()
+        return self.base.version(name), self.seen.get(name, 0)
+    
+    def replay(self, name, data, records):
+        """Apply the records for one collection on top of its snapshot data"""
+        for record in records:
+            if record['c'] != name:
+                continue
+            if 'k' in record:
+                if data is None:
+                    data = self.default(name)
+                if 'v' in record:
+                    data[record['k']] = record['v']
+                else:
+                    data.pop(record['k'], None)
+            else:
+                # Copy, or later keyed records would edit the logged value in place
+                data = copy.copy(record.get('v'))
+        return data
+    
+    def load(self, name):
+        """Load a collection's snapshot with the logged changes replayed over it"""
+        self.refresh()
+        with self.lock:
+            records = [record for record in self.folding + self.records if record['c'] == name]
+        data = self.base.load(name)
+        if not records:
+            return data
+        data = self.replay(name, data, records)
+        # Hand out a private copy so callers never mutate the in-memory log
+        return json.loads(json.dumps(data)) if data is not None else None
+    
+    def save(self, name, data, keys=None):
+        """Log a collection change and return the number of bytes appended"""
+        return self.save_batch([(name, data, keys)])[0][0]
+    
+    def save_batch(self, writes):
+        """Log several collection changes with a single append and fsync
+        
+        Returns (bytes appended, (version before, version after)) per write;
+        both versions are read while holding the log lock.
+        """
+        lines = []
+        for name, data, keys in writes:
+            if keys is None:
+                records = [{'c': name, 'v': data}]
+            else:
+                records = [{'c': name, 'k': key, 'v': data[key]} if key in data else {'c': name, 'k': key}
+                           for key in keys]
+            lines.append([json.dumps(record) for record in records])
+        names = {name for name, data, keys in writes}
+        with interprocess_lock(f"{self.path}.lock"):
+            self.refresh()
+            before = {name: (self.base.version(name), self.seen.get(name, 0)) for name in names}
+            self.write([line for write_lines in lines for line in write_lines])
+            after = {name: (self.base.version(name), self.seen.get(name, 0)) for name in names}
+        if self.log_offset >= self.COMPACT_BYTES:
+            self.wake.set()
+        return [(sum(len(line.encode('utf-8')) + 1 for line in write_lines), (before[name], after[name]))
+                for (name, data, keys), write_lines in zip(writes, lines)]
+    
+    def append(self, lines):
+        """Durably append JSON-encoded records to the log"""
+        with interprocess_lock(f"{self.path}.lock"):
+            written = self.write(lines)
+        if self.log_offset >= self.COMPACT_BYTES:
+            self.wake.set()
+        return written
+    
+    def write(self, lines):
+        """Append records and read them back; the caller holds the log lock"""
+        payload = ''.join(f"{line}\n" for line in lines).encode('utf-8')
+        with open(self.path, 'ab+') as f:
+            # Nobody else is writing, so an unterminated tail is a torn write from a crash
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.refresh()
+        return len(payload)
+    
+    def clear(self, names):
+        """Reset the given collections to their defaults"""
+        self.append([json.dumps({'c': name}) for name in names])
+    
+    def compact(self):
+        """Fold logged changes into the snapshot files and drop them from the log"""
+        with interprocess_lock(f"{self.path}.compact.lock", blocking=False) as acquired:
+            if not acquired:
+                return  # another process is compacting
+            with interprocess_lock(f"{self.path}.lock"):
+                self.refresh()
+                if not os.path.exists(self.folding_path):
+                    if not self.records:
+                        return
+                    os.replace(self.path, self.folding_path)
+                    self.refresh()
+                with self.lock:
+                    folding = list(self.folding)
+            # Replays are idempotent, so loads that race with this still see the same data
+            for name in dict.fromkeys(record['c'] for record in folding):
+                data = self.replay(name, self.base.load(name), folding)
+                if data is None:
+                    self.base.clear([name])
+                else:
+                    self.base.save(name, data)
+            os.remove(self.folding_path)
+            self.refresh()
+            self.base.refresh_catalog()
+    
+    def compaction_loop(self):
+        """Background thread: compact periodically or when the log gets large"""
+        while True:
+            self.wake.wait(self.COMPACT_INTERVAL)
+            self.wake.clear()
+            try:
+                self.compact()
+            except Exception:
+                pass  # the log is kept, so the next pass retries
+
+class SQLiteStorage:
+    """Stores collections in indexed SQLite tables and updates single rows"""
+    
+    # Product attribute collections are columns of the products table
+    PRODUCT_COLUMNS = {
+        'product_prices': 'price',
+        'product_barcodes': 'barcode',
+        'product_suppliers': 'supplier',
+        'product_categories': 'category',
+    }
+    partial_writes = True
+    EMPTY_PRODUCT = 'price IS NULL AND barcode IS NULL AND supplier IS NULL AND category IS NULL'
+
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS stores (store TEXT PRIMARY KEY, position INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS store_products (
+            store TEXT NOT NULL,
+            product TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (store, product)
+        );
+        CREATE INDEX IF NOT EXISTS idx_store_products_product ON store_products (product);
+        CREATE TABLE IF NOT EXISTS products (
+            name TEXT PRIMARY KEY,
+            price REAL,
+            barcode TEXT,
+            supplier TEXT,
+            category TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_products_barcode ON products (barcode);
+        CREATE TABLE IF NOT EXISTS product_stock (product TEXT PRIMARY KEY, quantity INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS store_stock (
+            store TEXT NOT NULL,
+            product TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY (store, product)
+        );
+        CREATE TABLE IF NOT EXISTS reorder_points (
+            product TEXT NOT NULL,
+            store TEXT NOT NULL,
+            point INTEGER NOT NULL,
+            PRIMARY KEY (product, store)
+        );
+        CREATE TABLE IF NOT EXISTS pack_sizes (product TEXT PRIMARY KEY, pack INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS stock_movements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            t TEXT NOT NULL,
+            product TEXT NOT NULL,
+            store TEXT NOT NULL,
+            delta INTEGER NOT NULL,
+            reason TEXT,
+            user TEXT,
+            category TEXT,
+            renamed TEXT
+        );
+        CREATE TABLE IF NOT EXISTS saved_pos (
+            po_number TEXT PRIMARY KEY,
+            po_date TEXT,
+            supplier TEXT,
+            total_amount REAL,
+            created_by TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_saved_pos_date ON saved_pos (po_date);
+        CREATE TABLE IF NOT EXISTS pending_changes (position INTEGER PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS store_addresses (store TEXT PRIMARY KEY, address TEXT);
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(self.SCHEMA)
+        with self.conn:
+            # Stock totals from before per-store stock used to be a products column
+            if 'stock' in {row[1] for row in self.conn.execute('PRAGMA table_info(products)')}:
+                self.conn.execute('INSERT OR IGNORE INTO product_stock (product, quantity) '
+                                  'SELECT name, stock FROM products WHERE stock IS NOT NULL')
+                if sqlite3.sqlite_version_info >= (3, 35):
+                    self.conn.execute('ALTER TABLE products DROP COLUMN stock')
+                else:
+                    self.conn.execute('UPDATE products SET stock = NULL')
+                self.conn.execute(f'DELETE FROM products WHERE {self.EMPTY_PRODUCT}')
+    
+    def version(self, name):
+        """Return a token that changes whenever a collection is written by any process"""
+        with self.lock:
+            return self.saved_count(name)
+    
+    def saved_count(self, name):
+        """Read a collection's save counter; the caller holds the lock"""
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (f'saved:{name}',)).fetchone()
+        return row[0] if row else None
+    
+    def is_saved(self, name):
+        """Check whether a collection has ever been written to the database"""
+        row = self.conn.execute('SELECT 1 FROM meta WHERE key = ?', (f'saved:{name}',)).fetchone()
+        return row is not None
+    
+    def load(self, name):
+        """Load a collection, or None if it has never been saved"""
+        with self.lock:
+            if not self.is_saved(name):
+                return None
+            if name == 'store_data':
+                data = {store: [] for (store,) in self.conn.execute('SELECT store FROM stores ORDER BY position')}
+                for store, product in self.conn.execute(
+                        'SELECT store, product FROM store_products ORDER BY store, position'):
+                    data.setdefault(store, []).append(product)
+                return data
+            if name in self.PRODUCT_COLUMNS:
+                column = self.PRODUCT_COLUMNS[name]
+                return dict(self.conn.execute(
+                    f'SELECT name, {column} FROM products WHERE {column} IS NOT NULL ORDER BY rowid'))
+            if name == 'store_stock':
+                data = {}
+                for store, product, quantity in self.conn.execute(
+                        'SELECT store, product, quantity FROM store_stock ORDER BY rowid'):
+                    data.setdefault(store, {})[product] = quantity
+                return data
+            if name == 'reorder_points':
+                # An empty store holds the product's chain-wide point
+                data = {}
+                for product, store, point in self.conn.execute(
+                        'SELECT product, store, point FROM reorder_points ORDER BY rowid'):
+                    points = data.setdefault(product, {})
+                    if store:
+                        points.setdefault('stores', {})[store] = point
+                    else:
+                        points['default'] = point
+                for product, pack in self.conn.execute('SELECT product, pack FROM pack_sizes ORDER BY rowid'):
+                    data.setdefault(product, {})['pack'] = pack
+                return data
+            if name == 'pending_changes':
+                return [json.loads(data) for (data,) in
+                        self.conn.execute('SELECT data FROM pending_changes ORDER BY position')]
+            if name == 'store_addresses':
+                return dict(self.conn.execute('SELECT store, address FROM store_addresses ORDER BY rowid'))
+            if name == 'product_stock':
+                return dict(self.conn.execute('SELECT product, quantity FROM product_stock ORDER BY rowid'))
+        raise KeyError(name)
+    
+    def save(self, name, data, keys=None):
+        """Write a collection, touching only the rows for keys when given
+        
+        Returns the number of bytes of row data written.
+        """
+        return self.save_batch([(name, data, keys)])[0][0]
+    
+    def save_batch(self, writes):
+        """Apply several collection writes in a single transaction
+        
+        Returns (bytes written, (version before, version after)) per write.
+        """
+        with self.lock, self.conn:
+            results = []
+            for name, data, keys in writes:
+                before = self.saved_count(name)
+                written = self._save(name, data, keys)
+                results.append((written, (before, self.saved_count(name))))
+            return results
+    
+    def _save(self, name, data, keys):
+        if name == 'store_data':
+            written = self._save_stores(data, keys)
+        elif name in self.PRODUCT_COLUMNS:
+            written = self._save_product_column(self.PRODUCT_COLUMNS[name], data, keys)
+        elif name == 'pending_changes':
+            written = self._save_pending_changes(data)
+        elif name == 'store_addresses':
+            written = self._save_addresses(data, keys)
+        elif name == 'product_stock':
+            written = self._save_legacy_stock(data, keys)
+        elif name == 'store_stock':
+            written = self._save_store_stock(data, keys)
+        elif name == 'reorder_points':
+            written = self._save_reorder_points(data, keys)
+        else:
+            raise KeyError(name)
+        self.bump_version(name)
+        return written
+    
+    def bump_version(self, name):
+        """Count a save of a collection; the counter doubles as its version for hot reload in other processes"""
+        self.conn.execute('INSERT INTO meta (key, value) VALUES (?, 1) '
+                          'ON CONFLICT (key) DO UPDATE SET value = value + 1', (f'saved:{name}',))
+    
+    def _save_stores(self, data, keys):
+        if keys is None:
+            self.conn.execute('DELETE FROM stores')
+            self.conn.execute('DELETE FROM store_products')
+            keys = list(data)
+        written = 0
+        for store in keys:
+            if store not in data:
+                self.conn.execute('DELETE FROM store_products WHERE store = ?', (store,))
+                self.conn.execute('DELETE FROM stores WHERE store = ?', (store,))
+                continue
+            self.conn.execute(
+                'INSERT OR IGNORE INTO stores (store, position) '
+                'VALUES (?, (SELECT COALESCE(MAX(position) + 1, 0) FROM stores))', (store,))
+            # Rows keep their position while it still follows the previous product's, so
+            # adding or removing a product only touches that product's row
+            existing = dict(self.conn.execute('SELECT product, position FROM store_products WHERE store = ?', (store,)))
+            rows = []
+            last = -1
+            for product in data[store]:
+                position = existing.pop(product, None)
+                if position is None or position <= last:
+                    position = last + 1
+                    rows.append((store, product, position))
+                last = position
+            self.conn.executemany('DELETE FROM store_products WHERE store = ? AND product = ?',
+                                  [(store, product) for product in existing])
+            self.conn.executemany('INSERT OR REPLACE INTO store_products (store, product, position) VALUES (?, ?, ?)',
+                                  rows)
+            written += len(store.encode('utf-8')) + sum(len(product.encode('utf-8')) for _, product, _ in rows)
+        return written
+    
+    def _save_pending_changes(self, data):
+        # The list is saved whole, but only positions whose change differs are written
+        existing = dict(self.conn.execute('SELECT position, data FROM pending_changes'))
+        rows = [(i, payload) for i, payload in enumerate(json.dumps(change) for change in data)
+                if existing.get(i) != payload]
+        self.conn.executemany('INSERT OR REPLACE INTO pending_changes (position, data) VALUES (?, ?)', rows)
+        self.conn.execute('DELETE FROM pending_changes WHERE position >= ?', (len(data),))
+        return sum(len(payload.encode('utf-8')) for _, payload in rows)
+    
+    def _save_product_column(self, column, data, keys):
+        full = keys is None
+        if full:
+            self.conn.execute(f'UPDATE products SET {column} = NULL')
+            keys = list(data)
+        written = 0
+        for product in keys:
+            if product in data:
+                value = data[product]
+                self.conn.execute(
+                    f'INSERT INTO products (name, {column}) VALUES (?, ?) '
+                    f'ON CONFLICT (name) DO UPDATE SET {column} = excluded.{column}', (product, value))
+                written += len(product.encode('utf-8')) + len(str(value).encode('utf-8'))
+            else:
+                self.conn.execute(f'UPDATE products SET {column} = NULL WHERE name = ?', (product,))
+                self.conn.execute(f'DELETE FROM products WHERE name = ? AND {self.EMPTY_PRODUCT}', (product,))
+        if full:
+            self.conn.execute(f'DELETE FROM products WHERE {self.EMPTY_PRODUCT}')
+        return written
+    
+    def _save_store_stock(self, data, keys):
+        if keys is None:
+            self.conn.execute('DELETE FROM store_stock')
+            keys = list(data)
+        written = 0
+        for store in keys:
+            self.conn.execute('DELETE FROM store_stock WHERE store = ?', (store,))
+            rows = [(store, product, quantity) for product, quantity in data.get(store, {}).items()]
+            self.conn.executemany('INSERT INTO store_stock (store, product, quantity) VALUES (?, ?, ?)', rows)
+            written += sum(len(product.encode('utf-8')) + len(str(quantity)) for _, product, quantity in rows)
+        return written
+    
+    def _save_reorder_points(self, data, keys):
+        if keys is None:
+            self.conn.execute('DELETE FROM reorder_points')
+            self.conn.execute('DELETE FROM pack_sizes')
+            keys = list(data)
+        written = 0
+        for product in keys:
+            self.conn.execute('DELETE FROM reorder_points WHERE product = ?', (product,))
+            self.conn.execute('DELETE FROM pack_sizes WHERE product = ?', (product,))
+            points = data.get(product, {})
+            if points.get('pack') is not None:
+                self.conn.execute('INSERT INTO pack_sizes (product, pack) VALUES (?, ?)', (product, points['pack']))
+                written += len(product.encode('utf-8')) + len(str(points['pack']))
+            rows = [(product, store, point) for store, point in points.get('stores', {}).items()]
+            if points.get('default') is not None:
+                rows.append((product, '', points['default']))
+            self.conn.executemany('INSERT INTO reorder_points (product, store, point) VALUES (?, ?, ?)', rows)
+            written += sum(len(product.encode('utf-8')) + len(store.encode('utf-8')) + len(str(point))
+                           for product, store, point in rows)
+        return written
+    
+    def _save_addresses(self, data, keys):
+        if keys is None:
+            self.conn.execute('DELETE FROM store_addresses')
+            keys = list(data)
+        written = 0
+        for store in keys:
+            if store in data:
+                self.conn.execute(
+                    'INSERT INTO store_addresses (store, address) VALUES (?, ?) '
+                    'ON CONFLICT (store) DO UPDATE SET address = excluded.address', (store, data[store]))
+                written += len(store.encode('utf-8')) + len(data[store].encode('utf-8'))
+            else:
+                self.conn.execute('DELETE FROM store_addresses WHERE store = ?', (store,))
+        return written
+    
+    def _save_legacy_stock(self, data, keys):
+        if keys is None:
+            self.conn.execute('DELETE FROM product_stock')
+            keys = list(data)
+        written = 0
+        for product in keys:
+            if product in data:
+                self.conn.execute('INSERT OR REPLACE INTO product_stock (product, quantity) VALUES (?, ?)',
+                                  (product, data[product]))
+                written += len(product.encode('utf-8')) + len(str(data[product]))
+            else:
+                self.conn.execute('DELETE FROM product_stock WHERE product = ?', (product,))
+        return written
+    
+    def clear(self, names):
+        """Forget the given collections so they fall back to their defaults"""
+        with self.lock, self.conn:
+            for name in names:
+                self.conn.execute('DELETE FROM meta WHERE key = ?', (f'saved:{name}',))
+    
+    def migrate_from_json(self, source):
+        """One-shot import of existing JSON files; returns the collections migrated"""
+        with self.lock:
+            if self.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+                return []
+        migrated = []
+        for name in DataManager.COLLECTIONS:
+            data = source.load(name)
+            if data is not None:
+                self.save(name, data)
+                migrated.append(name)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                              (datetime.now().isoformat(),))
+        return migrated
+
+class PartitionedPOStore:
+    """Keeps saved purchase orders in one JSON file per month plus a header index
+    
+    Listing POs only reads the small header index; a PO's line items are read
+    from its month's file when they are needed, so start-up cost does not grow
+    with PO history.
+    """
+    
+    # PO fields copied into the header index
+    HEADER_FIELDS = ('po_number', 'timestamp', 'supplier', 'total_amount', 'created_by', 'delivery_address')
+    # Number of recently read month files kept parsed in memory
+    PARTITION_CACHE = 4
+    
+    def __init__(self, directory='saved_pos'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.index = {}
+        self.index_version = None
+        self.partitions = {}
+    
+    def path(self, name):
+        """Return the path of the index or of a month partition"""
+        return os.path.join(self.directory, f"{name}.json")
+    
+    @staticmethod
+    def partition_of(po_data):
+        """Return the month partition a PO is stored in"""
+        return (po_data.get('timestamp') or '')[:7] or 'undated'
+    
+    @staticmethod
+    def file_version(path):
+        """Return a token that changes whenever a file is rewritten"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def read(self, name):
+        """Read the index or a month partition from disk"""
+        try:
+            with open(self.path(name), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+    
+    def headers(self):
+        """Return PO number -> header for every saved PO"""
+        version = self.file_version(self.path('index'))
+        with self.lock:
+            if version != self.index_version:
+                self.index = self.read('index')
+                self.index_version = version
+            return self.index
+    
+    def load(self, po_number):
+        """Return a PO with its line items, or None if it does not exist"""
+        header = self.headers().get(po_number)
+        if header is None:
+            return None
+        name = header['partition']
+        version = self.file_version(self.path(name))
+        with self.lock:
+            cached = self.partitions.pop(name, None)
+            if cached is None or cached[0] != version:
+                cached = (version, self.read(name))
+            self.partitions[name] = cached
+            while len(self.partitions) > self.PARTITION_CACHE:
+                del self.partitions[next(iter(self.partitions))]
+        return cached[1].get(po_number)
+    
+    def save_many(self, pos, deleted=()):
+        """Write POs and remove deleted PO numbers; returns the number of bytes written"""
+        with self.lock, interprocess_lock(f"{self.path('index')}.lock"):
+            index = self.read('index')
+            changes = {}
+            for po_number in deleted:
+                header = index.pop(po_number, None)
+                if header is not None:
+                    changes.setdefault(header['partition'], {})[po_number] = None
+            for po_data in pos:
+                po_number = po_data['po_number']
+                old = index.get(po_number)
+                if old is not None and old['partition'] != self.partition_of(po_data):
+                    changes.setdefault(old['partition'], {})[po_number] = None
+                header = {field: po_data.get(field) for field in self.HEADER_FIELDS}
+                header['partition'] = self.partition_of(po_data)
+                index[po_number] = header
+                changes.setdefault(header['partition'], {})[po_number] = po_data
+            written = 0
+            # Partitions are written before the index so every indexed PO can be loaded
+            for name, updates in changes.items():
+                partition = self.read(name)
+                for po_number, po_data in updates.items():
+                    if po_data is None:
+                        partition.pop(po_number, None)
+                    else:
+                        partition[po_number] = po_data
+                if partition:
+                    written += write_atomic(self.path(name), json.dumps(partition).encode('utf-8'))
+                elif os.path.exists(self.path(name)):
+                    os.remove(self.path(name))
+                self.partitions.pop(name, None)
+            written += write_atomic(self.path('index'), json.dumps(index).encode('utf-8'))
+            self.index = index
+            self.index_version = self.file_version(self.path('index'))
+        return written
+    
+    def save(self, po_data):
+        """Save one PO and return the number of bytes written"""
+        return self.save_many([po_data])
+    
+    def delete(self, po_number):
+        """Delete one PO"""
+        return self.save_many([], deleted=[po_number])
+    
+    def clear(self):
+        """Delete every saved PO"""
+        return self.save_many([], deleted=list(self.headers()))
+    
+    def migrate(self, source):
+        """Move POs from the old single saved_pos collection into partitions"""
+        legacy = source.load('saved_pos')
+        if legacy:
+            self.save_many(legacy.values())
+        if legacy is not None:
+            source.clear(['saved_pos'])
+
+class SQLitePOStore:
+    """Saved purchase orders in the SQLite database, listed from indexed header columns"""
+    
+    HEADER_COLUMNS = (('supplier', 'TEXT'), ('total_amount', 'REAL'), ('created_by', 'TEXT'),
+                      ('delivery_address', 'TEXT'))
+    
+    def __init__(self, storage):
+        self.storage = storage
+        self.index = {}
+        self.index_version = None
+        with storage.lock, storage.conn:
+            columns = {row[1] for row in storage.conn.execute('PRAGMA table_info(saved_pos)')}
+            added = [column for column, kind in self.HEADER_COLUMNS if column not in columns]
+            for column, kind in self.HEADER_COLUMNS:
+                if column in added:
+                    storage.conn.execute(f'ALTER TABLE saved_pos ADD COLUMN {column} {kind}')
+            # Fill in headers for POs saved before the header columns existed
+            missing = '' if added else ' WHERE total_amount IS NULL'
+            for po_number, data in storage.conn.execute(
+                    f'SELECT po_number, data FROM saved_pos{missing}').fetchall():
+                po_data = json.loads(data)
+                storage.conn.execute(
+                    'UPDATE saved_pos SET supplier = ?, total_amount = ?, created_by = ?, delivery_address = ? '
+                    'WHERE po_number = ?',
+                    (po_data.get('supplier'), po_data.get('total_amount'), po_data.get('created_by'),
+                     po_data.get('delivery_address'), po_number))
+    
+    def headers(self):
+        """Return PO number -> header for every saved PO"""
+        version = self.storage.version('saved_pos')
+        with self.storage.lock:
+            if self.index_version is None or version != self.index_version:
+                self.index = {
+                    po_number: {'po_number': po_number, 'timestamp': po_date, 'supplier': supplier,
+                                'total_amount': total_amount, 'created_by': created_by,
+                                'delivery_address': delivery_address}
+                    for po_number, po_date, supplier, total_amount, created_by, delivery_address
+                    in self.storage.conn.execute(
+                        'SELECT po_number, po_date, supplier, total_amount, created_by, delivery_address '
+                        'FROM saved_pos ORDER BY po_number')}
+                self.index_version = version
+            return self.index
+    
+    def load(self, po_number):
+        """Return a PO with its line items, or None if it does not exist"""
+        with self.storage.lock:
+            row = self.storage.conn.execute('SELECT data FROM saved_pos WHERE po_number = ?',
+                                            (po_number,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def save_many(self, pos, deleted=()):
+        """Write POs and remove deleted PO numbers; returns the number of bytes written"""
+        written = 0
+        with self.storage.lock, self.storage.conn:
+            for po_number in deleted:
+                self.storage.conn.execute('DELETE FROM saved_pos WHERE po_number = ?', (po_number,))
+            for po_data in pos:
+                payload = json.dumps(po_data)
+                self.storage.conn.execute(
+                    'INSERT OR REPLACE INTO saved_pos '
+                    '(po_number, po_date, supplier, total_amount, created_by, delivery_address, data) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (po_data['po_number'], po_data.get('timestamp'), po_data.get('supplier'),
+                     po_data.get('total_amount'), po_data.get('created_by'), po_data.get('delivery_address'),
+                     payload))
+                written += len(payload.encode('utf-8'))
+            self.storage.bump_version('saved_pos')
+        return written
+    
+    def save(self, po_data):
+        """Save one PO and return the number of bytes written"""
+        return self.save_many([po_data])
+    
+    def delete(self, po_number):
+        """Delete one PO"""
+        return self.save_many([], deleted=[po_number])
+    
+    def clear(self):
+        """Delete every saved PO"""
+        return self.save_many([], deleted=list(self.headers()))
+    
+    def migrate(self, source):
+        """One-shot import of POs from the JSON files"""
+        with self.storage.lock:
+            if self.storage.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_pos_from_json'").fetchone():
+                return
+        legacy = source.load('saved_pos') or {}
+        existing = self.headers()
+        self.save_many([po_data for po_number, po_data in legacy.items() if po_number not in existing])
+        with self.storage.lock, self.storage.conn:
+            self.storage.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_pos_from_json', ?)",
+                                      (datetime.now().isoformat(),))
+
+class POArchive:
+    """Compressed, append-only archive of old purchase orders
+    
+    Each archived PO is appended to its year's file as a separate gzip member,
+    so the files stay valid gzip streams and one PO can be read back by seeking
+    to its offset. Headers and offsets are kept in index.json, which is only
+    read when the archive is searched.
+    """
+    
+    def __init__(self, directory='po_archive'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.index = {}
+        self.index_version = None
+    
+    def path(self, name):
+        """Return the path of a file in the archive directory"""
+        return os.path.join(self.directory, name)
+    
+    def read_index(self):
+        """Read the archive index from disk"""
+        try:
+            with open(self.path('index.json'), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+    
+    def headers(self):
+        """Return PO number -> header, file and offset for every archived PO"""
+        version = PartitionedPOStore.file_version(self.path('index.json'))
+        with self.lock:
+            if version != self.index_version:
+                self.index = self.read_index()
+                self.index_version = version
+            return self.index
+    
+    def search(self, query):
+        """Return headers of archived POs matching a search query"""
+        return {po_number: header for po_number, header in self.headers().items()
+                if po_header_matches(header, query)}
+    
+    def load(self, po_number):
+        """Read one PO back from the archive, or None if it is not archived"""
+        header = self.headers().get(po_number)
+        if header is None:
+            return None
+        with open(self.path(header['file']), 'rb') as f:
+            f.seek(header['offset'])
+            return json.loads(gzip.decompress(f.read(header['length'])))
+    
+    def append(self, pos):
+        """Append POs to the archive and return the number of compressed bytes written"""
+        written = 0
+        with self.lock, interprocess_lock(self.path('index.json.lock')):
+            index = self.read_index()
+            by_file = {}
+            for po_data in pos:
+                year = (po_data.get('timestamp') or '')[:4] or 'undated'
+                by_file.setdefault(f"archive-{year}.json.gz", []).append(po_data)
+            # Data is synced before the index points at it; a crash in between only leaves unused bytes
+            for name, file_pos in by_file.items():
+                with open(self.path(name), 'ab') as f:
+                    for po_data in file_pos:
+                        payload = gzip.compress(json.dumps(po_data).encode('utf-8'))
+                        header = {field: po_data.get(field) for field in PartitionedPOStore.HEADER_FIELDS}
+                        header.update(archived=True, file=name, offset=f.tell(), length=len(payload))
+                        f.write(payload)
+                        index[po_data['po_number']] = header
+                        written += len(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+            write_atomic(self.path('index.json'), json.dumps(index).encode('utf-8'))
+            self.index = index
+            self.index_version = PartitionedPOStore.file_version(self.path('index.json'))
+        return written
+    
+    def delete(self, po_number):
+        """Drop a PO from the archive index; its bytes stay in the append-only file"""
+        with self.lock, interprocess_lock(self.path('index.json.lock')):
+            index = self.read_index()
+            if index.pop(po_number, None) is not None:
+                write_atomic(self.path('index.json'), json.dumps(index).encode('utf-8'))
+    
+    def clear(self):
+        """Delete every archived PO"""
+        with self.lock, interprocess_lock(self.path('index.json.lock')):
+            for name in os.listdir(self.directory):
+                if name.endswith('.json.gz') or name == 'index.json':
+                    os.remove(self.path(name))
+    
+    def archive_from(self, store, max_age_days):
+        """Move POs older than max_age_days out of a PO store; returns how many were moved"""
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+        aged = [po_number for po_number, header in store.headers().items()
+                if header.get('timestamp') and header['timestamp'] < cutoff]
+        pos = [po_data for po_data in map(store.load, aged) if po_data is not None]
+        if not pos:
+            return 0
+        self.append(pos)
+        store.save_many([], deleted=[po_data['po_number'] for po_data in pos])
+        return len(pos)
+
+class StockLedger:
+    """Append-only JSON-lines log of stock movements, shared by app processes
+    
+    Each line is one movement: {"t": timestamp, "product", "store", "delta",
+    "reason", "user", "category"}, or a rename of a product with reason
+    "rename" and the new name in "renamed". Lines are never rewritten, so
+    each process keeps a byte offset and reads only what was appended since.
+    """
+    
+    def __init__(self, path='stock_ledger.jsonl'):
+        self.path = path
+        self.offset = 0
+    
+    def append(self, events):
+        """Durably append movements to the ledger"""
+        payload = ''.join(f"{json.dumps(event)}\n" for event in events).encode('utf-8')
+        with interprocess_lock(f"{self.path}.lock"):
+            with open(self.path, 'ab+') as f:
+                # Nobody else is writing, so an unterminated tail is a torn write from a crash
+                size = f.seek(0, os.SEEK_END)
+                if size:
+                    f.seek(size - 1)
+                    if f.read(1) != b'\n':
+                        f.write(b'\n')
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+        return len(payload)
+    
+    def read_new(self):
+        """Return the movements appended by any process since the last read"""
+        _, size = JournaledStorage.file_id(self.path)
+        if size <= self.offset:
+            return []
+        events, consumed = JournaledStorage.read_log(self.path, self.offset)
+        self.offset += consumed
+        return events
+
+class SQLiteStockLedger:
+    """Append-only stock movement table in the SQLite database"""
+    
+    COLUMNS = ('t', 'product', 'store', 'delta', 'reason', 'user', 'category', 'renamed')
+    
+    def __init__(self, storage):
+        self.storage = storage
+        self.last_id = 0
+        with storage.lock, storage.conn:
+            # Databases created before renames were logged lack the column
+            if 'renamed' not in {row[1] for row in storage.conn.execute('PRAGMA table_info(stock_movements)')}:
+                storage.conn.execute('ALTER TABLE stock_movements ADD COLUMN renamed TEXT')
+    
+    def append(self, events):
+        """Insert movements in one transaction and return the number of rows written"""
+        rows = [tuple(event.get(column) for column in self.COLUMNS) for event in events]
+        with self.storage.lock, self.storage.conn:
+            self.storage.conn.executemany(
+                f"INSERT INTO stock_movements ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({', '.join('?' for column in self.COLUMNS)})", rows)
+        return len(rows)
+    
+    def read_new(self):
+        """Return the movements inserted by any process since the last read"""
+        with self.storage.lock:
+            rows = self.storage.conn.execute(
+                f"SELECT id, {', '.join(self.COLUMNS)} FROM stock_movements WHERE id > ? ORDER BY id",
+                (self.last_id,)).fetchall()
+        if rows:
+            self.last_id = rows[-1][0]
+        return [dict(zip(self.COLUMNS, row[1:])) for row in rows]
+
+class WriteQueue:
+    """Shared write queue that group-commits saves from all sessions
+    
+    Writes submitted within COMMIT_WINDOW of each other are handed to the
+    storage backend as one batch: one journal append and fsync, one SQLite
+    transaction, or one atomic rewrite per JSON file.
+    """
+    
+    COMMIT_WINDOW = 0.02  # seconds to wait for other sessions to join a commit
+    
+    def __init__(self, storage):
+        self.storage = storage
+        self.pending = queue.Queue()
+        threading.Thread(target=self.run, daemon=True).start()
+    
+    def submit(self, name, data, keys=None):
+        """Queue a collection write
+        
+        Returns a Future resolving to (bytes written, (version before, version after)).
+        """
+        # Capture the data now, nested values included, so later edits by the caller can't race the writer thread
+        if not self.storage.partial_writes:
+            # The whole file is rewritten anyway, so serializing it is the only copy made
+            keys = None
+            data = self.storage.encode(data)
+        elif keys is not None:
+            data = copy.deepcopy({key: data[key] for key in keys if key in data})
+        else:
+            data = copy.deepcopy(data)
+        future = Future()
+        self.pending.put(((name, data, keys), future))
+        return future
+    
+    def run(self):
+        """Writer thread: collect a window of writes and commit them together"""
+        while True:
+            batch = [self.pending.get()]
+            time.sleep(self.COMMIT_WINDOW)
+            while True:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                results = self.storage.save_batch([write for write, future in batch])
+            except Exception as e:
+                for write, future in batch:
+                    future.set_exception(e)
+                continue
+            for (write, future), written in zip(batch, results):
+                future.set_result(written)
+
+class KeywordMatcher:
+    """Finds every keyword of a fixed set in a name with one compiled regex
+    
+    The keywords are folded into a trie-shaped alternation inside a lookahead, so
+    a single scan reports the longest keyword starting at each position, including
+    overlapping ones. Shorter keywords that are prefixes of a match are implied.
+    """
+    
+    def __init__(self, keywords):
+        self.keywords = sorted(set(keywords))
+        self.keyword_ids = {keyword: i for i, keyword in enumerate(self.keywords)}
+        self.implied = [frozenset(j for j, other in enumerate(self.keywords) if keyword.startswith(other))
+                        for keyword in self.keywords]
+        self.pattern = re.compile(f"(?=({self.trie_pattern(self.keywords)}))")
+    
+    @staticmethod
+    def trie_pattern(keywords):
+        """Build a regex matching the longest of the keywords, sharing common prefixes"""
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        
+        def emit(node):
+            branches = [re.escape(char) + emit(child) for char, child in node.items() if char]
+            if not branches:
+                return ''
+            body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+            return f"(?:{body})?" if '' in node else body
+        
+        return emit(trie)
+    
+    def find(self, text):
+        """Return the IDs of all keywords occurring in an upper-case text"""
+        found = frozenset()
+        for match in self.pattern.finditer(text):
+            found |= self.implied[self.keyword_ids[match.group(1)]]
+        return found
+
+class KeywordRules:
+    """Ordered (value, keywords) rules resolved against the keywords found in a name
+    
+    A rule fires when all of its keywords occur; the first rule that fires wins,
+    as in an if/elif chain.
+    """
+    
+    def __init__(self, matcher, rules):
+        self.values = []
+        self.requirements = []
+        self.rules_by_keyword = {}
+        for index, (value, keywords) in enumerate(rules):
+            self.values.append(value)
+            required = frozenset(matcher.keyword_ids[keyword] for keyword in keywords)
+            self.requirements.append(required)
+            for keyword_id in required:
+                self.rules_by_keyword.setdefault(keyword_id, []).append(index)
+    
+    def resolve(self, found, default=None):
+        """Return the value of the first rule satisfied by a set of keyword IDs"""
+        candidates = sorted({index for keyword_id in found for index in self.rules_by_keyword.get(keyword_id, ())})
+        for index in candidates:
+            if self.requirements[index] <= found:
+                return self.values[index]
+        return default
+    
+    def resolve_many(self, found, default=None):
+        """Resolve many keyword sets, evaluating each distinct set once"""
+        resolved = {}
+        for keywords in found:
+            if keywords not in resolved:
+                resolved[keywords] = self.resolve(keywords, default)
+        return [resolved[keywords] for keywords in found]
+
+class ProductClassifier:
+    """Category and price rules for product names"""
+    
+    # (category, keywords) in priority order
+    CATEGORY_RULES = (
+        ('Barbican', ('BARBICAN',)),
+        ('Drinko 250ml', ('DRINKO', '250ML')),
+        ('Drinko 330ml', ('DRINKO', '330ML')),
+        ('Mustard Oil', ('MUSTARD OIL',)),
+        ('Basil Seed', ('BASIL SEED',)),
+        ('Lassi', ('LASSI',)),
+        ('Jus', ('JUS',)),
+        ('Vegetable Ghee', ('VEGETABLE GHEE',)),
+        ('Chanachur', ('CHANACHUR',)),
+        ('Energy Drink', ('ENERGY DRINK',)),
+        ('Lollipop', ('LOLLIPOP',)),
+        ('Creamer', ('CREAMER',)),
+        ('Coconut Water', ('COCONUT WATER',)),
+        ('Float', ('FLOAT',)),
+        ('PET 320ml', ('TAMARIND', 'PET 320ML')),
+        ('PET 320ml', ('SOUR PLUM', 'PET 320ML')),
+        ('PET 320ml', ('BIRD NEST', 'PET 320ML')),
+        ('Traditional Drinks', ('TAMARIND',)),
+        ('Traditional Drinks', ('SOUR PLUM',)),
+        ('Traditional Drinks', ('BIRD NEST',)),
+        ('Soya', ('SOYA',)),
+        ('Puffed Rice', ('PUFFED RICE',)),
+        ('Biscuits', ('BISCUITS',)),
+        ('Biscuits', ('POTATA',)),
+        ('BES Minuman', ('BES MINUMAN',)),
+        ('Spices', ('BRIYANI MASALA',)),
+        ('Snacks', ('HUMPTY DUMPTY',)),
+    )
+    
+    # Estimated prices per piece by name keyword, first match wins
+    ESTIMATED_PRICES = (
+        ('BARBICAN', 4.38),  # 4.375 rounded
+        ('BASIL SEED', 2.42),  # 2.41666667 rounded
+        ('BES MINUMAN', 2.00),
+        ('HUMPTY DUMPTY', 2.00),
+        ('POWER ENERGY DRINK', 1.42),  # 1.416667 rounded
+        ('VEGETABLE GHEE 450G', 10.63),  # 10.625 rounded
+        ('VEGETABLE GHEE 125G', 4.13),  # 4.125 rounded
+        ('COCONUT WATER', 1.67),  # 1.666666 rounded
+        ('AIS LEMON TEH', 1.63),  # 1.625 rounded
+        ('PREMIO PARADISE', 3.11),
+        ('CHANACHUR', 3.13),  # 3.125 rounded
+        ('JUS PET 1000ML', 3.75),
+        ('JUS 330ML', 1.50),
+        ('PET 320ML', 1.50),
+        ('DRINKO FLOAT 250ML', 1.50),
+        ('DRINKO FLOAT 330ML', 2.00),
+        ('LASSI 285ML', 1.69),  # 1.6944444 rounded
+        ('SOYA CAN', 1.00),
+        ('COOLING TAMARIND', 1.38),  # 1.375 rounded
+        ('JUS PET VALUE PACK 1.5L', 11.00),
+        ('MUSTARD OIL 400ML', 5.83),  # 5.833333 rounded
+        ('MUSTARD OIL 200ML', 3.00),
+        ('VARIETY LOLLIPOP', 30.00),
+        ('PUFFED RICE', 2.75),
+        ('CREAMER 500GM', 2.75),  # New price
+        ('CREAMER 500GM EASY OPEN', 2.92),  # 2.916666 rounded
+        ('CHOCO STICK', 0.70),  # New price
+        ('BOMBAY BRIYANI', 2.92),  # 2.916666 rounded
+        ('POTATA BISCUITS', 1.60),  # 1.6041666 rounded
+    )
+    
+    # Fallback prices for names no keyword matches
+    CATEGORY_PRICES = {
+        'Barbican': 4.38,
+        'Basil Seed': 2.42,
+        'BES Minuman': 2.00,
+        'Snacks': 2.00,
+        'Energy Drink': 1.42,
+        'Vegetable Ghee': 10.63,
+        'Coconut Water': 1.67,
+        'Traditional Drinks': 1.63,
+        'Chanachur': 3.13,
+        'Jus': 3.75,
+        'PET 320ml': 1.50,
+        'Drinko 250ml': 1.50,
+        'Drinko 330ml': 2.00,
+        'Lassi': 1.69,
+        'Soya': 1.00,
+        'Mustard Oil': 5.83,
+        'Lollipop': 30.00,
+        'Puffed Rice': 2.75,
+        'Creamer': 2.75,
+        'Biscuits': 1.60,
+        'Spices': 2.92
+    }
+    DEFAULT_PRICE = 3.00
+    
+    # New prices per piece (rounded to 2 decimal places) applied by "Update All Prices"
+    LIST_PRICES = (
+        # Barbican products
+        ('BARBICAN POMEGRANATE', 4.38),
+        ('BARBICAN RASBERRY', 4.38),
+        ('BARBICAN APPLE', 4.38),
+        ('BARBICAN LEMON', 4.38),
+        ('BARBICAN STRAWBERRY', 4.38),
+        ('BARBICAN PINEAPPLE', 4.38),
+        
+        # Basil Seed products
+        ('PRAN BASIL SEED MANGO', 2.42),
+        ('PRAN BASIL SEED ORANGE', 2.42),
+        ('PRAN BASIL SEED STRAWBERRY', 2.42),
+        ('PRAN BASIL SEED KIWI', 2.42),
+        ('PRAN BASIL SEED LITCHI', 2.42),
+        ('PRAN BASIL SEED COCKTAIL', 2.42),
+        ('PRAN BASIL SEED PINEAPPLE', 2.42),
+        ('PRAN BASIL SEED POMEGRANATE', 2.42),
+        ('PRAN BASIL SEED COCONUT', 2.42),
+        
+        # BES Minuman products
+        ('PRAN BES MINUMAN BERPERISA ANGGUR', 2.00),
+        ('PRAN BES MINUMAN BERPERISA OREN', 2.00),
+        ('PRAN BES MINUMAN BERPERISA JAGUNG', 2.00),
+        ('PRAN BES MINUMAN BERPERISA LYCHEE', 2.00),
+        ('PRAN BES MINUMAN BERPERISA ROSE', 2.00),
+        ('PRAN BES MINUMAN BERPERISA SARSI', 2.00),
+        
+        # Humpty Dumpty
+        ('HUMPTY DUMPTY', 2.00),
+        
+        # Power Energy Drink
+        ('POWER ENERGY DRINK PET 250ML', 1.42),
+        
+        # Vegetable Ghee
+        ('PRAN VEGETABLE GHEE 450G', 10.63),
+        ('PRAN VEGETABLE GHEE 125G', 4.13),
+        
+        # Coconut Water
+        ('PRAN COCONUT WATER', 1.67),
+        
+        # Lemon Teh
+        ('PRAN AIS LEMON TEH', 1.63),
+        
+        # Paradise
+        ('PRAN PREMIO PARADISE', 3.11),
+        
+        # Chanachur
+        ('PRAN CHANACHUR HOT 250G', 3.13),
+        ('PRAN CHANACHUR BBQ 250G', 3.13),
+        
+        # Jus 1000ml
+        ('PRAN JUS PET 1000ML MANGO', 3.75),
+        ('PRAN JUS PET 1000ML ORANGE', 3.75),
+        ('PRAN JUS PET 1000ML APPLE', 3.75),
+        
+        # Jus 330ml
+        ('PRAN JUS 330ML APPLE', 1.50),
+        ('PRAN JUS 330ML ORANGE', 1.50),
+        ('PRAN JUS 330ML MANGO', 1.50),
+        
+        # PET 320ml
+        ('PRAN TAMARIND PET 320ML', 1.50),
+        ('PRAN SOUR PLUM PET 320ML', 1.50),
+        ('PRAN BIRD NEST PET 320ML', 1.50),
+        
+        # Drinko 250ml
+        ('DRINKO FLOAT 250ML MANGO', 1.50),
+        ('DRINKO FLOAT 250ML STRAWBERRY', 1.50),
+        ('DRINKO FLOAT 250ML LYCHEE', 1.50),
+        
+        # Drinko 330ml
+        ('DRINKO FLOAT 330ML MANGO', 2.00),
+        ('DRINKO FLOAT 330ML STRAWBERRY', 2.00),
+        ('DRINKO FLOAT 330ML LYCHEE', 2.00),
+        ('DRINKO FLOAT 330ML ORANGE', 2.00),
+        ('DRINKO FLOAT 330ML PINEAPPLE', 2.00),
+        
+        # Lassi 285ml
+        ('PRAN LASSI 285ML YOGURT', 1.69),
+        ('PRAN LASSI 285ML MANGO', 1.69),
+        ('PRAN LASSI 285ML BANANA', 1.69),
+        ('PRAN LASSI 285ML STRAWBERRY', 1.69),
+        
+        # Soya Can
+        ('PRAN SOYA CAN 300ML', 1.00),
+        
+        # Cooling Tamarind
+        ('PRAN COOLING TAMARIND', 1.38),
+        
+        # Jus 1.5L
+        ('PRAN JUS PET VALUE PACK 1.5L MANGO', 11.00),
+        ('PRAN JUS PET VALUE PACK 1.5L ORANGE', 11.00),
+        
+        # Mustard Oil
+        ('PRAN MUSTARD OIL 400ML', 5.83),
+        ('PRAN MUSTARD OIL 200ML', 3.00),
+        
+        # Lollipop
+        ('PRAN VARIETY LOLLIPOP', 30.00),
+        
+        # Puffed Rice
+        ('PRAN PUFFED RICE 400G', 2.75),
+        
+        # Creamer
+        ('PRAN CREAMER 500GM', 2.75),
+        ('PRAN CREAMER 500GM EASY OPEN', 2.92),
+        
+        # Choco Stick
+        ('PRAN CHOCO STICK', 0.70),
+        
+        # Bombay Briyani
+        ('BOMBAY BRIYANI MASALA', 2.92),
+        
+        # Potata Biscuits
+        ('PRAN POTATA BISCUITS 100GM', 1.60),
+        
+        # Other products
+        ('PRAN SWEETENED CREAMER 500GM', 5.00),
+    )
+    
+    def __init__(self):
+        estimated = [(price, (keyword,)) for keyword, price in self.ESTIMATED_PRICES]
+        listed = [(price, (keyword,)) for keyword, price in self.LIST_PRICES]
+        self.matcher = KeywordMatcher(keyword for rules in (self.CATEGORY_RULES, estimated, listed)
+                                      for _, keywords in rules for keyword in keywords)
+        self.category_rules = KeywordRules(self.matcher, self.CATEGORY_RULES)
+        self.estimate_rules = KeywordRules(self.matcher, estimated)
+        self.list_price_rules = KeywordRules(self.matcher, listed)
+    
+    def scan(self, product_names):
+        """Return the keyword IDs found in each name, scanning repeated names once"""
+        found = {}
+        for name in product_names:
+            if name not in found:
+                found[name] = self.matcher.find(name.upper())
+        return [found[name] for name in product_names]
+    
+    def classify_many(self, product_names):
+        """Return categories, estimated prices and list prices (NaN where none) in one scan"""
+        found = self.scan(list(product_names))
+        categories = self.category_rules.resolve_many(found, 'Other')
+        return categories, self.estimate_from(found, categories), self.list_prices_from(found)
+    
+    def categorize(self, product_name):
+        """Categorize a product based on its name"""
+        return self.categorize_many([product_name])[0]
+    
+    def categorize_many(self, product_names):
+        """Categorize many products in one pass"""
+        return self.category_rules.resolve_many(self.scan(list(product_names)), 'Other')
+    
+    def estimate_price(self, product_name):
+        """Estimate a product's price per piece from its name"""
+        return float(self.estimate_prices([product_name])[0])
+    
+    def estimate_prices(self, product_names):
+        """Estimate prices for many products as a float array, falling back to category prices"""
+        return self.estimate_from(self.scan(list(product_names)))
+    
+    def estimate_from(self, found, categories=None):
+        """Estimate prices from scanned keywords, categorizing only names without a price keyword"""
+        prices = np.array(self.estimate_rules.resolve_many(found, np.nan), dtype=float)
+        missing = np.flatnonzero(np.isnan(prices))
+        if len(missing):
+            if categories is None:
+                categories = dict(zip(missing, self.category_rules.resolve_many([found[i] for i in missing], 'Other')))
+            prices[missing] = [self.CATEGORY_PRICES.get(categories[i], self.DEFAULT_PRICE) for i in missing]
+        return prices
+    
+    def list_prices(self, product_names):
+        """Return the list price for each product, NaN where no list price applies"""
+        return self.list_prices_from(self.scan(list(product_names)))
+    
+    def list_prices_from(self, found):
+        """Return list prices from scanned keywords, NaN where no list price applies"""
+        return np.array(self.list_price_rules.resolve_many(found, np.nan), dtype=float)
+
+class DuplicateFinder:
+    """Finds likely duplicate product names without comparing every pair
+    
+    Names are reduced to sets of tokens, with sizes such as "250 ML" written
+    as one token and words one dropped letter apart mapped to a shared
+    spelling. Names are then blocked on that token set and on the set minus
+    one non-size word, so a name only meets names with the same words in any
+    order or with one extra word (a brand or pack type). Pairs that meet are
+    scored with difflib's similarity ratio over their tokens as written, so
+    a pair that only meets through a shared spelling scores below 1.
+    """
+    
+    SIZE = re.compile(r"(\d+(?:\.\d+)?)\s*(ML|LTR|L|GM|GRAM|G|KG|PCS)\b")
+    UNITS = {'GM': 'G', 'GRAM': 'G', 'LTR': 'L'}
+    TOKEN = re.compile(r"[A-Z0-9.]+")
+    
+    def __init__(self, min_score=0.8):
+        self.min_score = min_score
+    
+    def tokens(self, name):
+        """Split a name into upper-case tokens with sizes joined to their units"""
+        name = self.SIZE.sub(lambda match: match.group(1) + self.UNITS.get(match.group(2), match.group(2)), name.upper())
+        return self.TOKEN.findall(name)
+    
+    @staticmethod
+    def is_size(token):
+        """Check whether a token is a size or other number"""
+        return any(char.isdigit() for char in token)
+    
+    def spellings(self, vocabulary):
+        """Map each word to a shared spelling for words one inserted or dropped letter apart
+        
+        A word of five or more letters meets the words it becomes with one letter
+        dropped; substitutions never match, so SPICE and SPICY stay apart. Each
+        word takes the most common of itself and the words it meets, the longest
+        on a tie, but only a spelling that keeps itself, so words are never joined
+        through a chain of others.
+        """
+        neighbours = {word: set() for word in vocabulary}
+        for word in vocabulary:
+            if len(word) < 5 or self.is_size(word):
+                continue
+            for i in range(len(word)):
+                other = word[:i] + word[i + 1:]
+                if other in neighbours:
+                    neighbours[word].add(other)
+                    neighbours[other].add(word)
+        
+        def weight(word):
+            return vocabulary[word], len(word), word
+        
+        best = {word: max(others | {word}, key=weight) for word, others in neighbours.items()}
+        return {word: spelling if best[spelling] == spelling else word for word, spelling in best.items()}
+    
+    def candidates(self, product_names, store_counts=None):
+        """Return (product_to_keep, product_to_remove, score) merge candidates, best first
+        
+        Each product is removed at most once and never kept after being removed,
+        so the list can be merged in order. The kept name is the more specific one
+        (more tokens), then the one carried by more stores.
+        """
+        store_counts = store_counts or {}
+        product_names = list(product_names)
+        tokenized = [self.tokens(name) for name in product_names]
+        vocabulary = {}
+        for tokens in tokenized:
+            for token in set(tokens):
+                vocabulary[token] = vocabulary.get(token, 0) + 1
+        spelling = self.spellings(vocabulary)
+        sizes = frozenset(spelling[token] for token in vocabulary if self.is_size(token))
+        keys = [frozenset(spelling[token] for token in tokens) for tokens in tokenized]
+        misspelled = [sum(spelling[token] != token for token in tokens) for tokens in tokenized]
+        
+        def rank(i):
+            return (-len(keys[i]), misspelled[i], -store_counts.get(product_names[i], 0), product_names[i])
+        
+        # Sorted tokens as written, before spellings are shared
+        written = [' '.join(sorted(set(tokens))) for tokens in tokenized]
+        blocks = {}
+        for i, key in enumerate(keys):
+            if key:
+                blocks.setdefault(key, []).append(i)
+        leaders = {key: min(members, key=rank) for key, members in blocks.items()}
+        
+        pairs = {}
+        for key, members in blocks.items():
+            leader = leaders[key]
+            for i in members:
+                if i != leader:
+                    pairs[(leader, i)] = 1.0 if written[leader] == written[i] else None
+        for key, leader in leaders.items():
+            words = key - sizes
+            if len(words) < 2:
+                continue
+            for word in words:
+                other = leaders.get(key - {word})
+                if other is not None:
+                    keep, remove = sorted((leader, other), key=rank)
+                    pairs[(keep, remove)] = None
+        
+        scored = []
+        for (keep, remove), score in pairs.items():
+            if score is None:
+                score = difflib.SequenceMatcher(None, written[keep], written[remove]).ratio()
+            if score >= self.min_score:
+                scored.append((-score, product_names[keep], product_names[remove]))
+        scored.sort()
+        
+        removed = set()
+        merges = []
+        for score, keep, remove in scored:
+            if keep in removed or remove in removed:
+                continue
+            removed.add(remove)
+            merges.append((keep, remove, round(-score, 3)))
+        return merges
+
+class ProductRegistry:
+    """Assigns each product a stable integer ID; the name is a mutable attribute of the ID
+    
+    In-memory collections and indexes are keyed by ID, so each name is stored
+    once and renaming a product is a single update here.
+    """
+    
+    def __init__(self):
+        # ID -> name, or None once the product is removed; IDs are never reused
+        self.names = []
+        self.ids = {}
+    
+    def id_of(self, name):
+        """Return a product's ID, or None if it is not registered"""
+        return self.ids.get(name)
+    
+    def register(self, name):
+        """Return a product's ID, registering it on first use"""
+        product_id = self.ids.get(name)
+        if product_id is None:
+            product_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return product_id
+    
+    def rename(self, old_name, new_name):
+        """Give a product a new name, keeping its ID"""
+        product_id = self.ids.pop(old_name)
+        self.ids[new_name] = product_id
+        self.names[product_id] = new_name
+    
+    def remove(self, name):
+        """Forget a product that no collection refers to any more"""
+        product_id = self.ids.pop(name, None)
+        if product_id is not None:
+            self.names[product_id] = None
+
+class ProductCatalog:
+    """Columnar per-product attributes, one row per product ID
+    
+    Prices and category and supplier codes are typed NumPy arrays and
+    barcodes an object array, each with a mask of which products have a value,
+    so table views and bulk updates are column operations. Each attribute is
+    also exposed by name through a CatalogColumn mapping for existing code.
+    """
+    
+    # Persisted collection -> column
+    COLUMNS = {
+        'product_prices': 'price',
+        'product_barcodes': 'barcode',
+        'product_suppliers': 'supplier',
+        'product_categories': 'category',
+    }
+    # Columns stored as int32 codes into a table of distinct strings
+    CODED = ('supplier', 'category')
+    
+    def __init__(self, registry, capacity=1024):
+        self.registry = registry
+        self.arrays = {
+            'price': np.full(capacity, np.nan),
+            'barcode': np.full(capacity, None, dtype=object),
+            'supplier': np.full(capacity, -1, dtype=np.int32),
+            'category': np.full(capacity, -1, dtype=np.int32),
+        }
+        self.present = {column: np.zeros(capacity, dtype=bool) for column in self.arrays}
+        # Coded column -> (code -> value list, value -> code dict)
+        self.tables = {column: ([], {}) for column in self.CODED}
+    
+    def ensure(self, product_id):
+        """Grow the columns so they have a row for product_id"""
+        capacity = len(self.present['price'])
+        if product_id < capacity:
+            return
+        while capacity <= product_id:
+            capacity *= 2
+        for column, array in self.arrays.items():
+            grown = np.full(capacity, self.empty(column), dtype=array.dtype)
+            grown[:len(array)] = array
+            self.arrays[column] = grown
+            present = np.zeros(capacity, dtype=bool)
+            present[:len(self.present[column])] = self.present[column]
+            self.present[column] = present
+    
+    @staticmethod
+    def empty(column):
+        """Return the fill value for rows without a value in a column"""
+        return {'price': np.nan, 'barcode': None, 'supplier': -1, 'category': -1}[column]
+    
+    def code(self, column, value):
+        """Return the code of a value in a coded column, adding it to the table if new"""
+        values, codes = self.tables[column]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+    
+    def get(self, column, product_id):
+        """Return one value as a plain Python object"""
+        value = self.arrays[column][product_id]
+        if column in self.CODED:
+            return self.tables[column][0][value]
+        if column == 'price':
+            return float(value)
+        return value
+    
+    def set(self, column, product_id, value):
+        """Store one value"""
+        self.ensure(product_id)
+        self.arrays[column][product_id] = self.code(column, value) if column in self.CODED else value
+        self.present[column][product_id] = True
+    
+    def has(self, column, product_id):
+        """Check whether a product has a value in a column"""
+        return product_id < len(self.present[column]) and bool(self.present[column][product_id])
+    
+    def discard(self, column, product_id):
+        """Clear a product's value in a column"""
+        if product_id < len(self.present[column]):
+            self.present[column][product_id] = False
+            self.arrays[column][product_id] = self.empty(column)
+    
+    def ids_with(self, column):
+        """Return the IDs of products with a value in a column"""
+        return np.flatnonzero(self.present[column][:len(self.registry.names)])
+    
+    def load(self, column, data):
+        """Replace a column with the contents of a name-keyed dict loaded from storage
+        
+        The column is built in new arrays and swapped in whole, so readers
+        never see it half loaded.
+        """
+        ids = self.ids(list(data), register=True)
+        self.ensure(int(ids.max()) if len(ids) else 0)
+        values = list(data.values())
+        if column in self.CODED:
+            values = [self.code(column, value) for value in values]
+        array = np.full(len(self.arrays[column]), self.empty(column), dtype=self.arrays[column].dtype)
+        present = np.zeros(len(array), dtype=bool)
+        if len(ids):
+            array[ids] = values
+            present[ids] = True
+        self.arrays[column], self.present[column] = array, present
+    
+    def ids(self, names, register=False):
+        """Return product IDs for names as an array (-1 for unknown names unless registering)"""
+        lookup = self.registry.register if register else (lambda name: self.registry.ids.get(name, -1))
+        return np.fromiter((lookup(name) for name in names), dtype=np.intp, count=len(names))
+    
+    def values(self, column, names):
+        """Return a column's raw values for a list of names (NaN prices where unset)"""
+        self.ensure(len(self.registry.names))
+        ids = self.ids(names)
+        known = ids >= 0
+        values = np.full(len(names), self.empty(column), dtype=self.arrays[column].dtype)
+        values[known] = self.arrays[column][ids[known]]
+        if column == 'price':
+            values[known & ~self.present[column][np.where(known, ids, 0)]] = np.nan
+        return values
+    
+    def assign(self, column, names, values):
+        """Set a column for many products at once"""
+        ids = self.ids(names, register=True)
+        if len(ids):
+            self.ensure(int(ids.max()))
+        if column in self.CODED:
+            values = [self.code(column, value) for value in values]
+        self.arrays[column][ids] = values
+        self.present[column][ids] = True
+    
+    def row(self, name):
+        """Return a row view of one product, or None if it is unknown"""
+        product_id = self.registry.ids.get(name)
+        return None if product_id is None else ProductRow(self, product_id)
+    
+    def column(self, collection):
+        """Return the name-keyed mapping view of a persisted collection"""
+        return CatalogColumn(self, self.COLUMNS[collection])
+    
+    def to_frame(self, names=None):
+        """Return the catalog, or the given products, as a DataFrame
+        
+        For the full catalog, prices and barcodes are handed to pandas as views of
+        the column arrays; the rows of removed products are masked out, which
+        copies the frame, only when there are any.
+        """
+        self.ensure(len(self.registry.names))
+        if names is None:
+            ids = slice(0, len(self.registry.names))
+            product_names = np.array(self.registry.names, dtype=object)
+            known = True
+        else:
+            ids = self.ids(names)
+            product_names = np.array(names, dtype=object)
+            known = ids >= 0
+            ids = np.where(known, ids, 0)
+        frame = {'Product': product_names}
+        for column, array in self.arrays.items():
+            present = self.present[column][ids] & known
+            if column in self.CODED:
+                codes = np.where(present, array[ids], -1)
+                frame[column.title()] = pd.Categorical.from_codes(codes, categories=pd.Index(self.tables[column][0]))
+            elif names is None:
+                frame[column.title()] = array[ids]
+            else:
+                frame[column.title()] = np.where(present, array[ids], self.empty(column))
+        frame = pd.DataFrame(frame, copy=False)
+        if names is None and None in self.registry.names:
+            frame = frame[frame['Product'].notna()]
+        return frame
+    
+    def update_from_frame(self, frame, columns=('price',)):
+        """Write edited columns of a to_frame DataFrame back to the catalog"""
+        names = frame['Product'].tolist()
+        for column in columns:
+            self.assign(column, names, frame[column.title()].to_numpy())
+
+class ProductRow:
+    """Lightweight view of one product's row in a ProductCatalog"""
+    
+    __slots__ = ('catalog', 'product_id')
+    
+    def __init__(self, catalog, product_id):
+        self.catalog = catalog
+        self.product_id = product_id
+    
+    def value(self, column, default=None):
+        """Return a column's value for this product, or default if it has none"""
+        if not self.catalog.has(column, self.product_id):
+            return default
+        return self.catalog.get(column, self.product_id)
+    
+    @property
+    def name(self):
+        return self.catalog.registry.names[self.product_id]
+    
+    @property
+    def price(self):
+        return self.value('price')
+    
+    @property
+    def category(self):
+        return self.value('category', "Uncategorized")
+    
+    @property
+    def supplier(self):
+        return self.value('supplier')
+    
+    @property
+    def barcode(self):
+        return self.value('barcode')
+
+class CatalogColumn(MutableMapping):
+    """One ProductCatalog column, read and written by product name"""
+    
+    def __init__(self, catalog, column):
+        self.catalog = catalog
+        self.column = column
+    
+    def __getitem__(self, name):
+        product_id = self.catalog.registry.ids.get(name)
+        if product_id is None or not self.catalog.has(self.column, product_id):
+            raise KeyError(name)
+        return self.catalog.get(self.column, product_id)
+    
+    def __setitem__(self, name, value):
+        self.catalog.set(self.column, self.catalog.registry.register(name), value)
+    
+    def __delitem__(self, name):
+        product_id = self.catalog.registry.ids.get(name)
+        if product_id is None or not self.catalog.has(self.column, product_id):
+            raise KeyError(name)
+        self.catalog.discard(self.column, product_id)
+    
+    def __contains__(self, name):
+        product_id = self.catalog.registry.ids.get(name)
+        return product_id is not None and self.catalog.has(self.column, product_id)
+    
+    def __iter__(self):
+        names = self.catalog.registry.names
+        return (names[product_id] for product_id in self.catalog.ids_with(self.column).tolist())
+    
+    def __len__(self):
+        return len(self.catalog.ids_with(self.column))
+    
+    def __repr__(self):
+        return f"CatalogColumn({self.column!r}, {self.to_dict()!r})"
+    
+    def to_dict(self, keys=None):
+        """Return a plain name-keyed dict, limited to keys when given, for saving"""
+        if keys is None:
+            names = self.catalog.registry.names
+            return {names[product_id]: self.catalog.get(self.column, product_id)
+                    for product_id in self.catalog.ids_with(self.column).tolist()}
+        return {name: self[name] for name in keys if name in self}
+
+class Assortment:
+    """A store's products with set membership and stable display order
+    
+    Products are held by ID and keep the order they were added in, while
+    membership tests, adds and removals are O(1). Saved to storage as a
+    plain list of product names.
+    """
+    
+    __slots__ = ('registry', 'product_ids')
+    
+    def __init__(self, registry, products=()):
+        self.registry = registry
+        self.product_ids = dict.fromkeys(registry.register(product) for product in products)
+    
+    def __contains__(self, product):
+        product_id = self.registry.ids.get(product)
+        return product_id is not None and product_id in self.product_ids
+    
+    def __iter__(self):
+        names = self.registry.names
+        return (names[product_id] for product_id in self.product_ids)
+    
+    def __len__(self):
+        return len(self.product_ids)
+    
+    def __repr__(self):
+        return f"Assortment({list(self)!r})"
+    
+    def copy(self):
+        """Return an independent assortment with the same products"""
+        assortment = Assortment(self.registry)
+        assortment.product_ids = dict(self.product_ids)
+        return assortment
+    
+    def add(self, product):
+        """Add a product at the end of the display order; returns False if already present"""
+        product_id = self.registry.register(product)
+        if product_id in self.product_ids:
+            return False
+        self.product_ids[product_id] = None
+        return True
+    
+    def discard(self, product):
+        """Remove a product if present; returns False if it wasn't there"""
+        product_id = self.registry.ids.get(product)
+        if product_id is None or product_id not in self.product_ids:
+            return False
+        del self.product_ids[product_id]
+        return True
+
+class ProductLocationIndex:
+    """Inverted index from product ID to the set of stores that carry it
+    
+    Built once from store_data and kept in step by StockManager's mutation
+    methods, so availability lookups don't scan every store's list.
+    """
+    
+    def __init__(self, store_data, registry):
+        self.registry = registry
+        # Store name -> position, to report locations in the stores' display order
+        self.store_positions = {store: i for i, store in enumerate(store_data)}
+        self.product_stores = {}
+        for store, products in store_data.items():
+            for product_id in products.product_ids:
+                self.product_stores.setdefault(product_id, set()).add(store)
+    
+    def stores_for(self, product):
+        """Return the set of stores carrying a product"""
+        return self.product_stores.get(self.registry.ids.get(product), set())
+    
+    def locations(self, product):
+        """Return the stores carrying a product in store display order"""
+        return sorted(self.stores_for(product), key=self.store_positions.__getitem__)
+    
+    def products(self):
+        """Return every product carried by at least one store"""
+        names = self.registry.names
+        return [names[product_id] for product_id in self.product_stores]
+    
+    def add_store(self, store):
+        """Register a new, empty store"""
+        self.store_positions.setdefault(store, len(self.store_positions))
+    
+    def add(self, product, store):
+        """Record that a store carries a product"""
+        self.product_stores.setdefault(self.registry.register(product), set()).add(store)
+    
+    def discard(self, product, store):
+        """Record that a store no longer carries a product"""
+        product_id = self.registry.ids.get(product)
+        stores = self.product_stores.get(product_id)
+        if stores is not None:
+            stores.discard(store)
+            if not stores:
+                del self.product_stores[product_id]
+
+class OrderedProducts(Sequence):
+    """Product names kept in sorted order, shared by every selectbox and product list
+    
+    Names live in short sorted chunks with a Fenwick tree over the chunk
+    lengths, so inserts and deletes only shift one chunk and rank and range
+    queries are a bisect plus a tree walk instead of a full re-sort.
+    """
+    
+    CHUNK_SIZE = 512
+    
+    def __init__(self, products=()):
+        self.names = set(products)
+        ordered = sorted(self.names)
+        self.chunks = [ordered[i:i + self.CHUNK_SIZE] for i in range(0, len(ordered), self.CHUNK_SIZE)]
+        self.reindex()
+    
+    def reindex(self):
+        """Rebuild the chunk maxima and the Fenwick tree after chunks split or empty"""
+        self.maxes = [chunk[-1] for chunk in self.chunks]
+        self.tree = [0] * (len(self.chunks) + 1)
+        for i, chunk in enumerate(self.chunks, 1):
+            self.tree[i] += len(chunk)
+            parent = i + (i & -i)
+            if parent <= len(self.chunks):
+                self.tree[parent] += self.tree[i]
+        self.flat = None
+    
+    def bump(self, chunk_index, delta):
+        """Adjust one chunk's length in the Fenwick tree"""
+        i = chunk_index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+        self.flat = None
+    
+    def offset(self, chunk_index):
+        """Return the number of names in the chunks before chunk_index"""
+        total = 0
+        i = chunk_index
+        while i:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+    
+    def locate(self, position):
+        """Return (chunk index, position within it) for a rank"""
+        chunk_index = 0
+        step = 1 << len(self.chunks).bit_length()
+        while step:
+            following = chunk_index + step
+            if following <= len(self.chunks) and self.tree[following] <= position:
+                chunk_index = following
+                position -= self.tree[following]
+            step >>= 1
+        return chunk_index, position
+    
+    def add(self, name):
+        """Insert a name; returns False if it was already present"""
+        if name in self.names:
+            return False
+        self.names.add(name)
+        if not self.chunks:
+            self.chunks.append([name])
+            self.reindex()
+            return True
+        chunk_index = min(bisect.bisect_left(self.maxes, name), len(self.chunks) - 1)
+        chunk = self.chunks[chunk_index]
+        bisect.insort(chunk, name)
+        self.maxes[chunk_index] = chunk[-1]
+        if len(chunk) > 2 * self.CHUNK_SIZE:
+            self.chunks[chunk_index:chunk_index + 1] = [chunk[:self.CHUNK_SIZE], chunk[self.CHUNK_SIZE:]]
+            self.reindex()
+        else:
+            self.bump(chunk_index, 1)
+        return True
+    
+    def discard(self, name):
+        """Remove a name; returns False if it wasn't present"""
+        if name not in self.names:
+            return False
+        self.names.discard(name)
+        chunk_index = bisect.bisect_left(self.maxes, name)
+        chunk = self.chunks[chunk_index]
+        del chunk[bisect.bisect_left(chunk, name)]
+        if chunk:
+            self.maxes[chunk_index] = chunk[-1]
+            self.bump(chunk_index, -1)
+        else:
+            del self.chunks[chunk_index]
+            self.reindex()
+        return True
+    
+    def rename(self, old_name, new_name):
+        """Move a name to its new sorted position"""
+        if self.discard(old_name):
+            self.add(new_name)
+    
+    def bisect_left(self, name):
+        """Return the rank name has, or would have, in the sorted order"""
+        chunk_index = bisect.bisect_left(self.maxes, name)
+        if chunk_index == len(self.chunks):
+            return len(self.names)
+        return self.offset(chunk_index) + bisect.bisect_left(self.chunks[chunk_index], name)
+    
+    def index(self, name, start=0, stop=None):
+        """Return the rank of a name, raising ValueError if it is absent"""
+        if name not in self.names:
+            raise ValueError(f"{name!r} is not in the product list")
+        return self.bisect_left(name)
+    
+    def irange(self, minimum=None, maximum=None):
+        """Return the names between minimum and maximum, both inclusive, in order"""
+        start = 0 if minimum is None else self.bisect_left(minimum)
+        stop = len(self.names) if maximum is None else self.bisect_left(maximum) + (maximum in self.names)
+        return self[start:stop]
+    
+    def prefixed(self, prefix):
+        """Return the names starting with prefix, in order"""
+        start = self.bisect_left(prefix)
+        stop = self.bisect_left(prefix + '\U0010ffff')
+        return self[start:stop]
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def __contains__(self, name):
+        return name in self.names
+    
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield from chunk
+    
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            start, stop, step = position.indices(len(self.names))
+            if step != 1:
+                return self.as_list()[position]
+            if start >= stop:
+                return []
+            chunk_index, offset = self.locate(start)
+            result = []
+            remaining = stop - start
+            while remaining > 0:
+                taken = self.chunks[chunk_index][offset:offset + remaining]
+                result.extend(taken)
+                remaining -= len(taken)
+                chunk_index, offset = chunk_index + 1, 0
+            return result
+        if position < 0:
+            position += len(self.names)
+        if not 0 <= position < len(self.names):
+            raise IndexError("product list index out of range")
+        chunk_index, offset = self.locate(position)
+        return self.chunks[chunk_index][offset]
+    
+    def as_list(self):
+        """Return every name in order as a plain list, reused until the next change"""
+        if self.flat is None:
+            self.flat = [name for chunk in self.chunks for name in chunk]
+        return self.flat
+
+class AvailabilityMatrix:
+    """Dense store-by-product availability matrix for vectorized statistics
+    
+    Rows follow the stores' display order; columns are handed out to product
+    IDs as they appear and reused once a product is carried nowhere. Kept in
+    step with the assortments by StockManager's mutation methods.
+    """
+    
+    def __init__(self, store_data, registry):
+        self.registry = registry
+        self.stores = list(store_data)
+        self.store_index = {store: i for i, store in enumerate(self.stores)}
+        # Column -> product ID, or None for a free column
+        self.products = list(dict.fromkeys(
+            product_id for products in store_data.values() for product_id in products.product_ids))
+        self.product_index = {product_id: j for j, product_id in enumerate(self.products)}
+        self.free = []
+        self.matrix = np.zeros((len(self.stores), max(len(self.products), 64)), dtype=bool)
+        for store, products in store_data.items():
+            self.matrix[self.store_index[store], [self.product_index[product_id] for product_id in products.product_ids]] = True
+    
+    def column(self, product_id):
+        """Return a product's column, assigning one if it has none yet"""
+        j = self.product_index.get(product_id)
+        if j is not None:
+            return j
+        if self.free:
+            j = self.free.pop()
+            self.products[j] = product_id
+        else:
+            j = len(self.products)
+            self.products.append(product_id)
+            if j == self.matrix.shape[1]:
+                grown = np.zeros((self.matrix.shape[0], j * 2), dtype=bool)
+                grown[:, :j] = self.matrix
+                self.matrix = grown
+        self.product_index[product_id] = j
+        return j
+    
+    def add_store(self, store):
+        """Add an empty row for a new store"""
+        if store in self.store_index:
+            return
+        self.store_index[store] = len(self.stores)
+        self.stores.append(store)
+        self.matrix = np.vstack([self.matrix, np.zeros((1, self.matrix.shape[1]), dtype=bool)])
+    
+    def add(self, product, store):
+        """Mark a product as available in a store"""
+        j = self.column(self.registry.register(product))
+        self.matrix[self.store_index[store], j] = True
+    
+    def discard(self, product, store):
+        """Mark a product as unavailable in a store, freeing its column once no store carries it"""
+        product_id = self.registry.ids.get(product)
+        j = self.product_index.get(product_id)
+        if j is None:
+            return
+        self.matrix[self.store_index[store], j] = False
+        if not self.matrix[:, j].any():
+            del self.product_index[product_id]
+            self.products[j] = None
+            self.free.append(j)
+    
+    def active_columns(self):
+        """Return the columns currently assigned to products"""
+        return np.fromiter(self.product_index.values(), dtype=np.intp, count=len(self.product_index))
+    
+    def store_counts(self):
+        """Return the number of products carried by each store, in store order"""
+        return self.matrix.sum(axis=1)
+    
+    def product_coverage(self):
+        """Return product -> number of stores carrying it"""
+        columns = self.active_columns()
+        names = self.registry.names
+        return dict(zip((names[product_id] for product_id in self.product_index),
+                        self.matrix[:, columns].sum(axis=0).tolist()))
+    
+    def category_coverage(self, catalog):
+        """Return category -> share of store/product slots in that category that are stocked"""
+        columns = self.active_columns()
+        if not len(columns) or not self.stores:
+            return {}
+        catalog.ensure(len(self.registry.names))
+        product_ids = np.fromiter(self.product_index, dtype=np.intp, count=len(self.product_index))
+        category_codes = np.where(catalog.present['category'][product_ids], catalog.arrays['category'][product_ids], -1)
+        # Code -1 (no category) picks the trailing "Uncategorized" label
+        labels = np.array(catalog.tables['category'][0] + ["Uncategorized"], dtype=object)[category_codes]
+        names, codes = np.unique(labels.astype(str), return_inverse=True)
+        stocked = np.bincount(codes, weights=self.matrix[:, columns].sum(axis=0))
+        slots = np.bincount(codes) * len(self.stores)
+        return dict(zip(names.tolist(), (stocked / slots).tolist()))
+    
+    def stores_missing(self, product):
+        """Return the stores that do not carry a product, in store order"""
+        j = self.product_index.get(self.registry.ids.get(product))
+        if j is None:
+            return list(self.stores)
+        return [self.stores[i] for i in np.flatnonzero(~self.matrix[:, j])]
+
+class StoreStock:
+    """Units on hand per store and product, as a store-by-product int32 matrix
+    
+    Rows are stores, added as they first get stock; columns are product IDs
+    like ProductCatalog's arrays, so renames are free, a cell update is a
+    single store and totals are NumPy reductions. Persisted as
+    {store: {product: quantity}} with zero quantities left out.
+    """
+    
+    CSV_HEADER = ['Store', 'Product', 'Quantity']
+    
+    def __init__(self, registry, data=None):
+        self.registry = registry
+        data = data or {}
+        self.stores = list(data)
+        self.store_index = {store: i for i, store in enumerate(self.stores)}
+        self.matrix = np.zeros((len(self.stores), 1024), dtype=np.int32)
+        for store, quantities in data.items():
+            product_ids = [registry.register(product) for product in quantities]
+            self.ensure(len(registry.names))
+            self.matrix[self.store_index[store], product_ids] = list(quantities.values())
+    
+    @staticmethod
+    def spread(total, count):
+        """Split a quantity into count near-equal whole shares, larger shares first"""
+        if count <= 0:
+            return []
+        share, extra = divmod(int(total), count)
+        return [share + 1] * extra + [share] * (count - extra)
+    
+    def ensure(self, count):
+        """Grow the columns so there is one for each of count product IDs"""
+        capacity = self.matrix.shape[1]
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        grown = np.zeros((self.matrix.shape[0], capacity), dtype=np.int32)
+        grown[:, :self.matrix.shape[1]] = self.matrix
+        self.matrix = grown
+    
+    def add_store(self, store):
+        """Add an empty row for a new store"""
+        if store in self.store_index:
+            return
+        self.store_index[store] = len(self.stores)
+        self.stores.append(store)
+        self.matrix = np.vstack([self.matrix, np.zeros((1, self.matrix.shape[1]), dtype=np.int32)])
+    
+    def get(self, store, product):
+        """Return the units of a product held by one store"""
+        row = self.store_index.get(store)
+        product_id = self.registry.ids.get(product)
+        if row is None or product_id is None or product_id >= self.matrix.shape[1]:
+            return 0
+        return int(self.matrix[row, product_id])
+    
+    def set(self, store, product, quantity):
+        """Record the units of a product held by one store"""
+        self.add_store(store)
+        product_id = self.registry.register(product)
+        self.ensure(product_id + 1)
+        self.matrix[self.store_index[store], product_id] = quantity
+    
+    def quantities(self, store, product_ids):
+        """Return one store's units of each of an array of product IDs"""
+        row = self.store_index.get(store)
+        if row is None or not len(product_ids):
+            return np.zeros(len(product_ids), dtype=np.int32)
+        self.ensure(int(product_ids.max()) + 1)
+        return self.matrix[row, product_ids]
+    
+    def column(self, product):
+        """Return a product's quantities in store order, or None if it has no column"""
+        product_id = self.registry.ids.get(product)
+        if product_id is None or product_id >= self.matrix.shape[1]:
+            return None
+        return self.matrix[:, product_id]
+    
+    def by_store(self, product):
+        """Return store -> units of a product, for the stores holding any"""
+        column = self.column(product)
+        if column is None:
+            return {}
+        rows = np.flatnonzero(column)
+        return dict(zip((self.stores[i] for i in rows.tolist()), column[rows].tolist()))
+    
+    def totals(self, product_ids):
+        """Return the units across all stores of each of an array of product IDs (0 for -1)"""
+        if not len(product_ids):
+            return np.zeros(0, dtype=np.int64)
+        self.ensure(int(product_ids.max()) + 1)
+        totals = self.matrix[:, np.maximum(product_ids, 0)].sum(axis=0, dtype=np.int64)
+        return np.where(product_ids >= 0, totals, 0)
+    
+    def total(self, product):
+        """Return the units of a product across all stores"""
+        column = self.column(product)
+        return 0 if column is None else int(column.sum(dtype=np.int64))
+    
+    def store_totals(self):
+        """Return store -> units of every product it holds"""
+        return dict(zip(self.stores, self.matrix.sum(axis=1, dtype=np.int64).tolist()))
+    
+    def category_totals(self, catalog, store=None):
+        """Return category -> units on hand, in one store or across all of them"""
+        count = min(len(self.registry.names), self.matrix.shape[1])
+        if store is None:
+            units = self.matrix[:, :count].sum(axis=0, dtype=np.int64)
+        elif store in self.store_index:
+            units = self.matrix[self.store_index[store], :count].astype(np.int64)
+        else:
+            return {}
+        product_ids = np.flatnonzero(units)
+        if not len(product_ids):
+            return {}
+        catalog.ensure(count)
+        category_codes = np.where(catalog.present['category'][product_ids], catalog.arrays['category'][product_ids], -1)
+        # Code -1 (no category) picks the trailing "Uncategorized" label
+        labels = np.array(catalog.tables['category'][0] + ["Uncategorized"], dtype=object)[category_codes]
+        names, codes = np.unique(labels.astype(str), return_inverse=True)
+        return dict(zip(names.tolist(), np.bincount(codes, weights=units[product_ids]).astype(np.int64).tolist()))
+    
+    def clear(self, product):
+        """Zero a product in every store; returns the stores that held any"""
+        column = self.column(product)
+        if column is None:
+            return []
+        rows = np.flatnonzero(column)
+        column[rows] = 0
+        return [self.stores[i] for i in rows.tolist()]
+    
+    def move(self, source, target):
+        """Add a product's units to another product's in every store; returns the stores changed"""
+        column = self.column(source)
+        if column is None or not column.any():
+            return []
+        target_id = self.registry.register(target)
+        self.ensure(target_id + 1)
+        column = self.column(source)
+        self.matrix[:, target_id] += column
+        return self.clear(source)
+    
+    def to_dict(self, stores=None):
+        """Return a plain {store: {product: quantity}} dict, limited to stores when given, for saving"""
+        names = self.registry.names
+        data = {}
+        for store in (self.stores if stores is None else stores):
+            row = self.store_index.get(store)
+            if row is None:
+                continue
+            quantities = self.matrix[row]
+            product_ids = np.flatnonzero(quantities)
+            data[store] = {names[product_id]: quantity
+                           for product_id, quantity in zip(product_ids.tolist(), quantities[product_ids].tolist())
+                           if names[product_id] is not None}
+        return data
+    
+    def to_csv(self):
+        """Return every non-zero quantity as CSV text with a Store, Product, Quantity header"""
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(self.CSV_HEADER)
+        for store, quantities in self.to_dict().items():
+            writer.writerows((store, product, quantity) for product, quantity in quantities.items())
+        return output.getvalue()
+    
+    @classmethod
+    def parse_csv(cls, text):
+        """Read (store, product, quantity) rows from CSV text written by to_csv
+        
+        Raises ValueError on a missing header or a quantity that is not a
+        non-negative whole number.
+        """
+        reader = csv.reader(StringIO(text))
+        if [cell.strip() for cell in next(reader, [])] != cls.CSV_HEADER:
+            raise ValueError(f"expected a header of {', '.join(cls.CSV_HEADER)}")
+        rows = []
+        for line, record in enumerate(reader, 2):
+            if not any(cell.strip() for cell in record):
+                continue
+            if len(record) != 3 or not record[2].strip().isdigit():
+                raise ValueError(f"line {line}: expected store, product and a whole quantity")
+            rows.append((record[0].strip(), record[1].strip(), int(record[2])))
+        return rows
+
+class ReorderPoints:
+    """Reorder points per product, with optional per-store overrides, and order pack sizes
+    
+    A store's point for a product is its override if set, else the
+    product's point, else DEFAULT. Product points and pack sizes are int32
+    arrays by product ID (-1 for unset) so they can be looked up for many
+    products at once. Persisted as
+    {product: {'default': n, 'stores': {store: n}, 'pack': n}}.
+    """
+    
+    DEFAULT = 10
+    
+    def __init__(self, registry, data=None):
+        self.registry = registry
+        self.defaults = np.full(1024, -1, dtype=np.int32)
+        self.packs = np.full(1024, -1, dtype=np.int32)
+        # Product ID -> {store: point}
+        self.overrides = {}
+        for product, points in (data or {}).items():
+            product_id = registry.register(product)
+            self.ensure(product_id + 1)
+            if points.get('default') is not None:
+                self.defaults[product_id] = points['default']
+            if points.get('stores'):
+                self.overrides[product_id] = dict(points['stores'])
+            if points.get('pack') is not None:
+                self.packs[product_id] = points['pack']
+    
+    def ensure(self, count):
+        """Grow the product points and pack sizes so there is one for each of count product IDs"""
+        capacity = len(self.defaults)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        for name in ('defaults', 'packs'):
+            values = getattr(self, name)
+            grown = np.full(capacity, -1, dtype=np.int32)
+            grown[:len(values)] = values
+            setattr(self, name, grown)
+    
+    def get(self, product, store=None):
+        """Return the reorder point of a product, in one store or chain-wide"""
+        product_id = self.registry.ids.get(product)
+        if product_id is None:
+            return self.DEFAULT
+        if store is not None and store in self.overrides.get(product_id, {}):
+            return self.overrides[product_id][store]
+        if product_id < len(self.defaults) and self.defaults[product_id] >= 0:
+            return int(self.defaults[product_id])
+        return self.DEFAULT
+    
+    def pack(self, product):
+        """Return the number of units a product is ordered in multiples of"""
+        product_id = self.registry.ids.get(product)
+        if product_id is None or product_id >= len(self.packs) or self.packs[product_id] < 1:
+            return 1
+        return int(self.packs[product_id])
+    
+    def set_pack(self, product, units):
+        """Set the number of units a product is ordered in multiples of"""
+        product_id = self.registry.register(product)
+        self.ensure(product_id + 1)
+        self.packs[product_id] = units
+    
+    def pack_sizes(self, product_ids):
+        """Return the pack sizes of an array of product IDs, 1 where unset"""
+        if not len(product_ids):
+            return np.ones(0, dtype=np.int32)
+        self.ensure(int(product_ids.max()) + 1)
+        packs = self.packs[product_ids]
+        return np.where(packs >= 1, packs, 1)
+    
+    def points(self, store, product_ids):
+        """Return one store's reorder points for an array of product IDs"""
+        if not len(product_ids):
+            return np.zeros(0, dtype=np.int32)
+        self.ensure(int(product_ids.max()) + 1)
+        points = self.defaults[product_ids]
+        points = np.where(points >= 0, points, self.DEFAULT)
+        if self.overrides:
+            # Only visit the products that have per-store points at all
+            overridden = np.fromiter(self.overrides, dtype=product_ids.dtype, count=len(self.overrides))
+            for i in np.flatnonzero(np.isin(product_ids, overridden)).tolist():
+                points[i] = self.overrides[int(product_ids[i])].get(store, points[i])
+        return points
+    
+    def set(self, product, point, store=None):
+        """Set a product's reorder point for one store, or its chain-wide point"""
+        product_id = self.registry.register(product)
+        if store is None:
+            self.ensure(product_id + 1)
+            self.defaults[product_id] = point
+        else:
+            self.overrides.setdefault(product_id, {})[store] = point
+    
+    def clear(self, product, store=None):
+        """Drop a product's override for one store, or all of its points"""
+        product_id = self.registry.ids.get(product)
+        if product_id is None:
+            return
+        if store is not None:
+            self.overrides.get(product_id, {}).pop(store, None)
+            return
+        if product_id < len(self.defaults):
+            self.defaults[product_id] = -1
+            self.packs[product_id] = -1
+        self.overrides.pop(product_id, None)
+    
+    def move(self, source, target):
+        """Give target the source's points where it has none of its own, then drop the source's"""
+        source_id = self.registry.ids.get(source)
+        if source_id is None:
+            return
+        target_id = self.registry.register(target)
+        self.ensure(max(source_id, target_id) + 1)
+        if self.defaults[target_id] < 0:
+            self.defaults[target_id] = self.defaults[source_id]
+        if self.packs[target_id] < 0:
+            self.packs[target_id] = self.packs[source_id]
+        for store, point in self.overrides.get(source_id, {}).items():
+            self.overrides.setdefault(target_id, {}).setdefault(store, point)
+        self.clear(source)
+    
+    def to_dict(self, keys=None):
+        """Return a plain name-keyed dict, limited to keys when given, for saving"""
+        names = self.registry.names
+        if keys is None:
+            product_ids = (set(np.flatnonzero(self.defaults >= 0).tolist()) | set(self.overrides)
+                           | set(np.flatnonzero(self.packs >= 0).tolist()))
+        else:
+            product_ids = {self.registry.ids[name] for name in keys if name in self.registry.ids}
+        data = {}
+        for product_id in sorted(product_ids):
+            points = {}
+            if product_id < len(self.defaults) and self.defaults[product_id] >= 0:
+                points['default'] = int(self.defaults[product_id])
+            if self.overrides.get(product_id):
+                points['stores'] = dict(self.overrides[product_id])
+            if product_id < len(self.packs) and self.packs[product_id] >= 0:
+                points['pack'] = int(self.packs[product_id])
+            if points and names[product_id] is not None:
+                data[names[product_id]] = points
+        return data
+
+class LowStockIndex:
+    """Store/product slots at or below their reorder point, bucketed by store
+    
+    Built with one vectorized comparison per store, then kept in step by
+    StockManager's stock, assortment and reorder point writes, so listing
+    the k current alerts costs O(k) however large the catalog is.
+    """
+    
+    def __init__(self, store_data, stock, points):
+        self.stock = stock
+        self.points = points
+        self.registry = points.registry
+        # Store -> {product ID: reorder point} for empty slots and {product ID: (units, point)} for low ones
+        self.out = {}
+        self.low = {}
+        for store, products in store_data.items():
+            product_ids = np.fromiter(products.product_ids, dtype=np.intp, count=len(products))
+            quantities = stock.quantities(store, product_ids)
+            store_points = points.points(store, product_ids)
+            empty = quantities == 0
+            low = ~empty & (quantities <= store_points)
+            self.out[store] = dict(zip(product_ids[empty].tolist(), store_points[empty].tolist()))
+            self.low[store] = dict(zip(product_ids[low].tolist(),
+                                       zip(quantities[low].tolist(), store_points[low].tolist())))
+    
+    def update(self, store, product, carried=True):
+        """Re-check one store's slot for a product after its stock, point or assortment changed"""
+        product_id = self.registry.ids.get(product)
+        if product_id is None:
+            return
+        out = self.out.setdefault(store, {})
+        low = self.low.setdefault(store, {})
+        out.pop(product_id, None)
+        low.pop(product_id, None)
+        if not carried:
+            return
+        quantity = self.stock.get(store, product)
+        point = self.points.get(product, store)
+        if quantity == 0:
+            out[product_id] = point
+        elif quantity <= point:
+            low[product_id] = (quantity, point)
+    
+    def counts(self, store=None):
+        """Return (out of stock, low stock) slot counts, in one store or all of them"""
+        stores = self.out if store is None else [store]
+        return (sum(len(self.out.get(store, ())) for store in stores),
+                sum(len(self.low.get(store, ())) for store in stores))
+    
+    def alerts(self, store=None, limit=None):
+        """Return (store, product, units, reorder point) alerts, empty slots first
+        
+        Stops after limit alerts, so the cost is O(k) in the alerts returned.
+        """
+        names = self.registry.names
+        stores = list(self.out) if store is None else [store]
+        found = []
+        for bucket in (self.out, self.low):
+            for store_name in stores:
+                for product_id, entry in bucket.get(store_name, {}).items():
+                    if limit is not None and len(found) >= limit:
+                        return found
+                    quantity, point = (0, entry) if bucket is self.out else entry
+                    found.append((store_name, names[product_id], quantity, point))
+        return found
+
+class ReorderPlanner:
+    """Suggested order quantities for every store and product of a supplier in one vectorized pass
+    
+    A store's product at or below its reorder point is topped up to twice
+    the point, or to the point plus the store's share of the product's
+    recent weekly demand (PO quantity or units out) if that is more. Units
+    on POs not yet due to the stores ordered for are netted off per product
+    and totals are rounded up to whole packs.
+    """
+    
+    DEFAULT_SUPPLIER = "PINNACLE FOODS (M) SDN BHD"
+    HISTORY_WEEKS = 8
+    
+    def __init__(self, catalog, availability, stock, points):
+        self.catalog = catalog
+        self.availability = availability
+        self.stock = stock
+        self.points = points
+    
+    @classmethod
+    def order_history(cls, purchase_orders, supplier, now=None, addresses=None):
+        """Return (product -> weekly units ordered recently, product -> units on POs due today or later)
+        
+        Given delivery addresses, only POs delivered to one of them count as
+        on order; the weekly units always cover the whole chain.
+        """
+        now = now or datetime.now()
+        since = (now - timedelta(weeks=cls.HISTORY_WEEKS)).isoformat()
+        today = now.date().isoformat()
+        ordered = {}
+        on_order = {}
+        for po_number, header in purchase_orders.headers().items():
+            if header.get('supplier') != supplier or (header.get('timestamp') or '') < since:
+                continue
+            po_data = purchase_orders.load(po_number)
+            if not po_data:
+                continue
+            pending = (po_data.get('delivery_date') or '') >= today and (
+                addresses is None or po_data.get('delivery_address') in addresses)
+            for item in po_data.get('items', []):
+                ordered[item['product']] = ordered.get(item['product'], 0) + item['quantity']
+                if pending:
+                    on_order[item['product']] = on_order.get(item['product'], 0) + item['quantity']
+        return {product: units / cls.HISTORY_WEEKS for product, units in ordered.items()}, on_order
+    
+    def supplier_ids(self, supplier):
+        """Return the IDs of carried products bought from a supplier, with their availability columns"""
+        product_ids = np.fromiter(self.availability.product_index, dtype=np.intp,
+                                  count=len(self.availability.product_index))
+        columns = np.fromiter(self.availability.product_index.values(), dtype=np.intp, count=len(product_ids))
+        if not len(product_ids):
+            return product_ids, columns
+        self.catalog.ensure(int(product_ids.max()))
+        codes = np.where(self.catalog.present['supplier'][product_ids], self.catalog.arrays['supplier'][product_ids], -1)
+        # Products without a supplier are bought from the default one, as in the product forms
+        code = self.catalog.tables['supplier'][1].get(supplier, -2)
+        matched = (codes == code) | ((codes == -1) & (supplier == self.DEFAULT_SUPPLIER))
+        return product_ids[matched], columns[matched]
+    
+    def suggest(self, supplier, stores, weekly=None, on_order=None):
+        """Return a DataFrame of products to order from a supplier for the given stores
+        
+        Columns are Product, Quantity, On Hand, Reorder Point, On Order, Pack
+        and Stores (how many of the stores need it), sorted by product.
+        """
+        columns = ['Product', 'Quantity', 'On Hand', 'Reorder Point', 'On Order', 'Pack', 'Stores']
+        product_ids, matrix_columns = self.supplier_ids(supplier)
+        stores = [store for store in stores if store in self.availability.store_index]
+        if not len(product_ids) or not stores:
+            return pd.DataFrame(columns=columns)
+        names = np.array(self.catalog.registry.names, dtype=object)[product_ids]
+        rows = [self.availability.store_index[store] for store in stores]
+        carried = self.availability.matrix[np.ix_(rows, matrix_columns)]
+        quantities = np.stack([self.stock.quantities(store, product_ids) for store in stores]).astype(np.int64)
+        points = np.stack([self.points.points(store, product_ids) for store in stores]).astype(np.int64)
+        # Spread each product's recent weekly demand over every store carrying it
+        weekly_units = np.array([(weekly or {}).get(name, 0.0) for name in names.tolist()])
+        carriers = np.maximum(self.availability.matrix[:, matrix_columns].sum(axis=0), 1)
+        level = np.maximum(2 * points, points + np.ceil(weekly_units / carriers).astype(np.int64))
+        needs = carried & (quantities <= points)
+        shortfall = np.where(needs, np.maximum(level - quantities, 0), 0)
+        pending = np.array([(on_order or {}).get(name, 0) for name in names.tolist()], dtype=np.int64)
+        totals = np.maximum(shortfall.sum(axis=0) - pending, 0)
+        packs = self.points.pack_sizes(product_ids).astype(np.int64)
+        totals = -(-totals // packs) * packs
+        wanted = np.flatnonzero(totals)
+        frame = pd.DataFrame({
+            'Product': names[wanted],
+            'Quantity': totals[wanted],
+            'On Hand': np.where(carried, quantities, 0).sum(axis=0)[wanted],
+            'Reorder Point': np.where(carried, points, 0).sum(axis=0)[wanted],
+            'On Order': pending[wanted],
+            'Pack': packs[wanted],
+            'Stores': needs.sum(axis=0)[wanted],
+        }, columns=columns)
+        return frame.sort_values('Product', ignore_index=True)
+
+class StockMovements:
+    """Daily and weekly stock movement totals per store and category, kept in dense arrays
+    
+    Every change to a store's stock is appended to a ledger as a movement
+    with a timestamp, product, store, signed delta, reason and user. This
+    tails the ledger and adds each movement's units to in/out counters
+    indexed by [day or week, store, category], so a question like "units
+    out per week per store for one category" reads buckets x stores
+    counters instead of replaying movements. Units out per week and product
+    are kept too, as the products' recent rate of use, by product ID from a
+    ProductRegistry, so the renames and merges logged in the ledger carry a
+    product's use over to its new name.
+    
+    Merges, removals from a store and migrated totals only move units
+    between names or books; they are kept in the ledger but not counted.
+    Movements count under the category the product had when they were
+    recorded. Weeks start on Monday.
+    """
+    
+    # Reasons a user can give for a stock change
+    REASONS = {'count': "Stock count", 'sale': "Sale", 'delivery': "Delivery", 'damage': "Damaged or expired"}
+    UNCOUNTED = ('merge', 'removed', 'migration')
+    UNCATEGORIZED = "Uncategorized"
+    # Period -> days per bucket
+    PERIODS = {'day': 1, 'week': 7}
+    DIRECTIONS = {'in': 0, 'out': 1}
+    
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.lock = threading.Lock()
+        self.start = None  # Monday of the earliest counted movement's week
+        self.stores, self.store_index = [], {}
+        self.categories, self.category_index = [], {}
+        self.registry = ProductRegistry()
+        # Product ID -> ID of the product it was merged into
+        self.merged = {}
+        # Period -> units in and out, indexed [bucket, store, category, direction]
+        self.buckets = {period: np.zeros((0, 0, 0, 2), dtype=np.int32) for period in self.PERIODS}
+        # (week, product ID, units out) rows, one per week and product seen
+        self.usage = np.zeros((1024, 3), dtype=np.int64)
+        self.usage_count = 0
+        self.usage_rows = {}
+        self.refresh()
+    
+    @staticmethod
+    def code(names, index, name):
+        """Return the position of a name in a growing table, appending it if new"""
+        position = index.get(name)
+        if position is None:
+            position = index[name] = len(names)
+            names.append(name)
+        return position
+    
+    def refresh(self):
+        """Count the movements appended to the ledger by any process since the last refresh"""
+        with self.lock:
+            self.add(self.ledger.read_new())
+    
+    def record(self, events):
+        """Append movements to the ledger and count them"""
+        self.ledger.append(events)
+        self.refresh()
+    
+    def add(self, events):
+        """Add movements' units to the day and week buckets and the weekly use of their products"""
+        counted, product_ids = [], []
+        for event in events:
+            if event.get('reason') == 'rename':
+                self.rename(event['product'], event['renamed'])
+            elif event.get('delta') and event.get('reason') not in self.UNCOUNTED:
+                counted.append(event)
+                product_ids.append(self.registry.register(event['product']))
+        if not counted:
+            return
+        days = {day: date.fromisoformat(day) for day in {event['t'][:10] for event in counted}}
+        first = min(days.values())
+        first -= timedelta(days=first.weekday())
+        if self.start is None:
+            self.start = first
+        elif first < self.start:
+            self.shift((self.start - first).days)
+        offsets = np.array([(days[event['t'][:10]] - self.start).days for event in counted], dtype=np.intp)
+        stores = np.array([self.code(self.stores, self.store_index, event['store']) for event in counted],
+                          dtype=np.intp)
+        categories = np.array([self.code(self.categories, self.category_index,
+                                         event.get('category') or self.UNCATEGORIZED) for event in counted],
+                              dtype=np.intp)
+        # A product merged later in this batch counts under the one it was merged into
+        products = np.array([self.merged.get(product_id, product_id) for product_id in product_ids], dtype=np.int64)
+        deltas = np.array([event['delta'] for event in counted], dtype=np.int64)
+        directions = (deltas < 0).astype(np.intp)
+        units = np.abs(deltas)
+        for period, size in self.PERIODS.items():
+            buckets = offsets // size
+            np.add.at(self.grow(period, int(buckets.max())), (buckets, stores, categories, directions), units)
+        out = deltas < 0
+        self.add_usage(offsets[out] // 7, products[out], units[out])
+    
+    def rename(self, old_name, new_name):
+        """Follow a product rename; onto an existing product, fold the old one's weekly use into it"""
+        old_id, new_id = self.registry.id_of(old_name), self.registry.id_of(new_name)
+        if old_id is None or old_id == new_id:
+            return
+        if new_id is None:
+            self.registry.rename(old_name, new_name)
+            return
+        for product_id, target in self.merged.items():
+            if target == old_id:
+                self.merged[product_id] = new_id
+        self.merged[old_id] = new_id
+        for (week, product), row in list(self.usage_rows.items()):
+            if product != old_id:
+                continue
+            del self.usage_rows[(week, product)]
+            target_row = self.usage_rows.get((week, new_id))
+            if target_row is None:
+                self.usage[row, 1] = new_id
+                self.usage_rows[(week, new_id)] = row
+            else:
+                self.usage[target_row, 2] += self.usage[row, 2]
+                self.usage[row, 2] = 0
+        self.registry.remove(old_name)
+    
+    def grow(self, period, bucket):
+        """Return a period's array with room for a bucket and every known store and category"""
+        array = self.buckets[period]
+        length = array.shape[0] if bucket < array.shape[0] else max(bucket + 1, 2 * array.shape[0])
+        shape = (length, len(self.stores), len(self.categories), 2)
+        if shape != array.shape:
+            grown = np.zeros(shape, dtype=np.int32)
+            grown[:array.shape[0], :array.shape[1], :array.shape[2]] = array
+            self.buckets[period] = grown
+        return self.buckets[period]
+    
+    def shift(self, days):
+        """Move the start back by whole weeks for a movement older than any counted so far"""
+        for period, size in self.PERIODS.items():
+            self.buckets[period] = np.pad(self.buckets[period], ((days // size, 0), (0, 0), (0, 0), (0, 0)))
+        self.usage[:self.usage_count, 0] += days // 7
+        self.usage_rows = {(week + days // 7, product): row for (week, product), row in self.usage_rows.items()}
+        self.start -= timedelta(days=days)
+    
+    def add_usage(self, weeks, products, units):
+        """Add units out to the (week, product) rows"""
+        if not len(weeks):
+            return
+        keys, inverse = np.unique((weeks.astype(np.int64) << 32) | products, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=units).astype(np.int64)
+        for key, total in zip(keys.tolist(), totals.tolist()):
+            week, product = key >> 32, key & 0xFFFFFFFF
+            row = self.usage_rows.get((week, product))
+            if row is None:
+                if self.usage_count == len(self.usage):
+                    self.usage = np.concatenate([self.usage, np.zeros_like(self.usage)])
+                row = self.usage_rows[(week, product)] = self.usage_count
+                self.usage[row, :2] = (week, product)
+                self.usage_count += 1
+            self.usage[row, 2] += total
+    
+    def series(self, stores, period='week', category=None, direction='out', last=12, today=None):
+        """Return units moved in or out per day or week, for the last buckets up to today
+        
+        One row per bucket, labelled with its first day, and one column per
+        store. Only a category's counters are read when one is given.
+        """
+        size = self.PERIODS[period]
+        today = today or date.today()
+        values = np.zeros((last, len(stores)), dtype=np.int64)
+        with self.lock:
+            origin = self.start or today - timedelta(days=today.weekday())
+            current = (today - origin).days // size
+            first = current - last + 1
+            array = self.buckets[period]
+            rows = range(max(first, 0), min(current + 1, array.shape[0]))
+            columns = [(position, self.store_index[store]) for position, store in enumerate(stores)
+                       if store in self.store_index]
+            counts = array[rows.start:rows.stop, :, :, self.DIRECTIONS[direction]]
+            if category is not None:
+                code = self.category_index.get(category)
+                counts = counts[:, :, [code]] if code is not None else counts[:, :, :0]
+            if len(rows) and columns:
+                positions, store_rows = zip(*columns)
+                values[rows.start - first:rows.stop - first, list(positions)] = counts.sum(axis=2)[:, list(store_rows)]
+        labels = [origin + timedelta(days=(first + offset) * size) for offset in range(last)]
+        return pd.DataFrame(values, index=pd.Index(labels, name=period.title()), columns=list(stores))
+    
+    def weekly_usage(self, weeks, today=None):
+        """Return product name -> average units out per week over the last complete weeks"""
+        today = today or date.today()
+        with self.lock:
+            if self.start is None:
+                return {}
+            current = (today - self.start).days // 7
+            usage = self.usage[:self.usage_count]
+            recent = usage[(usage[:, 0] >= current - weeks) & (usage[:, 0] < current)]
+            totals = np.bincount(recent[:, 1], weights=recent[:, 2], minlength=len(self.registry.names))
+            names = self.registry.names
+            return {names[product_id]: units / weeks for product_id, units in enumerate(totals.tolist())
+                    if units and names[product_id] is not None}
+
+class CategoryIndex:
+    """Category -> products groups over the carried products, overall and per store
+    
+    Store membership is kept in step by StockManager's mutation methods.
+    Category edits land in the catalog's category column, so each read first
+    compares that column with the codes the products were grouped under and
+    regroups only the products whose category changed. Reads therefore change
+    the index too, and StockManager makes them under the shared store lock.
+    """
+    
+    UNCATEGORIZED = "Uncategorized"
+    
+    def __init__(self, store_data, catalog):
+        self.catalog = catalog
+        self.registry = catalog.registry
+        # Product ID -> category code it is grouped under (-2 while no store carries it)
+        self.codes = np.full(max(len(self.registry.names), 64), -2, dtype=np.int32)
+        self.store_counts = np.zeros(len(self.codes), dtype=np.int32)
+        # Category -> product IDs, for all stores (None) and per store
+        self.groups = {None: {}}
+        # (store, category) -> sorted product names, dropped when the group changes
+        self.sorted_groups = {}
+        for store, products in store_data.items():
+            self.add_store(store)
+            for product_id in products.product_ids:
+                self.add_id(product_id, store)
+    
+    def label(self, code):
+        """Return the category name for a catalog category code"""
+        return self.UNCATEGORIZED if code < 0 else self.catalog.tables['category'][0][code]
+    
+    def current_codes(self, product_ids):
+        """Return the catalog's current category codes for product IDs"""
+        self.catalog.ensure(len(self.registry.names))
+        return self.catalog.arrays['category'][product_ids]
+    
+    def ensure(self, product_id):
+        """Grow the per-product arrays to cover product_id"""
+        if product_id >= len(self.codes):
+            size = max(product_id + 1, 2 * len(self.codes))
+            self.codes = np.concatenate([self.codes, np.full(size - len(self.codes), -2, dtype=np.int32)])
+            self.store_counts = np.concatenate([self.store_counts, np.zeros(size - len(self.store_counts), dtype=np.int32)])
+    
+    def group_add(self, store, category, product_id):
+        """Put a product into a store's (or the overall) category group"""
+        self.groups[store].setdefault(category, set()).add(product_id)
+        self.sorted_groups.pop((store, category), None)
+    
+    def group_discard(self, store, category, product_id):
+        """Take a product out of a store's (or the overall) category group"""
+        members = self.groups[store].get(category)
+        if members is not None:
+            members.discard(product_id)
+            if not members:
+                del self.groups[store][category]
+        self.sorted_groups.pop((store, category), None)
+    
+    def add_store(self, store):
+        """Register a new, empty store"""
+        self.groups.setdefault(store, {})
+    
+    def add_id(self, product_id, store):
+        """Record that a store carries a product ID"""
+        self.ensure(product_id)
+        if self.codes[product_id] == -2:
+            self.codes[product_id] = self.current_codes(product_id)
+        category = self.label(self.codes[product_id])
+        self.group_add(store, category, product_id)
+        self.store_counts[product_id] += 1
+        if self.store_counts[product_id] == 1:
+            self.group_add(None, category, product_id)
+    
+    def add(self, product, store):
+        """Record that a store carries a product"""
+        self.add_id(self.registry.register(product), store)
+    
+    def discard(self, product, store):
+        """Record that a store no longer carries a product"""
+        product_id = self.registry.ids.get(product)
+        if product_id is None or product_id >= len(self.codes) or self.codes[product_id] == -2:
+            return
+        category = self.label(self.codes[product_id])
+        self.group_discard(store, category, product_id)
+        self.store_counts[product_id] -= 1
+        if self.store_counts[product_id] == 0:
+            self.group_discard(None, category, product_id)
+            self.codes[product_id] = -2
+    
+    def renamed(self, product):
+        """Drop the cached product lists of a renamed product's groups"""
+        product_id = self.registry.ids.get(product)
+        for store, groups in self.groups.items():
+            for category, members in groups.items():
+                if product_id in members:
+                    self.sorted_groups.pop((store, category), None)
+    
+    def sync(self):
+        """Regroup the carried products whose category changed in the catalog"""
+        carried = np.flatnonzero(self.codes != -2)
+        current = self.current_codes(carried)
+        changed = np.flatnonzero(current != self.codes[carried])
+        for product_id, code in zip(carried[changed].tolist(), current[changed].tolist()):
+            old, new = self.label(self.codes[product_id]), self.label(code)
+            self.codes[product_id] = code
+            if old == new:
+                continue
+            for store, groups in self.groups.items():
+                if product_id in groups.get(old, ()):
+                    self.group_discard(store, old, product_id)
+                    self.group_add(store, new, product_id)
+    
+    def categories(self, store=None):
+        """Return the sorted categories of the products carried overall or by one store"""
+        self.sync()
+        return sorted(self.groups.get(store, {}))
+    
+    def products(self, category, store=None):
+        """Return the sorted products in a category, overall or in one store"""
+        self.sync()
+        key = (store, category)
+        names = self.sorted_groups.get(key)
+        if names is None:
+            registry_names = self.registry.names
+            names = sorted(registry_names[product_id] for product_id in self.groups.get(store, {}).get(category, ()))
+            self.sorted_groups[key] = names
+        return names
+    
+    def grouped(self, store=None):
+        """Return {category: sorted products} in category order, overall or for one store"""
+        return {category: self.products(category, store) for category in self.categories(store)}
+    
+    def group(self, products):
+        """Group a list of products by category, keeping their order"""
+        ids = self.catalog.ids(list(products))
+        codes = np.where(ids >= 0, self.current_codes(np.maximum(ids, 0)), -1)
+        groups = {}
+        for product, code in zip(products, codes.tolist()):
+            groups.setdefault(self.label(code), []).append(product)
+        return groups
+
+class SearchIndex:
+    """Trigram index over product names, barcodes and suppliers for the search boxes
+    
+    Each trigram is packed into one int64 (21 bits per character). Postings are
+    built in bulk as one array of product IDs sorted by trigram, with offsets
+    per trigram. Products added or changed afterwards go into a small delta of
+    per-trigram sets and their bulk postings are masked out; the arrays are
+    rebuilt once the delta grows large. A query counts how many of its
+    trigrams each product has: products with all of them are checked for a
+    real substring match, and those with most of them are typo matches.
+    Searching first indexes pending changes, so StockManager searches under the
+    shared store lock.
+    """
+    
+    MIN_SIMILARITY = 0.5
+    
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.registry = catalog.registry
+        self.build()
+    
+    @staticmethod
+    def trigrams(text):
+        """Return the distinct packed trigrams of a text, skipping any containing NUL"""
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+        if len(codes) < 3:
+            return np.zeros(0, dtype=np.int64)
+        valid = (codes[:-2] != 0) & (codes[1:-1] != 0) & (codes[2:] != 0)
+        return np.unique(((codes[:-2] << 42) | (codes[1:-1] << 21) | codes[2:])[valid])
+    
+    def document(self, product_id):
+        """Return the searchable text of a product, padded so word starts form trigrams"""
+        name = self.registry.names[product_id]
+        if name is None:
+            return ''
+        fields = [name]
+        barcode = self.catalog.arrays['barcode'][product_id]
+        if barcode:
+            fields.append(str(barcode))
+        supplier = self.catalog.arrays['supplier'][product_id]
+        if supplier >= 0:
+            fields.append(self.catalog.tables['supplier'][0][supplier])
+        return ''.join(f" {field.lower()} " for field in fields)
+    
+    def snapshot(self):
+        """Record the barcode and supplier columns the documents were built from"""
+        self.catalog.ensure(self.size)
+        self.barcodes = self.catalog.arrays['barcode'][:self.size].copy()
+        self.suppliers = self.catalog.arrays['supplier'][:self.size].copy()
+    
+    def build(self):
+        """Index every registered product into the bulk posting arrays"""
+        self.size = len(self.registry.names)
+        self.catalog.ensure(self.size)
+        self.texts = [self.document(product_id) for product_id in range(self.size)]
+        # All documents in one NUL-separated text; trigrams spanning a NUL are dropped
+        codes = np.frombuffer('\0'.join(self.texts).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+        owners = np.repeat(np.arange(self.size, dtype=np.int32), [len(text) + 1 for text in self.texts])[:len(codes)]
+        if len(codes) >= 3:
+            valid = (codes[:-2] != 0) & (codes[1:-1] != 0) & (codes[2:] != 0)
+            keys = ((codes[:-2] << 42) | (codes[1:-1] << 21) | codes[2:])[valid]
+            owners = owners[:-2][valid]
+        else:
+            keys, owners = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32)
+        order = np.lexsort((owners, keys))
+        keys, owners = keys[order], owners[order]
+        distinct = np.ones(len(keys), dtype=bool)
+        distinct[1:] = (keys[1:] != keys[:-1]) | (owners[1:] != owners[:-1])
+        keys, self.posting_ids = keys[distinct], owners[distinct]
+        self.gram_keys, starts = np.unique(keys, return_index=True)
+        self.offsets = np.append(starts, len(keys))
+        self.stale = np.zeros(self.size, dtype=bool)
+        self.delta = {}
+        self.delta_grams = {}
+        self.snapshot()
+    
+    def reindex(self, product_ids):
+        """Move products into the delta with freshly built documents"""
+        if len(self.delta_grams) + len(product_ids) > max(1024, self.size // 8):
+            self.build()
+            return
+        for product_id in product_ids:
+            for gram in self.delta_grams.pop(product_id, ()):
+                self.delta[gram].discard(product_id)
+            if product_id < len(self.stale):
+                self.stale[product_id] = True
+            text = self.document(product_id)
+            if product_id < len(self.texts):
+                self.texts[product_id] = text
+            else:
+                self.texts.append(text)
+            grams = self.trigrams(text).tolist()
+            self.delta_grams[product_id] = grams
+            for gram in grams:
+                self.delta.setdefault(gram, set()).add(product_id)
+    
+    def renamed(self, product):
+        """Reindex a product whose name changed"""
+        product_id = self.registry.ids.get(product)
+        if product_id is not None and product_id < self.size:
+            self.reindex([product_id])
+    
+    def sync(self):
+        """Index new products and reindex those whose barcode or supplier changed"""
+        size = len(self.registry.names)
+        self.catalog.ensure(size)
+        changed = np.flatnonzero((self.catalog.arrays['barcode'][:self.size] != self.barcodes) |
+                                 (self.catalog.arrays['supplier'][:self.size] != self.suppliers))
+        if len(changed) or size > self.size:
+            added = list(range(self.size, size))
+            self.size = size
+            self.reindex(changed.tolist() + added)
+            self.snapshot()
+    
+    def postings(self, gram):
+        """Return the IDs of the products containing a packed trigram"""
+        i = np.searchsorted(self.gram_keys, gram)
+        if i < len(self.gram_keys) and self.gram_keys[i] == gram:
+            ids = self.posting_ids[self.offsets[i]:self.offsets[i + 1]]
+            ids = ids[~self.stale[ids]]
+        else:
+            ids = self.posting_ids[:0]
+        extra = self.delta.get(gram)
+        if extra:
+            ids = np.concatenate([ids, np.fromiter(extra, dtype=np.int32, count=len(extra))])
+        return ids
+    
+    def search(self, query, within=None, limit=None):
+        """Return product names matching a query, best matches first
+        
+        Matches rank as name prefix, word in name, substring of name, then barcode
+        or supplier. Typo matches, ranked by shared trigrams, are added only when
+        there are fewer exact matches than the limit (or none without a limit).
+        within optionally limits results to a container of product IDs.
+        """
+        self.sync()
+        query = query.strip().lower()
+        if not query:
+            return []
+        grams = self.trigrams(query).tolist()
+        if grams:
+            counts = np.bincount(np.concatenate([self.postings(gram) for gram in grams]), minlength=self.size)
+            candidates = np.flatnonzero(counts == len(grams)).tolist()
+        else:
+            candidates = within if within is not None else range(self.size)
+        
+        names = self.registry.names
+        texts = self.texts
+        word = f" {query}"
+        ranked = []
+        for product_id in candidates:
+            position = texts[product_id].find(query)
+            if position < 0 or names[product_id] is None or (within is not None and product_id not in within):
+                continue
+            name = names[product_id]
+            if position == 1:
+                tier = 0
+            elif position <= len(name):
+                tier = 1 if word in texts[product_id][:len(name) + 1] else 2
+            else:
+                tier = 3
+            ranked.append((tier, name))
+        
+        if grams and len(ranked) < (limit or 1):
+            needed = max(1, int(np.ceil(self.MIN_SIMILARITY * len(grams))))
+            fuzzy = np.flatnonzero((counts >= needed) & (counts < len(grams)))
+            for product_id, count in zip(fuzzy.tolist(), counts[fuzzy].tolist()):
+                if names[product_id] is not None and (within is None or product_id in within):
+                    ranked.append((4 + 1 - count / len(grams), names[product_id]))
+        
+        ranked = heapq.nsmallest(limit, ranked) if limit is not None else sorted(ranked)
+        return [name for _, name in ranked]
+
+class BarcodeIndex:
+    """Reverse index from barcode to product ID for scan-to-product lookups
+    
+    Barcodes are compared stripped of surrounding whitespace. New assignments
+    are checked for uniqueness by StockManager; barcodes shared by several
+    products in older data are kept aside as conflicts, with the first product
+    answering lookups until the others are given their own codes.
+    """
+    
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.registry = catalog.registry
+        self.owners = {}
+        # Barcode -> IDs of further products carrying an already owned barcode
+        self.conflicts = {}
+        # Product ID -> barcode it is indexed under
+        self.barcode_of = {}
+        for product_id in self.catalog.ids_with('barcode').tolist():
+            self.refresh_id(product_id)
+    
+    @staticmethod
+    def normalize(barcode):
+        """Return a barcode as a trimmed string, or None if it is blank"""
+        if barcode is None:
+            return None
+        barcode = str(barcode).strip()
+        return barcode or None
+    
+    def lookup(self, barcode):
+        """Return the name of the product with a barcode, or None"""
+        product_id = self.owners.get(self.normalize(barcode))
+        return None if product_id is None else self.registry.names[product_id]
+    
+    def release(self, product_id):
+        """Drop a product's barcode from the index, promoting a conflicting product if any"""
+        barcode = self.barcode_of.pop(product_id, None)
+        if barcode is None:
+            return
+        others = self.conflicts.get(barcode)
+        if self.owners.get(barcode) == product_id:
+            if others:
+                self.owners[barcode] = others.pop()
+            else:
+                del self.owners[barcode]
+        elif others:
+            others.discard(product_id)
+        if others is not None and not others:
+            del self.conflicts[barcode]
+    
+    def refresh_id(self, product_id):
+        """Index a product under its current catalog barcode"""
+        self.release(product_id)
+        if not self.catalog.has('barcode', product_id) or self.registry.names[product_id] is None:
+            return
+        barcode = self.normalize(self.catalog.arrays['barcode'][product_id])
+        if barcode is None:
+            return
+        self.barcode_of[product_id] = barcode
+        if self.owners.setdefault(barcode, product_id) != product_id:
+            self.conflicts.setdefault(barcode, set()).add(product_id)
+    
+    def refresh(self, *product_names):
+        """Re-index products after their barcodes were written or they were removed"""
+        for name in product_names:
+            product_id = self.registry.ids.get(name)
+            if product_id is not None:
+                self.refresh_id(product_id)
+    
+    def duplicates(self):
+        """Return {barcode: [owner, other products]} for barcodes carried by more than one product"""
+        names = self.registry.names
+        return {barcode: [names[self.owners[barcode]]] + sorted(names[product_id] for product_id in others)
+                for barcode, others in self.conflicts.items()}
+
+class ResolvedPrices:
+    """Effective price per product: its set price, else its estimated price
+    
+    Set prices are read straight from the catalog's price column. Estimates
+    depend only on the name, so each is computed once per product ID and kept
+    until the product is renamed; StockManager invalidates renamed products.
+    """
+    
+    def __init__(self, catalog, classifier):
+        self.catalog = catalog
+        self.classifier = classifier
+        # Product ID -> estimated price, NaN until first needed
+        self.estimates = np.full(len(catalog.registry.names), np.nan)
+    
+    def ensure(self, size):
+        """Grow the estimate cache to cover size product IDs"""
+        if size > len(self.estimates):
+            grown = np.full(max(size, 2 * len(self.estimates)), np.nan)
+            grown[:len(self.estimates)] = self.estimates
+            self.estimates = grown
+    
+    def invalidate(self, *product_names):
+        """Forget the estimates of products whose names changed"""
+        for name in product_names:
+            product_id = self.catalog.registry.ids.get(name)
+            if product_id is not None and product_id < len(self.estimates):
+                self.estimates[product_id] = np.nan
+    
+    def resolve_prices(self, products):
+        """Return the effective price of each product as a float array"""
+        products = list(products)
+        prices = self.catalog.values('price', products)
+        unset = np.flatnonzero(np.isnan(prices))
+        if not len(unset):
+            return prices
+        self.ensure(len(self.catalog.registry.names))
+        estimates = self.estimates
+        ids = self.catalog.ids([products[i] for i in unset])
+        known = ids >= 0
+        resolved = np.full(len(unset), np.nan)
+        resolved[known] = estimates[ids[known]]
+        stale = np.flatnonzero(np.isnan(resolved))
+        if len(stale):
+            resolved[stale] = self.classifier.estimate_prices([products[unset[i]] for i in stale])
+            cached = stale[known[stale]]
+            estimates[ids[cached]] = resolved[cached]
+        prices[unset] = resolved
+        return prices
+    
+    def resolve(self, product):
+        """Return the effective price of one product"""
+        return float(self.resolve_prices([product])[0])
+
+class SharedDataStore:
+    """In-process datastore shared by every browser session
+    
+    Collections are loaded once per process instead of once per session.
+    Sessions read and mutate the same objects, so a change made in one
+    session is visible to all others immediately. Changes and the saves
+    that capture them are made while holding the lock; see
+    StockManager.writing. Reads take the lock too and hand out copies of
+    anything a caller iterates; see shared_read.
+    """
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.collections = {}
+        # Collection name -> storage version the in-memory data was loaded at
+        self.versions = {}
+        # Collection name -> set of changed keys, or None when the whole collection changed
+        self.dirty = {}
+        # Indexes derived from the collections, rebuilt whenever a collection is swapped out
+        self.indexes = {}
+        self.registry = ProductRegistry()
+        self.catalog = ProductCatalog(self.registry)
+        self.reload()
+    
+    @staticmethod
+    def adopt(name, data, registry, catalog):
+        """Convert a collection as loaded from storage to its in-memory, product-ID keyed form
+        
+        Product attribute collections are loaded into the catalog's columns.
+        """
+        if name == 'store_data':
+            return {store: Assortment(registry, products) for store, products in data.items()}
+        if name in ProductCatalog.COLUMNS:
+            catalog.load(ProductCatalog.COLUMNS[name], data)
+            return catalog.column(name)
+        if name == 'store_stock':
+            return StoreStock(registry, data)
+        if name == 'reorder_points':
+            return ReorderPoints(registry, data)
+        return data
+    
+    def reload(self):
+        """(Re)load every collection from storage, discarding unsaved changes"""
+        storage = DataManager.storage()
+        registry = ProductRegistry()
+        catalog = ProductCatalog(registry)
+        versions = {name: storage.version(name) for name in DataManager.COLLECTIONS}
+        collections = {name: self.adopt(name, DataManager.load_collection(name), registry, catalog)
+                       for name in DataManager.COLLECTIONS}
+        with self.lock:
+            self.registry = registry
+            self.catalog = catalog
+            self.collections = collections
+            self.versions = versions
+            self.dirty = {}
+            self.indexes = {}
+    
+    def refresh(self):
+        """Reparse only the collections whose storage version changed, e.g. written by another process
+        
+        Each changed collection is swapped in as a new object, and product
+        columns as new arrays, so code holding the previous one keeps a
+        consistent view until its next rerun.
+        """
+        storage = DataManager.storage()
+        for name in DataManager.COLLECTIONS:
+            version = storage.version(name)
+            if version == self.versions.get(name) or name in self.dirty:
+                continue
+            data = DataManager.load_collection(name)
+            with self.lock:
+                if name not in self.dirty:
+                    self.collections[name] = self.adopt(name, data, self.registry, self.catalog)
+                    self.versions[name] = version
+                    self.indexes = {}
+    
+    def index(self, name, build):
+        """Return a derived index, building it from the current collections on first use"""
+        with self.lock:
+            if name not in self.indexes:
+                self.indexes[name] = build(self.collections)
+            return self.indexes[name]
+    
+    def mark_dirty(self, collection, *keys):
+        """Flag a collection, or only some of its keys, as changed since the last save"""
+        with self.lock:
+            if not keys:
+                self.dirty[collection] = None
+            elif self.dirty.get(collection, set()) is not None:
+                self.dirty.setdefault(collection, set()).update(keys)
+    
+    def submit(self):
+        """Submit every changed collection for saving; returns the handles to pass to wait()"""
+        with self.lock:
+            dirty, self.dirty = self.dirty, {}
+            # Submit everything first so all collections land in the same group commit
+            return {name: (DataManager.submit_collection(name, self.collections[name], keys), keys)
+                    for name, keys in dirty.items()}
+    
+    def wait(self, handles):
+        """Wait for submitted saves and return the number of bytes written
+        
+        Collections that failed to save are marked dirty again.
+        """
+        bytes_written = 0
+        for name, (handle, keys) in handles.items():
+            result = DataManager.wait_for_save(name, handle)
+            if result is None:
+                self.mark_dirty(name, *(keys or ()))
+            else:
+                written, (before, after) = result
+                bytes_written += written
+                # Our own write needs no reparse, unless another process wrote since we last loaded
+                if before == self.versions.get(name):
+                    self.versions[name] = after
+        return bytes_written
+    
+    def flush(self):
+        """Save every changed collection and return the number of bytes written"""
+        return self.wait(self.submit())
+
 class DataManager:
     """Manages data persistence using session state and file backup"""
     
+    # Persisted collections: session state key -> (file name, label for error messages)
+    COLLECTIONS = {
+        'store_data': ('store_data.json', 'store data'),
+        'product_prices': ('product_prices.json', 'prices'),
+        'product_barcodes': ('product_barcodes.json', 'barcodes'),
+        'product_suppliers': ('product_suppliers.json', 'suppliers'),
+        'product_categories': ('product_categories.json', 'categories'),
+        'product_stock': ('product_stock.json', 'stock'),
+        'store_stock': ('store_stock.json', 'store stock'),
+        'reorder_points': ('reorder_points.json', 'reorder points'),
+        'pending_changes': ('pending_changes.json', 'pending changes'),
+        'store_addresses': ('store_addresses.json', 'store addresses'),
+    }
+    
+    # Collections that moved out of the shared store; kept so old data can be migrated
+    LEGACY_COLLECTIONS = {
+        'saved_pos': ('saved_pos.json', 'POs'),
+    }
+    
+    # Per-product attribute collections touched by renames, merges and deletes
+    PRODUCT_COLLECTIONS = ('product_prices', 'product_barcodes', 'product_suppliers',
+                           'product_categories', 'reorder_points')
+    
     @staticmethod
     def initialize_session_state():
-        """Initialize all session state variables"""
+        """Initialize per-session UI state; stock data lives in the shared store"""
         # Initialize user session state if not exists
         if 'user' not in st.session_state:
             st.session_state.user = None
@@ -324,20 +4040,6 @@ class DataManager:
             st.session_state.dark_mode = False
         if 'admin_panel' not in st.session_state:
             st.session_state.admin_panel = False
-            
-        # Initialize data if not exists
-        if 'store_data' not in st.session_state:
-            st.session_state.store_data = DataManager.load_store_data()
-        if 'product_prices' not in st.session_state:
-            st.session_state.product_prices = DataManager.load_prices()
-        if 'product_barcodes' not in st.session_state:
-            st.session_state.product_barcodes = DataManager.load_barcodes()
-        if 'product_suppliers' not in st.session_state:
-            st.session_state.product_suppliers = DataManager.load_suppliers()
-        if 'product_categories' not in st.session_state:
-            st.session_state.product_categories = DataManager.load_categories()
-        if 'product_stock' not in st.session_state:
-            st.session_state.product_stock = DataManager.load_stock()
         if 'po_products' not in st.session_state:
             st.session_state.po_products = []
         if 'po_quantities' not in st.session_state:
@@ -348,192 +4050,250 @@ class DataManager:
             st.session_state.po_discounts = []
         if 'po_foc_quantities' not in st.session_state:
             st.session_state.po_foc_quantities = []
-        if 'saved_pos' not in st.session_state:
-            st.session_state.saved_pos = DataManager.load_saved_pos()
-        if 'pending_changes' not in st.session_state:
-            st.session_state.pending_changes = DataManager.load_pending_changes()
-        if 'store_addresses' not in st.session_state:
-            st.session_state.store_addresses = DataManager.load_store_addresses()
     
     @staticmethod
-    def load_store_data():
-        """Load store data from file or use sample data"""
+    @st.cache_resource(show_spinner=False)
+    def storage():
+        """Return the configured storage backend, shared by all sessions
+        
+        JSON files are written through an append-only mutation journal unless
+        STOCK_JOURNAL=0. Set STOCK_STORAGE_BACKEND=sqlite to keep data in
+        STOCK_DB_PATH (default stock_data.db); existing JSON data is migrated
+        on first use. With the JSON backend, STOCK_CATALOG_SNAPSHOT=1 keeps a
+        memory-mapped binary copy of the catalog for faster cold starts.
+        """
+        if os.environ.get('STOCK_STORAGE_BACKEND', 'json').lower() == 'sqlite':
+            storage = SQLiteStorage(os.environ.get('STOCK_DB_PATH', 'stock_data.db'))
+            storage.migrate_from_json(
+                JournaledStorage(JsonStorage(), DataManager.default_collection, background=False))
+            return storage
+        json_storage = JsonStorage()
+        if os.environ.get('STOCK_CATALOG_SNAPSHOT', '0') == '1':
+            json_storage.catalog = CatalogSnapshot(
+                os.environ.get('STOCK_CATALOG_SNAPSHOT_PATH', 'catalog.snapshot'))
+            # Refresh a stale snapshot off the request path for the next cold start
+            threading.Thread(target=json_storage.refresh_catalog, daemon=True).start()
+        if os.environ.get('STOCK_JOURNAL', '1') == '0':
+            return json_storage
+        return JournaledStorage(json_storage, DataManager.default_collection)
+    
+    @staticmethod
+    @st.cache_resource(show_spinner=False)
+    def shared_store():
+        """Return the in-process datastore shared by all sessions"""
+        return SharedDataStore()
+    
+    @staticmethod
+    @st.cache_resource(show_spinner=False)
+    def write_queue():
+        """Return the process-wide group-commit queue in front of the storage backend"""
+        return WriteQueue(DataManager.storage())
+    
+    @staticmethod
+    @st.cache_resource(show_spinner=False)
+    def po_store():
+        """Return the saved purchase order store, shared by all sessions
+        
+        With the JSON backend POs are partitioned by month under STOCK_PO_DIR
+        (default saved_pos/). POs from the old saved_pos.json are moved over once.
+        """
+        storage = DataManager.storage()
+        if isinstance(storage, SQLiteStorage):
+            store = SQLitePOStore(storage)
+            store.migrate(JournaledStorage(JsonStorage(), DataManager.default_collection, background=False))
+        else:
+            store = PartitionedPOStore(os.environ.get('STOCK_PO_DIR', 'saved_pos'))
+            store.migrate(storage)
+        return store
+    
+    @staticmethod
+    @st.cache_resource(show_spinner=False)
+    def po_archive():
+        """Return the compressed archive of old purchase orders, shared by all sessions
+        
+        POs older than STOCK_PO_ARCHIVE_DAYS (default 365, 0 to disable) are moved
+        into STOCK_PO_ARCHIVE_DIR (default po_archive/) in the background.
+        """
+        archive = POArchive(os.environ.get('STOCK_PO_ARCHIVE_DIR', 'po_archive'))
+        max_age_days = int(os.environ.get('STOCK_PO_ARCHIVE_DAYS', '365'))
+        if max_age_days > 0:
+            threading.Thread(target=archive.archive_from, args=(DataManager.po_store(), max_age_days),
+                             daemon=True).start()
+        return archive
+    
+    @staticmethod
+    @st.cache_resource(show_spinner=False)
+    def stock_movements():
+        """Return the stock movement ledger with its daily and weekly totals, shared by all sessions
+        
+        With the JSON backend movements are appended to STOCK_LEDGER_PATH
+        (default stock_ledger.jsonl).
+        """
+        storage = DataManager.storage()
+        if isinstance(storage, SQLiteStorage):
+            return StockMovements(SQLiteStockLedger(storage))
+        return StockMovements(StockLedger(os.environ.get('STOCK_LEDGER_PATH', 'stock_ledger.jsonl')))
+    
+    @staticmethod
+    @st.cache_resource(show_spinner=False)
+    def classifier():
+        """Return the compiled product category and price rules, shared by all sessions"""
+        return ProductClassifier()
+    
+    @staticmethod
+    def collection_file(name):
+        """Return the JSON file name of a current or legacy collection"""
+        return (DataManager.COLLECTIONS.get(name) or DataManager.LEGACY_COLLECTIONS[name])[0]
+    
+    @staticmethod
+    def default_collection(name):
+        """Return the starting data for a collection that has never been saved"""
+        if name == 'store_data':
+            return DataManager.sample_store_data()
+        if name == 'store_addresses':
+            return AddressManager.get_predefined_addresses()
+        if name == 'pending_changes':
+            return []
+        return {}
+    
+    @staticmethod
+    def load_collection(name):
+        """Load one named collection, falling back to its default data"""
+        data = None
         try:
-            if os.path.exists('store_data.json'):
-                with open('store_data.json', 'r') as f:
-                    return json.load(f)
+            data = DataManager.storage().load(name)
         except Exception as e:
-            st.error(f"Error loading store data: {e}")
-        return DataManager.sample_store_data()
+            st.error(f"Error loading {DataManager.COLLECTIONS[name][1]}: {e}")
+        if data is None:
+            data = DataManager.default_collection(name)
+        return data
+    
+    @staticmethod
+    def load_store_data():
+        """Load store data from file or use sample data"""
+        return DataManager.load_collection('store_data')
     
     @staticmethod
     def load_prices():
         """Load product prices from file"""
-        try:
-            if os.path.exists('product_prices.json'):
-                with open('product_prices.json', 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            st.error(f"Error loading prices: {e}")
-        return {}
+        return DataManager.load_collection('product_prices')
     
     @staticmethod
     def load_barcodes():
         """Load product barcodes from file"""
-        try:
-            if os.path.exists('product_barcodes.json'):
-                with open('product_barcodes.json', 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            st.error(f"Error loading barcodes: {e}")
-        return {}
+        return DataManager.load_collection('product_barcodes')
     
     @staticmethod
     def load_suppliers():
         """Load product suppliers from file"""
-        try:
-            if os.path.exists('product_suppliers.json'):
-                with open('product_suppliers.json', 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            st.error(f"Error loading suppliers: {e}")
-        return {}
+        return DataManager.load_collection('product_suppliers')
     
     @staticmethod
     def load_categories():
         """Load product categories from file"""
-        try:
-            if os.path.exists('product_categories.json'):
-                with open('product_categories.json', 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            st.error(f"Error loading categories: {e}")
-        return {}
+        return DataManager.load_collection('product_categories')
     
     @staticmethod
     def load_stock():
         """Load product stock quantities"""
-        try:
-            if os.path.exists('product_stock.json'):
-                with open('product_stock.json', 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            st.error(f"Error loading stock: {e}")
-        return {}
+        return DataManager.load_collection('product_stock')
     
     @staticmethod
-    def load_saved_pos():
-        """Load saved purchase orders"""
-        try:
-            if os.path.exists('saved_pos.json'):
-                with open('saved_pos.json', 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            st.error(f"Error loading saved POs: {e}")
-        return {}
+    def load_store_stock():
+        """Load per-store stock quantities"""
+        return DataManager.load_collection('store_stock')
+    
+    @staticmethod
+    def load_reorder_points():
+        """Load product reorder points"""
+        return DataManager.load_collection('reorder_points')
     
     @staticmethod
     def load_pending_changes():
         """Load pending changes waiting for admin approval"""
-        try:
-            if os.path.exists('pending_changes.json'):
-                with open('pending_changes.json', 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            st.error(f"Error loading pending changes: {e}")
-        return []
+        return DataManager.load_collection('pending_changes')
     
     @staticmethod
     def load_store_addresses():
         """Load store addresses from file"""
+        return DataManager.load_collection('store_addresses')
+    
+    @staticmethod
+    def submit_collection(name, data, keys=None):
+        """Queue a save of one collection (or only some of its keys); returns a completion handle"""
+        partial = keys is not None and DataManager.storage().partial_writes
+        # In-memory collections are keyed by product ID; storage holds plain name-keyed data
+        if name == 'store_data':
+            stores = keys if partial else data
+            data = {store: list(data[store]) for store in stores if store in data}
+        elif isinstance(data, (CatalogColumn, StoreStock, ReorderPoints)):
+            data = data.to_dict(keys if partial else None)
+        return DataManager.write_queue().submit(name, data, keys)
+    
+    @staticmethod
+    def wait_for_save(name, handle):
+        """Wait for a queued save, returning (bytes written, versions) or None if it failed"""
         try:
-            if os.path.exists('store_addresses.json'):
-                with open('store_addresses.json', 'r') as f:
-                    return json.load(f)
+            return handle.result()
         except Exception as e:
-            st.error(f"Error loading store addresses: {e}")
-        return AddressManager.get_predefined_addresses()
+            st.error(f"Error saving {DataManager.COLLECTIONS[name][1]}: {e}")
+            return None
+    
+    @staticmethod
+    def save_collection(name, data, keys=None):
+        """Save one named collection (or only some of its keys), returning bytes written"""
+        result = DataManager.wait_for_save(name, DataManager.submit_collection(name, data, keys))
+        return result[0] if result is not None else None
     
     @staticmethod
     def save_store_data(data):
         """Save store data to file"""
-        try:
-            with open('store_data.json', 'w') as f:
-                json.dump(data, f)
-        except Exception as e:
-            st.error(f"Error saving store data: {e}")
+        return DataManager.save_collection('store_data', data)
     
     @staticmethod
     def save_prices(data):
         """Save product prices to file"""
-        try:
-            with open('product_prices.json', 'w') as f:
-                json.dump(data, f)
-        except Exception as e:
-            st.error(f"Error saving prices: {e}")
+        return DataManager.save_collection('product_prices', data)
     
     @staticmethod
     def save_barcodes(data):
         """Save product barcodes to file"""
-        try:
-            with open('product_barcodes.json', 'w') as f:
-                json.dump(data, f)
-        except Exception as e:
-            st.error(f"Error saving barcodes: {e}")
+        return DataManager.save_collection('product_barcodes', data)
     
     @staticmethod
     def save_suppliers(data):
         """Save product suppliers to file"""
-        try:
-            with open('product_suppliers.json', 'w') as f:
-                json.dump(data, f)
-        except Exception as e:
-            st.error(f"Error saving suppliers: {e}")
+        return DataManager.save_collection('product_suppliers', data)
     
     @staticmethod
     def save_categories(data):
         """Save product categories to file"""
-        try:
-            with open('product_categories.json', 'w') as f:
-                json.dump(data, f)
-        except Exception as e:
-            st.error(f"Error saving categories: {e}")
+        return DataManager.save_collection('product_categories', data)
     
     @staticmethod
     def save_stock(data):
         """Save product stock to file"""
-        try:
-            with open('product_stock.json', 'w') as f:
-                json.dump(data, f)
-        except Exception as e:
-            st.error(f"Error saving stock: {e}")
+        return DataManager.save_collection('product_stock', data)
     
     @staticmethod
-    def save_pos(data):
-        """Save purchase orders to file"""
-        try:
-            with open('saved_pos.json', 'w') as f:
-                json.dump(data, f)
-        except Exception as e:
-            st.error(f"Error saving POs: {e}")
+    def save_store_stock(data):
+        """Save per-store stock quantities to file"""
+        return DataManager.save_collection('store_stock', data)
+    
+    @staticmethod
+    def save_reorder_points(data):
+        """Save product reorder points to file"""
+        return DataManager.save_collection('reorder_points', data)
     
     @staticmethod
     def save_pending_changes(data):
         """Save pending changes to file"""
-        try:
-            with open('pending_changes.json', 'w') as f:
-                json.dump(data, f)
-        except Exception as e:
-            st.error(f"Error saving pending changes: {e}")
+        return DataManager.save_collection('pending_changes', data)
     
     @staticmethod
     def save_store_addresses(data):
         """Save store addresses to file"""
-        try:
-            with open('store_addresses.json', 'w') as f:
-                json.dump(data, f)
-        except Exception as e:
-            st.error(f"Error saving store addresses: {e}")
+        return DataManager.save_collection('store_addresses', data)
     
     @staticmethod
     def sample_store_data():
@@ -621,249 +4381,540 @@ class DataManager:
             ]
         }
 
+def shared_write(method):
+    """Run a StockManager method that changes shared data inside StockManager.writing()"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.writing():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def shared_read(method):
+    """Run a StockManager method that reads shared data under the shared store lock
+    
+    Indexes shared by all sessions bring themselves up to date on read, and
+    other sessions change them in place, so reads must not interleave with
+    either. The lock is reentrant, so writers can call these methods too.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.store.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 class StockManager:
     def __init__(self):
         # Initialize data manager
         DataManager.initialize_session_state()
         
-        # Use session state data
-        self.data = st.session_state.store_data
-        self.all_products = self.get_all_products()
-        self.product_prices = st.session_state.product_prices
-        self.product_barcodes = st.session_state.product_barcodes
-        self.product_suppliers = st.session_state.product_suppliers
-        self.product_categories = st.session_state.product_categories
-        self.product_stock = st.session_state.product_stock
-        self.saved_pos = st.session_state.saved_pos
-        self.pending_changes = st.session_state.pending_changes
-        self.store_addresses = st.session_state.store_addresses
+        # Use the data shared by all sessions, picking up changes from other processes
+        self.store = DataManager.shared_store()
+        self.store.refresh()
+        collections = self.store.collections
+        self.data = collections['store_data']
+        self.registry = self.store.registry
+        self.catalog = self.store.catalog
+        self.classifier = DataManager.classifier()
+        self.locations = self.store.index(
+            'locations', lambda collections: ProductLocationIndex(collections['store_data'], self.registry))
+        self.availability = self.store.index(
+            'availability', lambda collections: AvailabilityMatrix(collections['store_data'], self.registry))
+        self.prices = self.store.index(
+            'prices', lambda collections: ResolvedPrices(self.catalog, self.classifier))
+        self.categories = self.store.index(
+            'categories', lambda collections: CategoryIndex(collections['store_data'], self.catalog))
+        self.barcode_index = self.store.index('barcodes', lambda collections: BarcodeIndex(self.catalog))
+        self.low_stock = self.store.index('low_stock', lambda collections: LowStockIndex(
+            collections['store_data'], collections['store_stock'], collections['reorder_points']))
+        self.product_order = self.store.index(
+            'product_order', lambda collections: OrderedProducts(self.locations.products()))
+        self.product_prices = collections['product_prices']
+        self.product_barcodes = collections['product_barcodes']
+        self.product_suppliers = collections['product_suppliers']
+        self.product_categories = collections['product_categories']
+        self.product_stock = collections['product_stock']
+        self.store_stock = collections['store_stock']
+        self.reorder_points = collections['reorder_points']
+        self.purchase_orders = DataManager.po_store()
+        self.po_archive = DataManager.po_archive()
+        self.movements = DataManager.stock_movements()
+        self.movements.refresh()
+        # Stock movements waiting to be appended to the ledger with the next save
+        self.pending_movements = []
+        # Nesting depth of writing() blocks, and the saves submitted inside them
+        self.write_depth = 0
+        self.submitted = []
+        self.written = 0
+        self.pending_changes = collections['pending_changes']
+        self.store_addresses = collections['store_addresses']
         
         # Initialize default prices and stock for products that don't have them
         self.initialize_default_prices()
         self.initialize_default_stock()
     
+    @shared_write
     def initialize_default_prices(self):
         """Initialize default prices for products that don't have prices"""
-        changed = False
-        for product in self.all_products:
-            if product not in self.product_prices:
-                self.product_prices[product] = self.estimate_price(product)
-                changed = True
-        
-        if changed:
-            self.save_all_data()
+        missing = [product for product in self.all_products if product not in self.product_prices]
+        if missing:
+            self.catalog.assign('price', missing, self.estimate_prices(missing))
+            self.mark_dirty('product_prices', *missing)
+            self.save_data()
     
+    @shared_write
     def initialize_default_stock(self):
-        """Initialize default stock quantities for products"""
-        changed = False
-        for product in self.all_products:
-            if product not in self.product_stock:
-                # Initialize with random stock between 10-50
-                self.product_stock[product] = np.random.randint(10, 51)
-                changed = True
+        """Move stock totals saved before per-store stock into the stores carrying each product
         
-        if changed:
-            self.save_all_data()
+        Each total is split as evenly as possible over the product's stores and
+        the old totals are dropped, so they are never applied twice.
+        """
+        legacy = list(self.product_stock)
+        if not legacy:
+            return
+        if not self.store_stock.matrix.any():
+            for product in legacy:
+                self.spread_stock(product, self.product_stock[product], self.find_product_locations(product),
+                                  reason='migration')
+        for product in legacy:
+            del self.product_stock[product]
+        self.mark_dirty('product_stock', *legacy)
+        self.save_data()
+    
+    def mark_dirty(self, collection, *keys):
+        """Flag a collection, or only some of its keys, as changed since the last save"""
+        self.store.mark_dirty(collection, *keys)
+    
+    def mark_product_dirty(self, *product_names):
+        """Flag every per-product attribute of the given products as changed"""
+        for name in DataManager.PRODUCT_COLLECTIONS:
+            self.mark_dirty(name, *product_names)
+    
+    @contextmanager
+    def writing(self):
+        """Hold the shared store lock while changing shared data, then wait for the saves made meanwhile
+        
+        Every session changes the same objects, so a change and the save that
+        captures it must not interleave with another session's. The lock is
+        released before waiting on storage, so saves from several sessions
+        still share a group commit.
+        """
+        try:
+            with self.store.lock:
+                self.write_depth += 1
+                try:
+                    yield
+                finally:
+                    self.write_depth -= 1
+        finally:
+            if not self.write_depth:
+                submitted, self.submitted = self.submitted, []
+                self.written = sum(self.store.wait(handles) for handles in submitted)
+                if self.pending_movements:
+                    self.movements.record(self.pending_movements)
+                    self.pending_movements = []
+    
+    def save_data(self, *collections):
+        """Save only the changed collections and return the number of bytes written
+        
+        Any collections passed in are marked wholly dirty first. Inside an
+        enclosing writing() block the save is only submitted, and 0 is returned.
+        """
+        with self.writing():
+            for name in collections:
+                self.mark_dirty(name)
+            self.submitted.append(self.store.submit())
+        return 0 if self.write_depth else self.written
     
     def save_all_data(self):
-        """Save all data to session state and files"""
-        # Update session state
-        st.session_state.store_data = self.data
-        st.session_state.product_prices = self.product_prices
-        st.session_state.product_barcodes = self.product_barcodes
-        st.session_state.product_suppliers = self.product_suppliers
-        st.session_state.product_categories = self.product_categories
-        st.session_state.product_stock = self.product_stock
-        st.session_state.saved_pos = self.saved_pos
-        st.session_state.pending_changes = self.pending_changes
-        st.session_state.store_addresses = self.store_addresses
-        
-        # Save to files
-        DataManager.save_store_data(self.data)
-        DataManager.save_prices(self.product_prices)
-        DataManager.save_barcodes(self.product_barcodes)
-        DataManager.save_suppliers(self.product_suppliers)
-        DataManager.save_categories(self.product_categories)
-        DataManager.save_stock(self.product_stock)
-        DataManager.save_pos(self.saved_pos)
-        DataManager.save_pending_changes(self.pending_changes)
-        DataManager.save_store_addresses(self.store_addresses)
+        """Save all data to storage"""
+        return self.save_data(*DataManager.COLLECTIONS)
+    
+    @property
+    @shared_read
+    def all_products(self):
+        """Every product carried by at least one store, in sorted order"""
+        return self.product_order.as_list()
     
     def get_all_products(self):
-        all_products = set()
-        for products in self.data.values():
-            all_products.update(products)
-        return sorted(list(all_products))
+        return self.all_products
+    
+    @shared_read
+    def get_stores(self):
+        """Return all store names in display order"""
+        return list(self.data)
+    
+    @shared_read
+    def get_store_products(self, store_name):
+        """Return a copy of a store's products in display order, or an empty assortment for unknown stores"""
+        products = self.data.get(store_name)
+        return products.copy() if products is not None else Assortment(self.registry)
+    
+    @shared_write
+    def add_to_store(self, store_name, product_name):
+        """Add a product to a store's assortment; returns False if it was already there"""
+        if not self.data[store_name].add(product_name):
+            return False
+        self.locations.add(product_name, store_name)
+        self.availability.add(product_name, store_name)
+        self.categories.add(product_name, store_name)
+        self.product_order.add(product_name)
+        self.low_stock.update(store_name, product_name)
+        return True
+    
+    @shared_write
+    def remove_from_store(self, store_name, product_name):
+        """Remove a product from a store's assortment; returns False if it wasn't there"""
+        if not self.data[store_name].discard(product_name):
+            return False
+        self.locations.discard(product_name, store_name)
+        self.availability.discard(product_name, store_name)
+        self.categories.discard(product_name, store_name)
+        if self.store_stock.get(store_name, product_name):
+            self.set_store_stock(store_name, product_name, 0, reason='removed')
+        self.low_stock.update(store_name, product_name, carried=False)
+        if not self.locations.stores_for(product_name):
+            self.product_order.discard(product_name)
+        return True
     
     def get_product_category(self, product_name):
         """Categorize products based on name"""
-        product_upper = product_name.upper()
-        
-        if 'BARBICAN' in product_upper:
-            return 'Barbican'
-        elif 'DRINKO' in product_upper and '250ML' in product_upper:
-            return 'Drinko 250ml'
-        elif 'DRINKO' in product_upper and '330ML' in product_upper:
-            return 'Drinko 330ml'
-        elif 'MUSTARD OIL' in product_upper:
-            return 'Mustard Oil'
-        elif 'BASIL SEED' in product_upper:
-            return 'Basil Seed'
-        elif 'LASSI' in product_upper:
-            return 'Lassi'
-        elif 'JUS' in product_upper:
-            return 'Jus'
-        elif 'VEGETABLE GHEE' in product_upper:
-            return 'Vegetable Ghee'
-        elif 'CHANACHUR' in product_upper:
-            return 'Chanachur'
-        elif 'ENERGY DRINK' in product_upper:
-            return 'Energy Drink'
-        elif 'LOLLIPOP' in product_upper:
-            return 'Lollipop'
-        elif 'CREAMER' in product_upper:
-            return 'Creamer'
-        elif 'COCONUT WATER' in product_upper:
-            return 'Coconut Water'
-        elif 'FLOAT' in product_upper:
-            return 'Float'
-        elif 'TAMARIND' in product_upper or 'SOUR PLUM' in product_upper or 'BIRD NEST' in product_upper:
-            if 'PET 320ML' in product_upper:
-                return 'PET 320ml'
-            return 'Traditional Drinks'
-        elif 'SOYA' in product_upper:
-            return 'Soya'
-        elif 'PUFFED RICE' in product_upper:
-            return 'Puffed Rice'
-        elif 'BISCUITS' in product_upper or 'POTATA' in product_upper:
-            return 'Biscuits'
-        elif 'BES MINUMAN' in product_upper:
-            return 'BES Minuman'
-        elif 'BRIYANI MASALA' in product_upper:
-            return 'Spices'
-        elif 'HUMPTY DUMPTY' in product_upper:
-            return 'Snacks'
-        else:
-            return 'Other'
+        return self.classifier.categorize(product_name)
     
+    def categorize_products(self, products):
+        """Categorize many products in one pass"""
+        return self.classifier.categorize_many(products)
+    
+    @shared_read
     def check_stock(self, product_name, store_name=None):
-        results = {}
+        stores = self.locations.stores_for(product_name)
         if store_name:
-            if store_name in self.data:
-                results[store_name] = product_name in self.data[store_name]
-            else:
-                results[store_name] = False
-        else:
-            for store, products in self.data.items():
-                results[store] = product_name in products
-        return results
+            return {store_name: store_name in stores}
+        return {store: store in stores for store in self.data}
     
+    @shared_read
     def find_product_locations(self, product_name):
-        locations = []
-        for store, products in self.data.items():
-            if product_name in products:
-                locations.append(store)
-        return locations
+        return self.locations.locations(product_name)
     
+    @shared_read
     def get_stock_count(self, product_name):
         """Get total stock count across all stores"""
-        count = 0
-        for store, products in self.data.items():
-            if product_name in products:
-                count += 1
-        return count
-    
-    def get_stock_quantity(self, product_name):
-        """Get current stock quantity for a product"""
-        return self.product_stock.get(product_name, 0)
-    
-    def update_stock(self, product_name, new_quantity):
-        """Update stock quantity for a product"""
-        self.product_stock[product_name] = new_quantity
-        self.save_all_data()
+        return len(self.locations.stores_for(product_name))
+    
+    @shared_read
+    def get_store_product_counts(self):
+        """Get the number of products carried by each store"""
+        return dict(zip(self.availability.stores, self.availability.store_counts().tolist()))
+    
+    @shared_read
+    def get_product_coverage(self):
+        """Get the number of stores carrying each product"""
+        return self.availability.product_coverage()
+    
+    @shared_read
+    def get_category_coverage(self):
+        """Get the share of stores stocking each category's products"""
+        return self.availability.category_coverage(self.catalog)
+    
+    @shared_read
+    def get_categories(self, store_name=None):
+        """Get the sorted categories of products carried overall or by one store"""
+        return self.categories.categories(store_name)
+    
+    def get_assignable_categories(self):
+        """Get the sorted categories a product can be given, without the synthetic "Uncategorized" group"""
+        return [category for category in self.get_categories() if category != CategoryIndex.UNCATEGORIZED]
+    
+    @shared_read
+    def get_category_products(self, category, store_name=None):
+        """Get the sorted products in a category, overall or in one store"""
+        return self.categories.products(category, store_name)
+    
+    @shared_read
+    def get_products_by_category(self, store_name=None):
+        """Get {category: sorted products}, overall or for one store"""
+        return self.categories.grouped(store_name)
+    
+    def search_index(self):
+        """Return the product search index, building it on first use"""
+        return self.store.index('search', lambda collections: SearchIndex(self.catalog))
+    
+    @shared_read
+    def search_products(self, query, store_name=None, limit=None):
+        """Search carried products, or one store's, by name, barcode or supplier; best matches first"""
+        within = self.data[store_name].product_ids if store_name else self.locations.product_stores
+        return self.search_index().search(query, within, limit)
+    
+    def find_product_by_barcode(self, barcode):
+        """Get the product with a scanned barcode, or None"""
+        return self.barcode_index.lookup(barcode)
+    
+    def check_barcode(self, barcode, *product_names):
+        """Return an error message if a barcode already belongs to another product, else None"""
+        owner = self.barcode_index.lookup(barcode)
+        if owner is not None and owner not in product_names:
+            return f"Barcode {BarcodeIndex.normalize(barcode)} is already used by '{owner}'"
+        return None
+    
+    @shared_write
+    def set_barcode(self, product_name, barcode):
+        """Set a product's barcode, refusing barcodes already used by another product"""
+        error = self.check_barcode(barcode, product_name)
+        if error:
+            return False, error
+        self.product_barcodes[product_name] = BarcodeIndex.normalize(barcode)
+        self.barcode_index.refresh(product_name)
+        self.mark_dirty('product_barcodes', product_name)
+        self.save_data()
+        return True, f"Barcode updated for '{product_name}'"
+    
+    @shared_read
+    def get_duplicate_barcodes(self):
+        """Get {barcode: [products]} for barcodes shared by more than one product"""
+        return self.barcode_index.duplicates()
+    
+    @shared_read
+    def get_stores_missing(self, product_name):
+        """Get the stores that do not carry a product"""
+        return self.availability.stores_missing(product_name)
+    
+    @shared_write
+    def apply_price_change(self, products, change_type, change_value):
+        """Apply a bulk price change to products as one column update; returns the number updated"""
+        prices = self.resolve_prices(products)
+        
+        if change_type == "Percentage Increase":
+            prices = prices * (1 + change_value / 100)
+        elif change_type == "Percentage Decrease":
+            prices = prices * (1 - change_value / 100)
+        elif change_type == "Fixed Amount":
+            prices = prices + change_value
+        else:  # Set New Price
+            prices = np.full(len(products), float(change_value))
+        
+        self.catalog.assign('price', products, np.round(prices, 2))
+        self.mark_dirty('product_prices', *products)
+        self.save_data()
+        return len(products)
+    
+    @shared_read
+    def get_stock_quantity(self, product_name, store_name=None):
+        """Get the units of a product held by one store, or by all stores together"""
+        if store_name:
+            return self.store_stock.get(store_name, product_name)
+        return self.store_stock.total(product_name)
+    
+    @shared_read
+    def get_stock_quantities(self, products):
+        """Get the units of each of many products across all stores as an int array"""
+        return self.store_stock.totals(self.catalog.ids(products))
+    
+    @shared_read
+    def get_store_stock(self, product_name):
+        """Get store -> units of a product for every store carrying it, in store order"""
+        return {store: self.store_stock.get(store, product_name) for store in self.find_product_locations(product_name)}
+    
+    @shared_read
+    def get_store_stock_totals(self):
+        """Get the units of all products held by each store, in store order"""
+        totals = self.store_stock.store_totals()
+        return {store: totals.get(store, 0) for store in self.data}
+    
+    @shared_read
+    def get_category_stock(self, store_name=None):
+        """Get category -> units on hand in one store, or across all stores"""
+        return self.store_stock.category_totals(self.catalog, store_name)
+    
+    @shared_write
+    def set_store_stock(self, store_name, product_name, quantity, reason='count'):
+        """Record the units of a product held by one store, log the change and re-check its low stock alert"""
+        previous = self.store_stock.get(store_name, product_name)
+        self.record_movement(store_name, product_name, quantity - previous, reason)
+        self.store_stock.set(store_name, product_name, quantity)
+        self.low_stock.update(store_name, product_name, carried=product_name in self.data.get(store_name, ()))
+        self.mark_dirty('store_stock', store_name)
+    
+    @shared_write
+    def move_store_stock(self, source, target):
+        """Add every store's units of one product to another's, logging both sides of the move"""
+        for store, units in self.store_stock.by_store(source).items():
+            self.record_movement(store, source, -units, 'merge')
+            self.record_movement(store, target, units, 'merge')
+        self.mark_dirty('store_stock', *self.store_stock.move(source, target))
+    
+    def record_movement(self, store_name, product_name, delta, reason):
+        """Queue a change of a store's stock for the movement ledger; it is written with the next save"""
+        if delta:
+            self.pending_movements.append({
+                't': datetime.now().isoformat(timespec='seconds'), 'product': product_name, 'store': store_name,
+                'delta': int(delta), 'reason': reason, 'user': st.session_state.user,
+                'category': self.product_categories.get(product_name)})
+    
+    def record_rename(self, old_name, new_name):
+        """Queue a rename or merge of a product for the movement ledger, so its rate of use follows it"""
+        self.pending_movements.append({
+            't': datetime.now().isoformat(timespec='seconds'), 'product': old_name, 'store': '',
+            'delta': 0, 'reason': 'rename', 'user': st.session_state.user, 'renamed': new_name})
+    
+    def get_stock_movement(self, period='week', category=None, direction='out', last=12):
+        """Get units moved in or out of each store per day or week, overall or for one category"""
+        return self.movements.series(self.get_stores(), period, category, direction, last)
+    
+    def get_movement_categories(self):
+        """Get the sorted categories that have counted stock movements"""
+        with self.movements.lock:
+            return sorted(self.movements.category_index)
+    
+    def refresh_stock_alerts(self, product_name):
+        """Re-check the low stock alerts of a product in every store carrying it"""
+        for store in self.find_product_locations(product_name):
+            self.low_stock.update(store, product_name)
+    
+    @shared_write
+    def spread_stock(self, product_name, total, stores, reason='count'):
+        """Split a product's total units as evenly as possible over the given stores"""
+        for store, share in zip(stores, StoreStock.spread(total, len(stores))):
+            self.set_store_stock(store, product_name, share, reason)
+    
+    @shared_write
+    def update_stock(self, product_name, new_quantity, store_name=None, reason='count'):
+        """Update the units of a product held by one store
+        
+        Without a store the quantity is a new total, spread over the stores
+        carrying the product. The change is logged with the reason given,
+        one of StockMovements.REASONS.
+        """
+        if store_name:
+            self.set_store_stock(store_name, product_name, new_quantity, reason)
+        else:
+            self.spread_stock(product_name, new_quantity, self.find_product_locations(product_name), reason)
+        self.save_data()
         return True
     
-    def get_stock_status(self, product_name):
-        """Get stock status with color coding"""
-        quantity = self.get_stock_quantity(product_name)
+    @shared_read
+    def export_stock_csv(self):
+        """Get every store's non-zero stock as CSV text"""
+        return self.store_stock.to_csv()
+    
+    @shared_write
+    def import_stock_csv(self, text):
+        """Set per-store quantities from CSV text with Store, Product, Quantity columns
+        
+        Nothing is changed unless every row names a store carrying the product.
+        """
+        if st.session_state.user not in st.session_state.users or st.session_state.users[st.session_state.user]['role'] != 'admin':
+            return False, "Only admin users can import stock"
+        try:
+            rows = StoreStock.parse_csv(text)
+        except ValueError as e:
+            return False, f"Invalid stock file: {e}"
+        for store, product, quantity in rows:
+            if store not in self.locations.stores_for(product):
+                return False, f"'{store}' does not carry '{product}'"
+        for store, product, quantity in rows:
+            self.set_store_stock(store, product, quantity, reason='import')
+        self.save_data()
+        return True, f"Imported {len(rows)} stock quantities"
+    
+    @shared_read
+    def get_stock_status(self, product_name, store_name=None):
+        """Get stock status with color coding, for one store or across all stores"""
+        quantity = self.get_stock_quantity(product_name, store_name)
         if quantity == 0:
             return "Out of Stock", "out-of-stock"
-        elif quantity <= 10:
+        elif quantity <= self.get_reorder_point(product_name, store_name):
             return f"Low Stock ({quantity})", "low-stock"
         else:
             return f"In Stock ({quantity})", "stock-info"
     
+    @shared_read
+    def get_reorder_point(self, product_name, store_name=None):
+        """Get the stock level at or below which a product is low, in one store or chain-wide"""
+        return self.reorder_points.get(product_name, store_name)
+    
+    @shared_write
+    def set_reorder_point(self, product_name, point, store_name=None):
+        """Set a product's reorder point for one store, or for every store without its own"""
+        if st.session_state.user not in st.session_state.users or st.session_state.users[st.session_state.user]['role'] != 'admin':
+            return False, "Only admin users can change reorder points"
+        self.reorder_points.set(product_name, point, store_name)
+        if store_name:
+            self.low_stock.update(store_name, product_name, carried=product_name in self.data.get(store_name, ()))
+        else:
+            self.refresh_stock_alerts(product_name)
+        self.mark_dirty('reorder_points', product_name)
+        self.save_data()
+        scope = f" at {store_name}" if store_name else ""
+        return True, f"Reorder point for '{product_name}' set to {point} units{scope}"
+    
+    @shared_read
+    def get_pack_size(self, product_name):
+        """Get the number of units a product is ordered in multiples of"""
+        return self.reorder_points.pack(product_name)
+    
+    @shared_write
+    def set_pack_size(self, product_name, units):
+        """Set the number of units a product is ordered in multiples of"""
+        if st.session_state.user not in st.session_state.users or st.session_state.users[st.session_state.user]['role'] != 'admin':
+            return False, "Only admin users can change pack sizes"
+        if units < 1:
+            return False, "Pack size must be at least 1"
+        self.reorder_points.set_pack(product_name, units)
+        self.mark_dirty('reorder_points', product_name)
+        self.save_data()
+        return True, f"'{product_name}' is now ordered in packs of {units}"
+    
+    @shared_read
+    def suggest_order(self, supplier, store_name=None):
+        """Suggest order quantities of a supplier's products for one store, or the whole chain
+        
+        Uses current stock, reorder points, pack sizes, the supplier's recent
+        saved POs and recent units out from the movement ledger; see
+        ReorderPlanner for the rules.
+        """
+        # A store's suggestion only nets off POs delivered to that store
+        addresses = {self.store_addresses.get(store_name)} if store_name else None
+        ordered, on_order = ReorderPlanner.order_history(self.purchase_orders, supplier, addresses=addresses)
+        used = self.movements.weekly_usage(ReorderPlanner.HISTORY_WEEKS)
+        weekly = {product: max(ordered.get(product, 0), used.get(product, 0))
+                  for product in ordered.keys() | used.keys()}
+        planner = ReorderPlanner(self.catalog, self.availability, self.store_stock, self.reorder_points)
+        return planner.suggest(supplier, [store_name] if store_name else self.get_stores(), weekly, on_order)
+    
+    @shared_read
+    def get_stock_alerts(self, store_name=None, limit=None):
+        """Get (store, product, units, reorder point) for slots at or below their reorder point, empty ones first"""
+        return self.low_stock.alerts(store_name, limit)
+    
+    @shared_read
+    def get_stock_alert_counts(self, store_name=None):
+        """Get the number of (out of stock, low stock) slots, in one store or all of them"""
+        return self.low_stock.counts(store_name)
+    
     def estimate_price(self, product_name):
         """Updated price estimation with new prices per piece"""
-        price_mapping = {
-            'BARBICAN': 4.38,  # 4.375 rounded
-            'BASIL SEED': 2.42,  # 2.41666667 rounded
-            'BES MINUMAN': 2.00,
-            'HUMPTY DUMPTY': 2.00,
-            'POWER ENERGY DRINK': 1.42,  # 1.416667 rounded
-            'VEGETABLE GHEE 450G': 10.63,  # 10.625 rounded
-            'VEGETABLE GHEE 125G': 4.13,  # 4.125 rounded
-            'COCONUT WATER': 1.67,  # 1.666666 rounded
-            'AIS LEMON TEH': 1.63,  # 1.625 rounded
-            'PREMIO PARADISE': 3.11,
-            'CHANACHUR': 3.13,  # 3.125 rounded
-            'JUS PET 1000ML': 3.75,
-            'JUS 330ML': 1.50,
-            'PET 320ML': 1.50,
-            'DRINKO FLOAT 250ML': 1.50,
-            'DRINKO FLOAT 330ML': 2.00,
-            'LASSI 285ML': 1.69,  # 1.6944444 rounded
-            'SOYA CAN': 1.00,
-            'COOLING TAMARIND': 1.38,  # 1.375 rounded
-            'JUS PET VALUE PACK 1.5L': 11.00,
-            'MUSTARD OIL 400ML': 5.83,  # 5.833333 rounded
-            'MUSTARD OIL 200ML': 3.00,
-            'VARIETY LOLLIPOP': 30.00,
-            'PUFFED RICE': 2.75,
-            'CREAMER 500GM': 2.75,  # New price
-            'CREAMER 500GM EASY OPEN': 2.92,  # 2.916666 rounded
-            'CHOCO STICK': 0.70,  # New price
-            'BOMBAY BRIYANI': 2.92,  # 2.916666 rounded
-            'POTATA BISCUITS': 1.60  # 1.6041666 rounded
-        }
-        
-        product_upper = product_name.upper()
-        
-        # Check for exact matches first
-        for key, price in price_mapping.items():
-            if key in product_upper:
-                return price
-        
-        # Fallback to category-based pricing
-        category_prices = {
-            'Barbican': 4.38,
-            'Basil Seed': 2.42,
-            'BES Minuman': 2.00,
-            'Snacks': 2.00,
-            'Energy Drink': 1.42,
-            'Vegetable Ghee': 10.63,
-            'Coconut Water': 1.67,
-            'Traditional Drinks': 1.63,
-            'Chanachur': 3.13,
-            'Jus': 3.75,
-            'PET 320ml': 1.50,
-            'Drinko 250ml': 1.50,
-            'Drinko 330ml': 2.00,
-            'Lassi': 1.69,
-            'Soya': 1.00,
-            'Mustard Oil': 5.83,
-            'Lollipop': 30.00,
-            'Puffed Rice': 2.75,
-            'Creamer': 2.75,
-            'Biscuits': 1.60,
-            'Spices': 2.92
-        }
-        
-        category = self.get_product_category(product_name)
-        return category_prices.get(category, 3.00)
+        return self.classifier.estimate_price(product_name)
+    
+    def estimate_prices(self, products):
+        """Estimate prices for many products as a float array"""
+        return self.classifier.estimate_prices(products)
     
+    @shared_read
+    def resolve_price(self, product_name):
+        """Get a product's price, falling back to its estimated price"""
+        return self.prices.resolve(product_name)
+    
+    @shared_read
+    def resolve_prices(self, products):
+        """Get the prices of many products as a float array, estimating unset ones"""
+        return self.prices.resolve_prices(products)
+    
+    @shared_write
     def add_product(self, product_name, stores, price=None, barcode=None, supplier="PINNACLE FOODS (M) SDN BHD", category=None, initial_stock=0):
         """Add new product to specified stores"""
+        error = self.check_barcode(barcode, product_name)
+        if error:
+            return False, error
+        
         # Check if user is admin
         if st.session_state.user not in st.session_state.users or st.session_state.users[st.session_state.user]['role'] != 'admin':
             # Add to pending changes for admin approval
@@ -881,18 +4932,13 @@ class StockManager:
                 'status': 'pending'
             }
             self.pending_changes.append(change_request)
-            self.save_all_data()
+            self.save_data('pending_changes')
             return False, "Change request submitted for admin approval"
         
         # Admin can make changes directly
-        if product_name not in self.all_products:
-            self.all_products.append(product_name)
-            self.all_products.sort()
-        
         for store in stores:
             if store in self.data:
-                if product_name not in self.data[store]:
-                    self.data[store].append(product_name)
+                self.add_to_store(store, product_name)
         
         # Set price (use estimated price if not provided)
         if price is not None:
@@ -901,7 +4947,8 @@ class StockManager:
             self.product_prices[product_name] = self.estimate_price(product_name)
         
         if barcode:
-            self.product_barcodes[product_name] = barcode
+            self.product_barcodes[product_name] = BarcodeIndex.normalize(barcode)
+            self.barcode_index.refresh(product_name)
             
         self.product_suppliers[product_name] = supplier
         
@@ -911,13 +4958,16 @@ class StockManager:
         else:
             self.product_categories[product_name] = self.get_product_category(product_name)
         
-        # Set initial stock
-        self.product_stock[product_name] = initial_stock
+        # Set initial stock, shared out over the product's stores
+        self.spread_stock(product_name, initial_stock, [store for store in stores if store in self.data], reason='initial')
         
         # Save all changes
-        self.save_all_data()
+        self.mark_dirty('store_data', *stores)
+        self.mark_product_dirty(product_name)
+        self.save_data()
         return True, f"Product '{product_name}' added successfully!"
     
+    @shared_write
     def add_store(self, store_name, initial_products=None):
         """Add new store with optional initial products"""
         # Check if user is admin
@@ -927,11 +4977,18 @@ class StockManager:
         if store_name not in self.data:
             if initial_products is None:
                 initial_products = []
-            self.data[store_name] = initial_products
-            self.save_all_data()
+            self.data[store_name] = Assortment(self.registry)
+            self.locations.add_store(store_name)
+            self.availability.add_store(store_name)
+            self.categories.add_store(store_name)
+            for product in initial_products:
+                self.add_to_store(store_name, product)
+            self.mark_dirty('store_data', store_name)
+            self.save_data()
             return True, f"Store '{store_name}' added successfully!"
         return False, "Store already exists"
     
+    @shared_write
     def add_products_to_store(self, store_name, products):
         """Add multiple products to a specific store"""
         # Check if user is admin
@@ -940,12 +4997,13 @@ class StockManager:
         
         if store_name in self.data:
             for product in products:
-                if product not in self.data[store_name]:
-                    self.data[store_name].append(product)
-            self.save_all_data()
+                self.add_to_store(store_name, product)
+            self.mark_dirty('store_data', store_name)
+            self.save_data()
             return True, f"Added {len(products)} products to {store_name}"
         return False, "Store not found"
     
+    @shared_write
     def delete_product(self, product_name):
         """Delete a product from all stores and product lists"""
         # Check if user is admin
@@ -953,13 +5011,9 @@ class StockManager:
             return False, "Only admin users can delete products"
         
         # Remove from all stores
-        for store in self.data:
-            if product_name in self.data[store]:
-                self.data[store].remove(product_name)
-        
-        # Remove from product lists
-        if product_name in self.all_products:
-            self.all_products.remove(product_name)
+        for store in self.find_product_locations(product_name):
+            self.remove_from_store(store, product_name)
+            self.mark_dirty('store_data', store)
         
         # Remove from prices, barcodes, suppliers, and stock
         if product_name in self.product_prices:
@@ -970,15 +5024,18 @@ class StockManager:
             del self.product_suppliers[product_name]
         if product_name in self.product_categories:
             del self.product_categories[product_name]
-        if product_name in self.product_stock:
-            del self.product_stock[product_name]
+        self.barcode_index.refresh(product_name)
+        self.reorder_points.clear(product_name)
+        self.registry.remove(product_name)
         
         # Save all changes
-        self.save_all_data()
+        self.mark_product_dirty(product_name)
+        self.save_data()
         
         return True, f"Product '{product_name}' deleted successfully"
     
-    def merge_products(self, product_to_keep, product_to_remove):
+    @shared_write
+    def merge_products(self, product_to_keep, product_to_remove, save=True):
         """Merge two products - keep one and remove the other"""
         # Check if user is admin
         if st.session_state.user not in st.session_state.users or st.session_state.users[st.session_state.user]['role'] != 'admin':
@@ -987,16 +5044,12 @@ class StockManager:
         if product_to_keep == product_to_remove:
             return False, "Cannot merge the same product"
         
-        # Update all stores
-        for store in self.data:
-            if product_to_remove in self.data[store]:
-                self.data[store].remove(product_to_remove)
-                if product_to_keep not in self.data[store]:
-                    self.data[store].append(product_to_keep)
-        
-        # Update product lists
-        if product_to_remove in self.all_products:
-            self.all_products.remove(product_to_remove)
+        # Update all stores, adding the removed product's units to the kept one's
+        self.move_store_stock(product_to_remove, product_to_keep)
+        for store in self.find_product_locations(product_to_remove):
+            self.remove_from_store(store, product_to_remove)
+            self.add_to_store(store, product_to_keep)
+            self.mark_dirty('store_data', store)
         
         # Update prices, barcodes, suppliers, stock
         if product_to_remove in self.product_prices:
@@ -1019,85 +5072,137 @@ class StockManager:
                 self.product_categories[product_to_keep] = self.product_categories[product_to_remove]
             del self.product_categories[product_to_remove]
             
-        if product_to_remove in self.product_stock:
-            if product_to_keep not in self.product_stock:
-                self.product_stock[product_to_keep] = self.product_stock[product_to_remove]
-            del self.product_stock[product_to_remove]
+        self.barcode_index.refresh(product_to_keep, product_to_remove)
+        self.reorder_points.move(product_to_remove, product_to_keep)
+        self.refresh_stock_alerts(product_to_keep)
+        self.registry.remove(product_to_remove)
+        self.record_rename(product_to_remove, product_to_keep)
         
         # Save all changes
-        self.save_all_data()
+        self.mark_product_dirty(product_to_keep, product_to_remove)
+        if save:
+            self.save_data()
             
         return True, f"Successfully merged {product_to_remove} into {product_to_keep}"
     
+    @shared_read
+    def find_duplicate_products(self, min_score=0.8):
+        """Get ranked (product_to_keep, product_to_remove, score) merge candidates"""
+        return DuplicateFinder(min_score).candidates(self.all_products, self.get_product_coverage())
+    
+    @shared_write
+    def merge_many(self, merges):
+        """Merge (product_to_keep, product_to_remove, ...) pairs in order and save once"""
+        messages = []
+        for product_to_keep, product_to_remove, *_ in merges:
+            success, message = self.merge_products(product_to_keep, product_to_remove, save=False)
+            if not success:
+                return False, message
+            messages.append(message)
+        self.save_data()
+        return True, f"Merged {len(messages)} products"
+    
+    @shared_write
     def update_product(self, old_name, new_name, price, barcode, supplier, stores, category, stock_quantity):
         """Update product details"""
         # Check if user is admin
         if st.session_state.user not in st.session_state.users or st.session_state.users[st.session_state.user]['role'] != 'admin':
             return False, "Only admin users can update products"
         
+        error = self.check_barcode(barcode, old_name, new_name)
+        if error:
+            return False, error
+        
+        previous_stock = self.get_stock_quantity(old_name)
+        changed_stores = set()
         if old_name != new_name:
-            # Rename product in all locations
-            for store in self.data:
-                if old_name in self.data[store]:
-                    self.data[store].remove(old_name)
-                    self.data[store].append(new_name)
-            
-            # Update product lists
-            if old_name in self.all_products:
-                self.all_products.remove(old_name)
-                self.all_products.append(new_name)
-                self.all_products.sort()
-            
-            # Update data dictionaries
-            if old_name in self.product_prices:
-                self.product_prices[new_name] = self.product_prices.pop(old_name)
-            if old_name in self.product_barcodes:
-                self.product_barcodes[new_name] = self.product_barcodes.pop(old_name)
-            if old_name in self.product_suppliers:
-                self.product_suppliers[new_name] = self.product_suppliers.pop(old_name)
-            if old_name in self.product_categories:
-                self.product_categories[new_name] = self.product_categories.pop(old_name)
-            if old_name in self.product_stock:
-                self.product_stock[new_name] = self.product_stock.pop(old_name)
+            changed_stores.update(self.find_product_locations(old_name))
+            if self.registry.id_of(new_name) is None and self.registry.id_of(old_name) is not None:
+                # The product keeps its ID, so every store and attribute follows the rename
+                self.registry.rename(old_name, new_name)
+                self.prices.invalidate(new_name)
+                self.categories.renamed(new_name)
+                self.search_index().renamed(new_name)
+                self.product_order.rename(old_name, new_name)
+                # Per-store stock is saved by store, under product names
+                self.mark_dirty('store_stock', *self.store_stock.by_store(new_name))
+            else:
+                # Renaming onto an existing product folds the old one into it
+                self.move_store_stock(old_name, new_name)
+                # The form showed the old product's total, so apply its edit to the merged total
+                merged_stock = self.get_stock_quantity(new_name)
+                stock_quantity += merged_stock - previous_stock
+                previous_stock = merged_stock
+                for store in self.find_product_locations(old_name):
+                    self.remove_from_store(store, old_name)
+                    self.add_to_store(store, new_name)
+                for attribute in (self.product_prices, self.product_barcodes, self.product_suppliers,
+                                  self.product_categories):
+                    if old_name in attribute:
+                        attribute[new_name] = attribute.pop(old_name)
+                self.barcode_index.refresh(old_name, new_name)
+                self.reorder_points.move(old_name, new_name)
+                self.refresh_stock_alerts(new_name)
+                self.registry.remove(old_name)
+            self.record_rename(old_name, new_name)
         
         # Update product details
         self.product_prices[new_name] = price
-        self.product_barcodes[new_name] = barcode
+        self.product_barcodes[new_name] = BarcodeIndex.normalize(barcode) or ''
+        self.barcode_index.refresh(new_name)
         self.product_suppliers[new_name] = supplier
         self.product_categories[new_name] = category
-        self.product_stock[new_name] = stock_quantity
         
         # Update store availability
-        for store in self.data:
-            if store in stores:
-                if new_name not in self.data[store]:
-                    self.data[store].append(new_name)
-            else:
-                if new_name in self.data[store]:
-                    self.data[store].remove(new_name)
+        for store in self.find_product_locations(new_name):
+            if store not in stores:
+                self.remove_from_store(store, new_name)
+                changed_stores.add(store)
+        for store in stores:
+            if store in self.data:
+                if self.add_to_store(store, new_name):
+                    changed_stores.add(store)
+        
+        # A changed total is shared out afresh; otherwise each store keeps its own count
+        if stock_quantity != previous_stock:
+            self.spread_stock(new_name, stock_quantity, self.find_product_locations(new_name))
         
         # Save all changes
-        self.save_all_data()
+        self.mark_dirty('store_data', *changed_stores)
+        self.mark_product_dirty(old_name, new_name)
+        self.save_data()
         
         return True, f"Successfully updated {new_name}"
     
     def save_po(self, po_data):
         """Save a purchase order"""
-        po_number = po_data['po_number']
-        self.saved_pos[po_number] = po_data
-        self.save_all_data()
+        self.purchase_orders.save(po_data)
         return True
     
+    def group_by_category(self, products):
+        """Group a list of products by category, keeping their order"""
+        return self.categories.group(products)
+    
     def get_po_categories(self, products):
         """Get categories for PO products"""
-        categories = {}
-        for product in products:
-            category = self.product_categories.get(product, "Uncategorized")
-            if category not in categories:
-                categories[category] = []
-            categories[category].append(product)
-        return categories
+        return self.group_by_category(products)
+    
+    @shared_read
+    def get_pending_changes(self):
+        """Get a copy of the change requests waiting for admin approval"""
+        return list(self.pending_changes)
     
+    @shared_read
+    def get_store_addresses(self):
+        """Get a copy of store name -> delivery address"""
+        return dict(self.store_addresses)
+    
+    @shared_read
+    def get_product_position(self, product_name):
+        """Get a product's position in all_products, or 0 if it is not carried"""
+        return self.product_order.index(product_name) if product_name in self.product_order else 0
+    
+    @shared_read
     def get_address_options(self):
         """Get formatted address options for dropdown"""
         options = []
@@ -1242,7 +5347,7 @@ def show_admin_panel():
     with tab3:
         st.subheader("Pending Changes Approval")
         stock_manager = StockManager()
-        pending_changes = stock_manager.pending_changes
+        pending_changes = stock_manager.get_pending_changes()
         
         if pending_changes:
             for i, change in enumerate(pending_changes):
@@ -1264,36 +5369,41 @@ def show_admin_panel():
                     if st.button(f"Approve Change", key=f"approve_change_{i}"):
                         # Apply the change
                         if change['type'] == 'add_product':
-                            # Admin can directly add the product
-                            if change['product_name'] not in stock_manager.all_products:
-                                stock_manager.all_products.append(change['product_name'])
-                                stock_manager.all_products.sort()
+                            with stock_manager.writing():
+                                # Admin can directly add the product
+                                for store in change['stores']:
+                                    if store in stock_manager.get_stores():
+                                        if stock_manager.add_to_store(store, change['product_name']):
+                                            stock_manager.mark_dirty('store_data', store)
                             
-                            for store in change['stores']:
-                                if store in stock_manager.data:
-                                    if change['product_name'] not in stock_manager.data[store]:
-                                        stock_manager.data[store].append(change['product_name'])
+                                # Set price
+                                stock_manager.product_prices[change['product_name']] = change['price']
                             
-                            # Set price
-                            stock_manager.product_prices[change['product_name']] = change['price']
-                            
-                            if change.get('barcode'):
-                                stock_manager.product_barcodes[change['product_name']] = change['barcode']
+                                if change.get('barcode'):
+                                    success, message = stock_manager.set_barcode(change['product_name'], change['barcode'])
+                                    if not success:
+                                        st.warning(f"⚠️ {message}")
                                 
-                            stock_manager.product_suppliers[change['product_name']] = change['supplier']
-                            stock_manager.product_categories[change['product_name']] = change['category']
-                            stock_manager.product_stock[change['product_name']] = change['initial_stock']
+                                stock_manager.product_suppliers[change['product_name']] = change['supplier']
+                                stock_manager.product_categories[change['product_name']] = change['category']
+                                stock_manager.spread_stock(change['product_name'], change['initial_stock'],
+                                                           [store for store in change['stores'] if store in stock_manager.get_stores()],
+                                                           reason='initial')
                             
-                            # Remove from pending changes
-                            stock_manager.pending_changes.pop(i)
-                            stock_manager.save_all_data()
+                                # Remove from pending changes
+                                if change in stock_manager.pending_changes:
+                                    stock_manager.pending_changes.remove(change)
+                                stock_manager.mark_product_dirty(change['product_name'])
+                                stock_manager.save_data('pending_changes')
                             st.success("Change approved and applied!")
                             time.sleep(1)
                             st.rerun()
                 with col2:
                     if st.button(f"Reject Change", key=f"reject_change_{i}"):
-                        stock_manager.pending_changes.pop(i)
-                        stock_manager.save_all_data()
+                        with stock_manager.writing():
+                            if change in stock_manager.pending_changes:
+                                stock_manager.pending_changes.remove(change)
+                            stock_manager.save_data('pending_changes')
                         st.success("Change rejected!")
                         time.sleep(1)
                         st.rerun()
@@ -1307,15 +5417,17 @@ def show_admin_panel():
         
         st.info("Edit store addresses below. Changes will be reflected in PO delivery address options.")
         
-        for store_name, address in stock_manager.store_addresses.items():
+        for store_name, address in stock_manager.get_store_addresses().items():
             col1, col2 = st.columns([1, 3])
             with col1:
                 st.write(f"**{store_name}**")
             with col2:
                 new_address = st.text_area(f"Address for {store_name}", value=address, key=f"addr_{store_name}")
                 if new_address != address:
-                    stock_manager.store_addresses[store_name] = new_address
-                    stock_manager.save_all_data()
+                    with stock_manager.writing():
+                        stock_manager.store_addresses[store_name] = new_address
+                        stock_manager.mark_dirty('store_addresses', store_name)
+                        stock_manager.save_data()
                     st.success(f"✅ Address updated for {store_name}")
         
         # Add new store address
@@ -1329,8 +5441,10 @@ def show_admin_panel():
         if st.button("Add Store Address"):
             if new_store_name and new_store_address:
                 if new_store_name not in stock_manager.store_addresses:
-                    stock_manager.store_addresses[new_store_name] = new_store_address
-                    stock_manager.save_all_data()
+                    with stock_manager.writing():
+                        stock_manager.store_addresses[new_store_name] = new_store_address
+                        stock_manager.mark_dirty('store_addresses', new_store_name)
+                        stock_manager.save_data()
                     st.success(f"✅ Address added for {new_store_name}")
                 else:
                     st.error("Store name already exists")
@@ -1338,7 +5452,7 @@ def show_admin_panel():
                 st.error("Please enter both store name and address")
 
 def auto_fix_products(stock_manager):
-    """Automatically fix product names and merges"""
+    """Categorize uncategorized products and list likely duplicate products for review"""
     # Check if user is admin
     if st.session_state.users[st.session_state.user]['role'] != 'admin':
         st.error("Only admin users can run auto-fix")
@@ -1346,51 +5460,45 @@ def auto_fix_products(stock_manager):
     
     st.info("🔄 Running auto-fix for products...")
     
-    # Fix Mustard Oil names
     changes_made = False
     
-    # Change MUSTARD OIL 200ML to PRAN MUSTARD OIL 200ML
-    if 'MUSTARD OIL 200ML' in stock_manager.all_products:
-        success, message = stock_manager.update_product(
-            'MUSTARD OIL 200ML', 
-            'PRAN MUSTARD OIL 200ML',
-            stock_manager.product_prices.get('MUSTARD OIL 200ML', 3.00),
-            stock_manager.product_barcodes.get('MUSTARD OIL 200ML', ''),
-            stock_manager.product_suppliers.get('MUSTARD OIL 200ML', 'PINNACLE FOODS (M) SDN BHD'),
-            [store for store in stock_manager.data if 'MUSTARD OIL 200ML' in stock_manager.data[store]],
-            'Mustard Oil',
-            stock_manager.product_stock.get('MUSTARD OIL 200ML', 0)
-        )
-        if success:
-            st.success(f"✅ {message}")
-            changes_made = True
-    
-    # Merge MUSTARD OIL 400ML with PRAN MUSTARD OIL 400ML
-    if 'MUSTARD OIL 400ML' in stock_manager.all_products and 'PRAN MUSTARD OIL 400ML' in stock_manager.all_products:
-        success, message = stock_manager.merge_products('PRAN MUSTARD OIL 400ML', 'MUSTARD OIL 400ML')
-        if success:
-            st.success(f"✅ {message}")
-            changes_made = True
-    
-    # Merge POWER ENERGY DRINK 250ML with POWER ENERGY DRINK PET 250ML
-    if 'POWER ENERGY DRINK 250ML' in stock_manager.all_products and 'POWER ENERGY DRINK PET 250ML' in stock_manager.all_products:
-        success, message = stock_manager.merge_products('POWER ENERGY DRINK PET 250ML', 'POWER ENERGY DRINK 250ML')
-        if success:
-            st.success(f"✅ {message}")
-            changes_made = True
-    
-    # Update categories for PET 320ml products
-    pet_320ml_products = ['PRAN TAMARIND PET 320ML', 'PRAN SOUR PLUM PET 320ML', 'PRAN BIRD NEST PET 320ML']
-    for product in pet_320ml_products:
-        if product in stock_manager.all_products:
+    # Categorize products that have no category yet from their names
+    with stock_manager.writing():
+        uncategorized = [product for product in stock_manager.all_products
+                         if product not in stock_manager.product_categories]
+        if uncategorized:
+            stock_manager.catalog.assign('category', uncategorized, stock_manager.categorize_products(uncategorized))
+            stock_manager.mark_dirty('product_categories', *uncategorized)
+        
+        # Update categories for PET 320ml products, whatever category they were given
+        pet_320ml_products = ['PRAN TAMARIND PET 320ML', 'PRAN SOUR PLUM PET 320ML', 'PRAN BIRD NEST PET 320ML']
+        recategorized = [product for product in pet_320ml_products if product in stock_manager.all_products
+                         and stock_manager.product_categories.get(product) != 'PET 320ml']
+        for product in recategorized:
             stock_manager.product_categories[product] = 'PET 320ml'
-            changes_made = True
+            stock_manager.mark_dirty('product_categories', product)
+        if uncategorized or recategorized:
+            stock_manager.save_data()
+    if uncategorized:
+        st.success(f"✅ Categorized {len(uncategorized)} products")
+        changes_made = True
+    if recategorized:
+        st.success(f"✅ Moved {len(recategorized)} PET 320ml products to the PET 320ml category")
+        changes_made = True
+    
+    # Merging is permanent, so near-duplicate names are only listed for an admin to review
+    candidates = stock_manager.find_duplicate_products()
+    if candidates:
+        st.session_state.duplicate_candidates = candidates
+        st.warning(f"⚠️ Found {len(candidates)} possible duplicate products. Review them under "
+                   "✏️ Edit/Merge Products → Merge Products → Suggested Merges and merge the ones you confirm.")
+        st.dataframe(pd.DataFrame(candidates, columns=['Keep', 'Remove', 'Match']), hide_index=True)
     
     if changes_made:
-        stock_manager.save_all_data()
         st.success("✅ Auto-fix completed successfully!")
-        st.rerun()
-    else:
+        if not candidates:
+            st.rerun()
+    elif not candidates:
         st.info("ℹ️ No changes needed - products are already correct.")
 
 def update_all_prices(stock_manager):
@@ -1402,137 +5510,17 @@ def update_all_prices(stock_manager):
     
     st.info("💰 Updating all product prices to new per piece prices...")
     
-    # Define the new prices per piece (rounded to 2 decimal places)
-    new_prices = {
-        # Barbican products
-        'BARBICAN POMEGRANATE': 4.38,
-        'BARBICAN RASBERRY': 4.38,
-        'BARBICAN APPLE': 4.38,
-        'BARBICAN LEMON': 4.38,
-        'BARBICAN STRAWBERRY': 4.38,
-        'BARBICAN PINEAPPLE': 4.38,
-        
-        # Basil Seed products
-        'PRAN BASIL SEED MANGO': 2.42,
-        'PRAN BASIL SEED ORANGE': 2.42,
-        'PRAN BASIL SEED STRAWBERRY': 2.42,
-        'PRAN BASIL SEED KIWI': 2.42,
-        'PRAN BASIL SEED LITCHI': 2.42,
-        'PRAN BASIL SEED COCKTAIL': 2.42,
-        'PRAN BASIL SEED PINEAPPLE': 2.42,
-        'PRAN BASIL SEED POMEGRANATE': 2.42,
-        'PRAN BASIL SEED COCONUT': 2.42,
-        
-        # BES Minuman products
-        'PRAN BES MINUMAN BERPERISA ANGGUR': 2.00,
-        'PRAN BES MINUMAN BERPERISA OREN': 2.00,
-        'PRAN BES MINUMAN BERPERISA JAGUNG': 2.00,
-        'PRAN BES MINUMAN BERPERISA LYCHEE': 2.00,
-        'PRAN BES MINUMAN BERPERISA ROSE': 2.00,
-        'PRAN BES MINUMAN BERPERISA SARSI': 2.00,
-        
-        # Humpty Dumpty
-        'HUMPTY DUMPTY': 2.00,
-        
-        # Power Energy Drink
-        'POWER ENERGY DRINK PET 250ML': 1.42,
-        
-        # Vegetable Ghee
-        'PRAN VEGETABLE GHEE 450G': 10.63,
-        'PRAN VEGETABLE GHEE 125G': 4.13,
-        
-        # Coconut Water
-        'PRAN COCONUT WATER': 1.67,
-        
-        # Lemon Teh
-        'PRAN AIS LEMON TEH': 1.63,
-        
-        # Paradise
-        'PRAN PREMIO PARADISE': 3.11,
-        
-        # Chanachur
-        'PRAN CHANACHUR HOT 250G': 3.13,
-        'PRAN CHANACHUR BBQ 250G': 3.13,
-        
-        # Jus 1000ml
-        'PRAN JUS PET 1000ML MANGO': 3.75,
-        'PRAN JUS PET 1000ML ORANGE': 3.75,
-        'PRAN JUS PET 1000ML APPLE': 3.75,
-        
-        # Jus 330ml
-        'PRAN JUS 330ML APPLE': 1.50,
-        'PRAN JUS 330ML ORANGE': 1.50,
-        'PRAN JUS 330ML MANGO': 1.50,
-        
-        # PET 320ml
-        'PRAN TAMARIND PET 320ML': 1.50,
-        'PRAN SOUR PLUM PET 320ML': 1.50,
-        'PRAN BIRD NEST PET 320ML': 1.50,
-        
-        # Drinko 250ml
-        'DRINKO FLOAT 250ML MANGO': 1.50,
-        'DRINKO FLOAT 250ML STRAWBERRY': 1.50,
-        'DRINKO FLOAT 250ML LYCHEE': 1.50,
-        
-        # Drinko 330ml
-        'DRINKO FLOAT 330ML MANGO': 2.00,
-        'DRINKO FLOAT 330ML STRAWBERRY': 2.00,
-        'DRINKO FLOAT 330ML LYCHEE': 2.00,
-        'DRINKO FLOAT 330ML ORANGE': 2.00,
-        'DRINKO FLOAT 330ML PINEAPPLE': 2.00,
-        
-        # Lassi 285ml
-        'PRAN LASSI 285ML YOGURT': 1.69,
-        'PRAN LASSI 285ML MANGO': 1.69,
-        'PRAN LASSI 285ML BANANA': 1.69,
-        'PRAN LASSI 285ML STRAWBERRY': 1.69,
-        
-        # Soya Can
-        'PRAN SOYA CAN 300ML': 1.00,
-        
-        # Cooling Tamarind
-        'PRAN COOLING TAMARIND': 1.38,
-        
-        # Jus 1.5L
-        'PRAN JUS PET VALUE PACK 1.5L MANGO': 11.00,
-        'PRAN JUS PET VALUE PACK 1.5L ORANGE': 11.00,
-        
-        # Mustard Oil
-        'PRAN MUSTARD OIL 400ML': 5.83,
-        'PRAN MUSTARD OIL 200ML': 3.00,
-        
-        # Lollipop
-        'PRAN VARIETY LOLLIPOP': 30.00,
-        
-        # Puffed Rice
-        'PRAN PUFFED RICE 400G': 2.75,
-        
-        # Creamer
-        'PRAN CREAMER 500GM': 2.75,
-        'PRAN CREAMER 500GM EASY OPEN': 2.92,
-        
-        # Choco Stick
-        'PRAN CHOCO STICK': 0.70,
-        
-        # Bombay Briyani
-        'BOMBAY BRIYANI MASALA': 2.92,
-        
-        # Potata Biscuits
-        'PRAN POTATA BISCUITS 100GM': 1.60,
-        
-        # Other products
-        'PRAN SWEETENED CREAMER 500GM': 5.00,
-    }
-    
-    updated_count = 0
-    for product in stock_manager.all_products:
-        for key, price in new_prices.items():
-            if key in product.upper():
-                stock_manager.product_prices[product] = price
-                updated_count += 1
-                break
+    # Match every product against the list prices in one pass
+    with stock_manager.writing():
+        products = list(stock_manager.all_products)
+        new_prices = stock_manager.classifier.list_prices(products)
+        matched = ~np.isnan(new_prices)
+        updated = [product for product, found in zip(products, matched) if found]
+        stock_manager.catalog.assign('price', updated, new_prices[matched])
+        stock_manager.mark_dirty('product_prices', *updated)
+        stock_manager.save_data()
+    updated_count = len(updated)
     
-    stock_manager.save_all_data()
     st.success(f"✅ Updated prices for {updated_count} products to new per piece prices!")
     st.rerun()
 
@@ -1541,10 +5529,12 @@ def show_dashboard(stock_manager):
     
     col1, col2, col3, col4 = st.columns(4)
     
-    total_stores = len(stock_manager.data)
+    store_stats = stock_manager.get_store_product_counts()
+    counts = np.fromiter(store_stats.values(), dtype=np.int64, count=len(store_stats))
+    total_stores = len(store_stats)
     total_products = len(stock_manager.all_products)
-    avg_products = int(np.mean([len(products) for products in stock_manager.data.values()]))
-    most_stocked_store = max(stock_manager.data.keys(), key=lambda x: len(stock_manager.data[x]))
+    avg_products = int(counts.mean()) if total_stores else 0
+    most_stocked_store = list(store_stats)[int(counts.argmax())] if total_stores else "-"
     
     with col1:
         st.markdown(f"""
@@ -1583,7 +5573,6 @@ def show_dashboard(stock_manager):
         """, unsafe_allow_html=True)
     
     st.subheader("Store Inventory Distribution")
-    store_stats = {store: len(products) for store, products in stock_manager.data.items()}
     
     col1, col2 = st.columns([2, 1])
     
@@ -1598,17 +5587,86 @@ def show_dashboard(stock_manager):
         st.write("**Store Rankings:**")
         for store, count in sorted(store_stats.items(), key=lambda x: x[1], reverse=True):
             st.write(f"• {store}: {count} products")
+    
+    st.subheader("Category Coverage")
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        coverage = stock_manager.get_category_coverage()
+        coverage_data = pd.DataFrame({
+            'Category': list(coverage.keys()),
+            'Coverage (%)': [round(share * 100, 1) for share in coverage.values()]
+        })
+        st.bar_chart(coverage_data.set_index('Category'))
+    
+    with col2:
+        product = st.selectbox("Stores missing product", stock_manager.all_products, key="dashboard_missing_product")
+        if product:
+            missing = stock_manager.get_stores_missing(product)
+            if missing:
+                for store in missing:
+                    st.write(f"• {store}")
+            else:
+                st.success("✅ Available in all stores")
+    
+    st.subheader("⚠️ Low Stock")
+    col1, col2 = st.columns([1, 3])
+    
+    with col1:
+        alert_store = st.selectbox("Store", ["All Stores"] + stock_manager.get_stores(), key="low_stock_store")
+        alert_store = None if alert_store == "All Stores" else alert_store
+        out_count, low_count = stock_manager.get_stock_alert_counts(alert_store)
+        st.metric("Out of Stock", out_count)
+        st.metric("Low Stock", low_count)
+    
+    with col2:
+        # Only the alerts shown are read, however many products there are
+        alerts = stock_manager.get_stock_alerts(alert_store, limit=100)
+        if alerts:
+            st.dataframe(pd.DataFrame(alerts, columns=['Store', 'Product', 'Units', 'Reorder Point']),
+                         hide_index=True, use_container_width=True)
+            if out_count + low_count > len(alerts):
+                st.caption(f"Showing the first {len(alerts)} of {out_count + low_count} alerts, out of stock first.")
+        else:
+            st.success("✅ No products at or below their reorder point")
+    
+    st.subheader("📈 Stock Movement")
+    col1, col2 = st.columns([1, 3])
+    
+    with col1:
+        period = st.selectbox("Period", ["week", "day"], format_func={"week": "Weekly", "day": "Daily"}.get,
+                              key="movement_period")
+        movement_category = st.selectbox("Category", ["All Categories"] + stock_manager.get_movement_categories(),
+                                         key="movement_category")
+        movement_category = None if movement_category == "All Categories" else movement_category
+        direction = st.radio("Units", ["out", "in"], format_func=lambda direction: f"Units {direction}",
+                             horizontal=True, key="movement_direction")
+    
+    with col2:
+        # Reads the per-store counters of the buckets shown, not the ledger itself
+        movement = stock_manager.get_stock_movement(period, movement_category, direction,
+                                                    last=12 if period == "week" else 28)
+        if movement.values.any():
+            st.bar_chart(movement)
+        else:
+            st.info("No stock movements in this period yet")
 
 def check_stock(stock_manager):
     st.header("🔍 Check Product Availability")
     
+    scanned = st.text_input("📷 Scan or enter barcode", key="scan_barcode")
+    scanned_product = stock_manager.find_product_by_barcode(scanned) if scanned.strip() else None
+    if scanned.strip() and scanned_product is None:
+        st.warning(f"⚠️ No product has barcode {scanned.strip()}")
+    
     col1, col2 = st.columns([2, 1])
     
     with col1:
-        product_name = st.selectbox("Select Product", stock_manager.all_products)
+        index = stock_manager.get_product_position(scanned_product)
+        product_name = st.selectbox("Select Product", stock_manager.all_products, index=index)
     
     with col2:
-        store_filter = st.selectbox("Store Filter", ["All Stores"] + list(stock_manager.data.keys()))
+        store_filter = st.selectbox("Store Filter", ["All Stores"] + stock_manager.get_stores())
     
     if product_name:
         store_name = None if store_filter == "All Stores" else store_filter
@@ -1621,26 +5679,27 @@ def check_stock(stock_manager):
         st.write(f"**Category:** {category}")
         
         # Show stock quantity and status
-        stock_status, status_class = stock_manager.get_stock_status(product_name)
+        stock_status, status_class = stock_manager.get_stock_status(product_name, store_name)
         st.markdown(f'<div class="{status_class}"><strong>Stock Status:</strong> {stock_status}</div>', unsafe_allow_html=True)
         
         if store_filter == "All Stores":
             cols = st.columns(3)
             available_count = 0
+            store_stock = stock_manager.get_store_stock(product_name)
             
             for i, (store, available) in enumerate(results.items()):
                 col_idx = i % 3
                 with cols[col_idx]:
                     if available:
-                        st.markdown(f'<div class="store-card"><span class="available">✅ {store}</span></div>', unsafe_allow_html=True)
+                        st.markdown(f'<div class="store-card"><span class="available">✅ {store}</span><br><small>{store_stock[store]} units</small></div>', unsafe_allow_html=True)
                         available_count += 1
                     else:
                         st.markdown(f'<div class="store-card"><span class="not-available">❌ {store}</span></div>', unsafe_allow_html=True)
             
-            st.info(f"**Summary:** Available in {available_count} out of {len(results)} stores")
+            st.info(f"**Summary:** Available in {available_count} out of {len(results)} stores, {sum(store_stock.values())} units in total")
         else:
             if results[store_filter]:
-                st.success(f"✅ **Available** at {store_filter}")
+                st.success(f"✅ **Available** at {store_filter}: {stock_manager.get_stock_quantity(product_name, store_filter)} units")
             else:
                 st.error(f"❌ **Not Available** at {store_filter}")
 
@@ -1662,50 +5721,50 @@ def find_locations(stock_manager):
         
         if locations:
             st.success(f"**{product_name}** is available in **{len(locations)}** stores:")
+            store_stock = stock_manager.get_store_stock(product_name)
             cols = st.columns(3)
             for i, location in enumerate(locations):
                 with cols[i % 3]:
-                    st.markdown(f'<div class="store-card">🏪 {location}</div>', unsafe_allow_html=True)
+                    st.markdown(f'<div class="store-card">🏪 {location}<br><small>{store_stock[location]} units</small></div>', unsafe_allow_html=True)
         else:
             st.error(f"**{product_name}** is not available in any store.")
 
 def store_inventory(stock_manager):
     st.header("🏪 Store Inventory")
     
-    selected_store = st.selectbox("Select Store", list(stock_manager.data.keys()))
+    selected_store = st.selectbox("Select Store", stock_manager.get_stores())
     
     if selected_store:
-        products = stock_manager.data[selected_store]
+        products = stock_manager.get_store_products(selected_store)
         
         st.subheader(f"Inventory for {selected_store}")
-        st.write(f"**Total Products:** {len(products)}")
-        
-        # Group products by category
-        products_by_category = {}
-        for product in products:
-            category = stock_manager.product_categories.get(product, "Uncategorized")
-            if category not in products_by_category:
-                products_by_category[category] = []
-            products_by_category[category].append(product)
+        st.write(f"**Total Products:** {len(products)} | **Units on Hand:** {stock_manager.get_store_stock_totals()[selected_store]}")
         
         search_term = st.text_input("🔍 Search products...")
         
+        # Group products by category, keeping search matches in rank order
+        if search_term:
+            products_by_category = stock_manager.group_by_category(stock_manager.search_products(search_term, selected_store))
+        else:
+            products_by_category = stock_manager.get_products_by_category(selected_store)
+        
         # Use appropriate styling based on dark mode
         dark_mode = st.session_state.get('dark_mode', False)
         product_class = "product-card dark-mode" if dark_mode else "product-card"
         
-        for category, category_products in sorted(products_by_category.items()):
-            filtered_products = [p for p in category_products if search_term.lower() in p.lower()] if search_term else category_products
-            
+        category_stock = stock_manager.get_category_stock(selected_store)
+        for category, filtered_products in sorted(products_by_category.items()):
             if filtered_products:
-                with st.expander(f"{category} ({len(filtered_products)} products)"):
+                with st.expander(f"{category} ({len(filtered_products)} products, {category_stock.get(category, 0)} units)"):
                     cols = st.columns(2)
+                    prices = stock_manager.resolve_prices(filtered_products)
                     for i, product in enumerate(filtered_products):
                         with cols[i % 2]:
-                            barcode = stock_manager.product_barcodes.get(product, "No barcode")
-                            price = stock_manager.product_prices.get(product, stock_manager.estimate_price(product))
-                            supplier = stock_manager.product_suppliers.get(product, "PINNACLE FOODS (M) SDN BHD")
-                            stock_status, status_class = stock_manager.get_stock_status(product)
+                            row = stock_manager.catalog.row(product)
+                            barcode = row.value('barcode', "No barcode")
+                            price = prices[i]
+                            supplier = row.value('supplier', "PINNACLE FOODS (M) SDN BHD")
+                            stock_status, status_class = stock_manager.get_stock_status(product, selected_store)
                             
                             st.markdown(f'''
                             <div class="{product_class}">
@@ -1725,27 +5784,17 @@ def all_products(stock_manager):
         search_term = st.text_input("🔍 Search products...")
     with col2:
         # Get all unique categories
-        all_categories = sorted(list(set(stock_manager.product_categories.values())))
+        all_categories = stock_manager.get_categories()
         category_filter = st.selectbox("Filter by Category", ["All Categories"] + all_categories)
     
-    # Group products by category
-    products_by_category = {}
-    for product in stock_manager.all_products:
-        category = stock_manager.product_categories.get(product, "Uncategorized")
-        if category not in products_by_category:
-            products_by_category[category] = []
-        products_by_category[category].append(product)
-    
-    # Filter products
-    if search_term or category_filter != "All Categories":
-        filtered_products_by_category = {}
-        for category, products in products_by_category.items():
-            if category_filter != "All Categories" and category != category_filter:
-                continue
-            filtered_products = [p for p in products if search_term.lower() in p.lower()] if search_term else products
-            if filtered_products:
-                filtered_products_by_category[category] = filtered_products
-        products_by_category = filtered_products_by_category
+    # Group products by category, keeping search matches in rank order
+    if search_term:
+        products_by_category = stock_manager.group_by_category(stock_manager.search_products(search_term))
+    else:
+        products_by_category = stock_manager.get_products_by_category()
+    if category_filter != "All Categories":
+        products_by_category = {category: products for category, products in products_by_category.items()
+                                if category == category_filter}
     
     total_filtered = sum(len(products) for products in products_by_category.values())
     st.write(f"**Showing {total_filtered} products:**")
@@ -1753,16 +5802,19 @@ def all_products(stock_manager):
     # Use appropriate styling based on dark mode
     dark_mode = st.session_state.get('dark_mode', False)
     product_class = "product-card dark-mode" if dark_mode else "product-card"
+    store_counts = stock_manager.get_product_coverage()
     
     for category, products in sorted(products_by_category.items()):
         with st.expander(f"{category} ({len(products)} products)"):
             cols = st.columns(2)
+            prices = stock_manager.resolve_prices(products)
             for i, product in enumerate(products):
                 with cols[i % 2]:
-                    store_count = len(stock_manager.find_product_locations(product))
-                    price = stock_manager.product_prices.get(product, stock_manager.estimate_price(product))
-                    barcode = stock_manager.product_barcodes.get(product, "No barcode")
-                    supplier = stock_manager.product_suppliers.get(product, "PINNACLE FOODS (M) SDN BHD")
+                    row = stock_manager.catalog.row(product)
+                    store_count = store_counts.get(product, 0)
+                    price = prices[i]
+                    barcode = row.value('barcode', "No barcode")
+                    supplier = row.value('supplier', "PINNACLE FOODS (M) SDN BHD")
                     stock_status, status_class = stock_manager.get_stock_status(product)
                     
                     st.markdown(f'''
@@ -1790,11 +5842,11 @@ def add_products_stores(stock_manager):
             initial_stock = st.number_input("Initial Stock Quantity", min_value=0, value=10, step=1)
         with col2:
             barcode = st.text_input("Barcode (Optional)")
-            available_stores = st.multiselect("Available in Stores", list(stock_manager.data.keys()))
+            available_stores = st.multiselect("Available in Stores", stock_manager.get_stores())
             supplier = st.selectbox("Supplier", ["PINNACLE FOODS (M) SDN BHD", "PRAN", "BARBICAN", "DRINKO", "OTHER"])
         
         # Category selection
-        all_categories = sorted(list(set(stock_manager.product_categories.values())))
+        all_categories = stock_manager.get_assignable_categories()
         category = st.selectbox("Category", all_categories + ["Auto-detect from name"])
         
         if st.button("Add Product"):
@@ -1838,15 +5890,15 @@ def add_products_stores(stock_manager):
         
         col1, col2 = st.columns(2)
         with col1:
-            selected_store = st.selectbox("Select Store", list(stock_manager.data.keys()))
+            selected_store = st.selectbox("Select Store", stock_manager.get_stores())
         with col2:
             # Show current products in the store
-            current_products = stock_manager.data.get(selected_store, [])
+            current_products = stock_manager.get_store_products(selected_store)
             st.write(f"**Current products in {selected_store}:** {len(current_products)}")
         
         # Get products not currently in the store
         all_products = stock_manager.all_products
-        store_products = stock_manager.data.get(selected_store, [])
+        store_products = stock_manager.get_store_products(selected_store)
         available_products = [p for p in all_products if p not in store_products]
         
         products_to_add = st.multiselect("Select products to add", available_products)
@@ -1870,27 +5922,85 @@ def add_products_stores(stock_manager):
         new_barcode = st.text_input("Barcode", value=current_barcode)
         
         if st.button("Update Barcode"):
-            if selected_product and new_barcode:
-                stock_manager.product_barcodes[selected_product] = new_barcode
-                stock_manager.save_all_data()
-                st.success(f"✅ Barcode updated for '{selected_product}'")
+            if selected_product and new_barcode.strip():
+                success, message = stock_manager.set_barcode(selected_product, new_barcode)
+                if success:
+                    st.success(f"✅ {message}")
+                else:
+                    st.error(f"❌ {message}")
+        
+        duplicates = stock_manager.get_duplicate_barcodes()
+        if duplicates:
+            st.warning(f"⚠️ {len(duplicates)} barcodes are shared by more than one product; scans find the first listed")
+            for barcode, products in sorted(duplicates.items()):
+                st.write(f"- **{barcode}:** {', '.join(products)}")
     
     with tab5:
         st.subheader("Manage Product Stock")
         
         selected_product = st.selectbox("Select Product", stock_manager.all_products, key="stock_product")
-        current_stock = stock_manager.get_stock_quantity(selected_product)
-        stock_status, status_class = stock_manager.get_stock_status(selected_product)
+        stock_stores = stock_manager.find_product_locations(selected_product) if selected_product else []
+        selected_store = st.selectbox("Select Store", stock_stores, key="stock_store")
+        current_stock = stock_manager.get_stock_quantity(selected_product, selected_store) if selected_store else 0
+        stock_status, status_class = stock_manager.get_stock_status(selected_product, selected_store)
         
         st.markdown(f'<div class="{status_class}"><strong>Current Stock Status:</strong> {stock_status}</div>', unsafe_allow_html=True)
         
         new_stock = st.number_input("Update Stock Quantity", min_value=0, value=current_stock, step=1)
+        reason = st.selectbox("Reason", list(StockMovements.REASONS), format_func=StockMovements.REASONS.get,
+                              key="stock_reason")
         
         if st.button("Update Stock"):
-            if selected_product:
-                stock_manager.update_stock(selected_product, new_stock)
-                st.success(f"✅ Stock updated for '{selected_product}' to {new_stock} units")
+            if selected_product and selected_store:
+                stock_manager.update_stock(selected_product, new_stock, selected_store, reason)
+                st.success(f"✅ Stock updated for '{selected_product}' at {selected_store} to {new_stock} units")
                 st.rerun()
+        
+        if selected_product:
+            store_stock = stock_manager.get_store_stock(selected_product)
+            st.dataframe(pd.DataFrame({'Store': list(store_stock), 'Units': list(store_stock.values()),
+                                       'Reorder Point': [stock_manager.get_reorder_point(selected_product, store)
+                                                         for store in store_stock]}),
+                         hide_index=True, use_container_width=True)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                point_scope = st.selectbox("Reorder Point For", ["All Stores"] + stock_stores, key="reorder_scope")
+            point_store = None if point_scope == "All Stores" else point_scope
+            with col2:
+                new_point = st.number_input("Reorder Point", min_value=0, step=1,
+                                            value=stock_manager.get_reorder_point(selected_product, point_store))
+            if st.button("Set Reorder Point"):
+                success, message = stock_manager.set_reorder_point(selected_product, new_point, point_store)
+                if success:
+                    st.success(f"✅ {message}")
+                    st.rerun()
+                else:
+                    st.error(f"❌ {message}")
+            
+            new_pack = st.number_input("Pack Size (units per order multiple)", min_value=1, step=1,
+                                       value=stock_manager.get_pack_size(selected_product))
+            if st.button("Set Pack Size"):
+                success, message = stock_manager.set_pack_size(selected_product, new_pack)
+                if success:
+                    st.success(f"✅ {message}")
+                    st.rerun()
+                else:
+                    st.error(f"❌ {message}")
+        
+        # Build the CSV only while the section is open
+        expander, expanded = lazy_expander("Import / Export Stock", key="stock_csv_expander")
+        with expander:
+            if expanded:
+                st.download_button("📥 Download Stock CSV", stock_manager.export_stock_csv(),
+                                   file_name="store_stock.csv", mime="text/csv")
+                stock_file = st.file_uploader("Upload Stock CSV (Store, Product, Quantity)", type=["csv"], key="stock_csv")
+                if stock_file is not None and st.button("Import Stock"):
+                    success, message = stock_manager.import_stock_csv(stock_file.getvalue().decode('utf-8-sig'))
+                    if success:
+                        st.success(f"✅ {message}")
+                    else:
+                        st.error(f"❌ {message}")
 
 def edit_merge_products(stock_manager):
     st.header("✏️ Edit & Merge Products")
@@ -1906,7 +6016,7 @@ def edit_merge_products(stock_manager):
             col1, col2 = st.columns(2)
             with col1:
                 new_name = st.text_input("Product Name", value=product_to_edit)
-                current_price = stock_manager.product_prices.get(product_to_edit, stock_manager.estimate_price(product_to_edit))
+                current_price = stock_manager.resolve_price(product_to_edit)
                 new_price = st.number_input("Price (RM)", min_value=0.0, value=float(current_price), step=0.1)
                 current_stock = stock_manager.get_stock_quantity(product_to_edit)
                 new_stock = st.number_input("Stock Quantity", min_value=0, value=current_stock, step=1)
@@ -1922,13 +6032,13 @@ def edit_merge_products(stock_manager):
                                                 3 if current_supplier == "DRINKO" else 4)
             
             # Category selection
-            all_categories = sorted(list(set(stock_manager.product_categories.values())))
+            all_categories = stock_manager.get_assignable_categories()
             current_category = stock_manager.product_categories.get(product_to_edit, "Uncategorized")
             new_category = st.selectbox("Category", all_categories, index=all_categories.index(current_category) if current_category in all_categories else 0)
             
-            current_stores = [store for store in stock_manager.data if product_to_edit in stock_manager.data[store]]
+            current_stores = stock_manager.find_product_locations(product_to_edit)
             new_stores = st.multiselect("Available in Stores", 
-                                      list(stock_manager.data.keys()),
+                                      stock_manager.get_stores(),
                                       default=current_stores)
             
             if st.button("Update Product"):
@@ -1966,6 +6076,31 @@ def edit_merge_products(stock_manager):
                     st.rerun()
                 else:
                     st.error(f"❌ {message}")
+        
+        st.subheader("Suggested Merges")
+        st.caption("Near-duplicate names, most similar first. The more specific name is kept.")
+        if st.button("Find Duplicates"):
+            st.session_state.duplicate_candidates = stock_manager.find_duplicate_products()
+        candidates = [candidate for candidate in st.session_state.get('duplicate_candidates', [])
+                      if candidate[0] in stock_manager.registry.ids and candidate[1] in stock_manager.registry.ids]
+        if 'duplicate_candidates' in st.session_state and not candidates:
+            st.info("No near-duplicate products found.")
+        if candidates:
+            df = pd.DataFrame(candidates, columns=['Keep', 'Remove', 'Match'])
+            # Nothing is ticked up front: only pairs the admin confirms are merged
+            df.insert(0, 'Merge', False)
+            edited_df = st.data_editor(df, disabled=['Keep', 'Remove', 'Match'], hide_index=True,
+                                       column_config={'Match': st.column_config.NumberColumn(format="%.2f")},
+                                       key="duplicate_editor")
+            selected = edited_df[edited_df['Merge']]
+            if st.button(f"Merge {len(selected)} Selected", disabled=selected.empty):
+                success, message = stock_manager.merge_many(list(zip(selected['Keep'], selected['Remove'])))
+                if success:
+                    del st.session_state.duplicate_candidates
+                    st.success(f"✅ {message}")
+                    st.rerun()
+                else:
+                    st.error(f"❌ {message}")
     
     with tab3:
         st.subheader("Delete Product")
@@ -1975,7 +6110,7 @@ def edit_merge_products(stock_manager):
         
         if product_to_delete:
             # Show product details before deletion
-            current_price = stock_manager.product_prices.get(product_to_delete, stock_manager.estimate_price(product_to_delete))
+            current_price = stock_manager.resolve_price(product_to_delete)
             current_barcode = stock_manager.product_barcodes.get(product_to_delete, "No barcode")
             current_supplier = stock_manager.product_suppliers.get(product_to_delete, "PINNACLE FOODS (M) SDN BHD")
             current_category = stock_manager.product_categories.get(product_to_delete, "Uncategorized")
@@ -2021,27 +6156,11 @@ def manage_prices(stock_manager):
         with col2:
             # Make all products available in the selection
             products_to_update = st.multiselect("Select Products", stock_manager.all_products, 
-                                              default=stock_manager.all_products[:10] if len(stock_manager.all_products) > 10 else stock_manager.all_products)
+                                              default=stock_manager.all_products[:10])
         
         if st.button("Apply Bulk Price Change"):
             if products_to_update:
-                updated_count = 0
-                for product in products_to_update:
-                    current_price = stock_manager.product_prices.get(product, stock_manager.estimate_price(product))
-                    
-                    if price_change_type == "Percentage Increase":
-                        new_price = current_price * (1 + change_value / 100)
-                    elif price_change_type == "Percentage Decrease":
-                        new_price = current_price * (1 - change_value / 100)
-                    elif price_change_type == "Fixed Amount":
-                        new_price = current_price + change_value
-                    else:  # Set New Price
-                        new_price = change_value
-                    
-                    stock_manager.product_prices[product] = round(new_price, 2)
-                    updated_count += 1
-                
-                stock_manager.save_all_data()
+                updated_count = stock_manager.apply_price_change(products_to_update, price_change_type, change_value)
                 st.success(f"✅ Updated prices for {updated_count} products")
             else:
                 st.error("❌ Please select at least one product")
@@ -2050,19 +6169,21 @@ def manage_prices(stock_manager):
         st.subheader("Individual Price Editor")
         
         selected_product = st.selectbox("Select Product", stock_manager.all_products)
-        current_price = stock_manager.product_prices.get(selected_product, stock_manager.estimate_price(selected_product))
+        current_price = stock_manager.resolve_price(selected_product)
         new_price = st.number_input("New Price (RM)", min_value=0.0, value=float(current_price), step=0.1)
         
         if st.button("Update Price"):
-            stock_manager.product_prices[selected_product] = new_price
-            stock_manager.save_all_data()
+            with stock_manager.writing():
+                stock_manager.product_prices[selected_product] = new_price
+                stock_manager.mark_dirty('product_prices', selected_product)
+                stock_manager.save_data()
             st.success(f"✅ Price for '{selected_product}' updated to RM{new_price:.2f}")
     
     with tab3:
         st.subheader("Update Prices by Category")
         
         # Get all unique categories
-        all_categories = sorted(list(set(stock_manager.product_categories.values())))
+        all_categories = stock_manager.get_categories()
         
         col1, col2 = st.columns(2)
         with col1:
@@ -2077,11 +6198,10 @@ def manage_prices(stock_manager):
         
         with col2:
             # Show products in this category
-            category_products = [p for p in stock_manager.all_products if stock_manager.product_categories.get(p) == selected_category]
+            category_products = stock_manager.get_category_products(selected_category)
             st.write(f"**Products in {selected_category}:**")
             if category_products:
-                for product in category_products:
-                    current_price = stock_manager.product_prices.get(product, stock_manager.estimate_price(product))
+                for product, current_price in zip(category_products, stock_manager.resolve_prices(category_products)):
                     st.write(f"- {product}: RM{current_price:.2f}")
                 st.write(f"**Total products:** {len(category_products)}")
             else:
@@ -2089,23 +6209,7 @@ def manage_prices(stock_manager):
         
         if st.button("Apply Category Price Change"):
             if category_products:
-                updated_count = 0
-                for product in category_products:
-                    current_price = stock_manager.product_prices.get(product, stock_manager.estimate_price(product))
-                    
-                    if price_change_type == "Percentage Increase":
-                        new_price = current_price * (1 + change_value / 100)
-                    elif price_change_type == "Percentage Decrease":
-                        new_price = current_price * (1 - change_value / 100)
-                    elif price_change_type == "Fixed Amount":
-                        new_price = current_price + change_value
-                    else:  # Set New Price
-                        new_price = change_value
-                    
-                    stock_manager.product_prices[product] = round(new_price, 2)
-                    updated_count += 1
-                
-                stock_manager.save_all_data()
+                updated_count = stock_manager.apply_price_change(category_products, price_change_type, change_value)
                 st.success(f"✅ Updated prices for {updated_count} products in {selected_category} category")
             else:
                 st.error("❌ No products in selected category")
@@ -2116,31 +6220,25 @@ def manage_prices(stock_manager):
         # Search and filter
         search_term = st.text_input("🔍 Search products...", key="price_search")
         # Make all products available in the list
-        filtered_products = [p for p in stock_manager.all_products if search_term.lower() in p.lower()] if search_term else stock_manager.all_products
+        filtered_products = stock_manager.search_products(search_term) if search_term else stock_manager.all_products
         
         # Display prices in an editable format
-        price_data = []
-        for product in filtered_products[:50]:  # Show first 50 products
-            current_price = stock_manager.product_prices.get(product, stock_manager.estimate_price(product))
-            category = stock_manager.product_categories.get(product, "Uncategorized")
-            stock_quantity = stock_manager.get_stock_quantity(product)
-            price_data.append({
-                'Product': product,
-                'Category': category,
-                'Stock': stock_quantity,
-                'Current Price (RM)': current_price
-            })
-        
-        if price_data:
-            df = pd.DataFrame(price_data)
+        shown_products = filtered_products[:50]  # Show first 50 products
+        if shown_products:
+            df = stock_manager.catalog.to_frame(shown_products)
+            df['Price'] = stock_manager.resolve_prices(shown_products)
+            df['Category'] = df['Category'].astype(object).fillna("Uncategorized")
+            df['Stock'] = stock_manager.get_stock_quantities(shown_products)
+            df = df[['Product', 'Category', 'Stock', 'Price']].rename(columns={'Price': 'Current Price (RM)'})
             edited_df = st.data_editor(df, use_container_width=True, num_rows="dynamic")
             
             if st.button("Save All Price Changes"):
-                for index, row in edited_df.iterrows():
-                    product = row['Product']
-                    new_price = row['Current Price (RM)']
-                    stock_manager.product_prices[product] = new_price
-                stock_manager.save_all_data()
+                edited_df = edited_df[edited_df['Product'].notna() & edited_df['Current Price (RM)'].notna()]
+                products = edited_df['Product'].tolist()
+                with stock_manager.writing():
+                    stock_manager.catalog.assign('price', products, edited_df['Current Price (RM)'].to_numpy(dtype=float))
+                    stock_manager.mark_dirty('product_prices', *products)
+                    stock_manager.save_data()
                 st.success("✅ All price changes saved successfully!")
 
 def generate_po_document(stock_manager, products, quantities, prices, discounts, foc_quantities, 
@@ -2370,6 +6468,23 @@ def generate_po_document(stock_manager, products, quantities, prices, discounts,
     # Display the PO
     st.components.v1.html(po_html, height=800, scrolling=True)
 
+def prefill_po(stock_manager, products, quantities):
+    """Append products to the PO being built at their current prices; returns the number added
+    
+    Products already on the PO are left as they are.
+    """
+    po_products = set(st.session_state.po_products)
+    new_items = [(product, int(quantity)) for product, quantity in zip(products, quantities)
+                 if product not in po_products]
+    prices = stock_manager.resolve_prices([product for product, quantity in new_items])
+    for (product, quantity), price in zip(new_items, prices):
+        st.session_state.po_products.append(product)
+        st.session_state.po_quantities.append(quantity)
+        st.session_state.po_prices.append(float(price))
+        st.session_state.po_discounts.append(0.0)
+        st.session_state.po_foc_quantities.append(0)
+    return len(new_items)
+
 def generate_po(stock_manager):
     st.header("📋 Generate Purchase Order")
     
@@ -2394,16 +6509,34 @@ def generate_po(stock_manager):
             delivery_address = address_option.split(": ", 1)[1]
             st.success("✅ Store address selected")
     
+    # Suggested quantities, worked out only while the section is open
+    expander, expanded = lazy_expander("💡 Suggested Order", key="po_suggestions_expander")
+    with expander:
+        if expanded:
+            suggest_scope = st.selectbox("Suggest For", ["All Stores"] + stock_manager.get_stores(), key="po_suggest_scope")
+            suggestions = stock_manager.suggest_order(supplier, None if suggest_scope == "All Stores" else suggest_scope)
+            if suggestions.empty:
+                st.success(f"✅ No {supplier} products are at or below their reorder point")
+            else:
+                st.caption("Stores at or below their reorder point are topped up, less units on POs not yet "
+                           "delivered, rounded up to whole packs.")
+                st.dataframe(suggestions, hide_index=True, use_container_width=True)
+                if st.button(f"Add {len(suggestions)} Suggested Products to PO", key="apply_po_suggestions"):
+                    added = prefill_po(stock_manager, suggestions['Product'].tolist(), suggestions['Quantity'].tolist())
+                    st.success(f"✅ Added {added} products to PO")
+                    st.rerun()
+    
     # Store selection for outlet-wise products
     st.subheader("Select Store for Products")
-    selected_store = st.selectbox("Select Store", list(stock_manager.data.keys()))
+    selected_store = st.selectbox("Select Store", stock_manager.get_stores())
     
     if selected_store:
         # Get products available in the selected store
-        store_products = stock_manager.data.get(selected_store, [])
+        store_products = stock_manager.get_store_products(selected_store)
         
         # Filter out products already in PO
-        available_products = [p for p in store_products if p not in st.session_state.po_products]
+        po_products = set(st.session_state.po_products)
+        available_products = [p for p in store_products if p not in po_products]
         
         st.subheader("Add Products to PO")
         
@@ -2418,7 +6551,7 @@ def generate_po(stock_manager):
                     # Show current stock information
                     stock_count = stock_manager.get_stock_count(new_product)
                     stock_locations = stock_manager.find_product_locations(new_product)
-                    current_price = stock_manager.product_prices.get(new_product, stock_manager.estimate_price(new_product))
+                    current_price = stock_manager.resolve_price(new_product)
                     stock_status, status_class = stock_manager.get_stock_status(new_product)
                     
                     st.markdown(f'''
@@ -2439,7 +6572,7 @@ def generate_po(stock_manager):
         with col3:
             # Auto-populate price from product database
             if new_product:
-                default_price = stock_manager.product_prices.get(new_product, stock_manager.estimate_price(new_product))
+                default_price = stock_manager.resolve_price(new_product)
                 new_price = st.number_input("Unit Price (RM)", min_value=0.0, value=float(default_price), step=0.1, key="po_price_input")
             else:
                 new_price = st.number_input("Unit Price (RM)", min_value=0.0, value=0.0, step=0.1, key="po_price_input", disabled=True)
@@ -2604,15 +6737,68 @@ def generate_po(stock_manager):
     else:
         st.info("No products added to purchase order yet.")
 
+def lazy_expander(label, key):
+    """Open an expander and report whether it is expanded
+    
+    Streamlit versions without expander state always run the expander's body,
+    so there it is reported as open.
+    """
+    try:
+        expander = st.expander(label, key=key, on_change='rerun')
+    except TypeError:
+        return st.expander(label), True
+    return expander, expander.open
+
+def po_header_matches(header, query):
+    """Check whether a PO header matches a search query on number, supplier, creator or date"""
+    query = query.lower()
+    return any(query in str(header.get(field) or '').lower()
+               for field in ('po_number', 'supplier', 'created_by', 'timestamp'))
+
+def po_csv(po_store, po_number):
+    """Return a saved or archived PO's line items as CSV text"""
+    po_data = po_store.load(po_number) or {'items': []}
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Item', 'Product', 'Quantity', 'FOC Qty', 'Net Qty', 'Unit Price (RM)', 'Discount (RM)', 'Total (RM)'])
+    for i, item in enumerate(po_data['items'], 1):
+        net_qty = item.get('net_qty', item['quantity'] - item.get('foc_qty', 0))
+        writer.writerow([i, item['product'], item['quantity'], item.get('foc_qty', 0), net_qty,
+                         item['price'], item.get('discount', 0), item['total']])
+    return output.getvalue()
+
 def show_saved_pos(stock_manager):
     st.header("💾 Saved Purchase Orders")
     
-    if not stock_manager.saved_pos:
+    search = st.text_input("🔍 Search POs", placeholder="PO number, supplier, creator or date")
+    headers = stock_manager.purchase_orders.headers()
+    if search:
+        headers = {po_number: header for po_number, header in headers.items()
+                   if po_header_matches(header, search)}
+        # The archive index is only read when searching
+        for po_number, header in stock_manager.po_archive.search(search).items():
+            headers.setdefault(po_number, header)
+    elif os.path.exists(stock_manager.po_archive.path('index.json')):
+        st.caption("Older purchase orders are archived. Search to include them.")
+    
+    if not headers:
         st.info("No saved purchase orders found.")
         return
     
-    for po_number, po_data in sorted(stock_manager.saved_pos.items(), reverse=True):
-        with st.expander(f"📋 {po_number} - {po_data['timestamp'][:10]} - RM{po_data['total_amount']:.2f}"):
+    for po_number, header in sorted(headers.items(), reverse=True):
+        archived = header.get('archived', False)
+        expander, expanded = lazy_expander(
+            f"{'🗄️' if archived else '📋'} {po_number} - {(header['timestamp'] or '')[:10]} - RM{header['total_amount'] or 0:.2f}",
+            key=f"po_expander_{po_number}")
+        with expander:
+            if not expanded:
+                continue
+            # Line items are only read from disk, or the archive, once the PO is opened
+            po_store = stock_manager.po_archive if archived else stock_manager.purchase_orders
+            po_data = po_store.load(po_number)
+            if po_data is None:
+                st.warning(f"PO {po_number} is no longer available.")
+                continue
             col1, col2 = st.columns(2)
             with col1:
                 st.write(f"**Supplier:** {po_data['supplier']}")
@@ -2672,15 +6858,10 @@ def show_saved_pos(stock_manager):
                         po_data['po_number']
                     )
             with col2:
-                # Create CSV download
-                csv_data = "Item,Product,Quantity,FOC Qty,Net Qty,Unit Price (RM),Discount (RM),Total (RM)\n"
-                for i, item in enumerate(po_data['items']):
-                    net_qty = item.get('net_qty', item['quantity'] - item.get('foc_qty', 0))
-                    csv_data += f"{i+1},{item['product']},{item['quantity']},{item.get('foc_qty', 0)},{net_qty},{item['price']},{item.get('discount', 0)},{item['total']}\n"
-                
+                # The CSV is only built, from the PO's store or archive, when the button is clicked
                 st.download_button(
                     label=f"📥 Download {po_number}",
-                    data=csv_data,
+                    data=functools.partial(po_csv, po_store, po_number),
                     file_name=f"{po_number}.csv",
                     mime="text/csv",
                     key=f"download_{po_number}"
@@ -2688,8 +6869,7 @@ def show_saved_pos(stock_manager):
             with col3:
                 if st.session_state.users[st.session_state.user]['role'] == 'admin':
                     if st.button(f"🗑️ Delete {po_number}", key=f"delete_{po_number}"):
-                        del stock_manager.saved_pos[po_number]
-                        stock_manager.save_all_data()
+                        po_store.delete(po_number)
                         st.success(f"PO {po_number} deleted successfully!")
                         st.rerun()
 
@@ -2796,27 +6976,28 @@ def main():
     col1, col2 = st.sidebar.columns(2)
     with col1:
         if st.button("💾 Save Data", use_container_width=True):
-            stock_manager.save_all_data()
-            st.sidebar.success("✅ All data saved!")
+            bytes_written = stock_manager.save_all_data()
+            st.sidebar.success(f"✅ All data saved! ({bytes_written:,} bytes written)")
     with col2:
         if st.button("🔄 Reset Data", use_container_width=True):
             if st.sidebar.checkbox("Confirm reset"):
-                # Clear all data files
-                for file in ['store_data.json', 'product_prices.json', 'product_barcodes.json', 
-                           'product_suppliers.json', 'product_categories.json', 'product_stock.json', 'saved_pos.json', 'pending_changes.json']:
-                    try:
-                        if os.path.exists(file):
-                            os.remove(file)
-                    except:
-                        pass
+                # Clear all stored data
+                try:
+                    DataManager.storage().clear([name for name in DataManager.COLLECTIONS if name != 'store_addresses'])
+                    DataManager.po_store().clear()
+                    DataManager.po_archive().clear()
+                    DataManager.shared_store().reload()
+                except:
+                    pass
                 st.session_state.initialized = False
                 st.sidebar.success("✅ Data reset! Refresh the page.")
                 time.sleep(2)
                 st.rerun()
     
     # Show pending approval message for non-admin users
-    if user_role != 'admin' and stock_manager.pending_changes:
-        pending_count = len([c for c in stock_manager.pending_changes if c['requested_by'] == st.session_state.user])
+    pending_changes = stock_manager.get_pending_changes() if user_role != 'admin' else []
+    if pending_changes:
+        pending_count = len([c for c in pending_changes if c['requested_by'] == st.session_state.user])
         if pending_count > 0:
             st.markdown(f'<div class="pending-approval">⚠️ You have {pending_count} change(s) pending admin approval</div>', unsafe_allow_html=True)
     